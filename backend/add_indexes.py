@@ -20,11 +20,12 @@ def add_indexes():
                 
                 # Frequently queried columns
                 "CREATE INDEX IF NOT EXISTS idx_orders_created_at ON orders(created_at DESC)",
-                "CREATE INDEX IF NOT EXISTS idx_orders_purchase_order_number ON orders(purchase_order_number)",
-                "CREATE INDEX IF NOT EXISTS idx_orders_order_status ON orders(order_status)",
+                "CREATE UNIQUE INDEX IF NOT EXISTS idx_orders_po_normalized ON orders(po_normalized) WHERE order_status != 'Voided'",
+                "CREATE INDEX IF NOT EXISTS idx_orders_shipped_at ON orders(shipped_at)",
                 
                 # Composite indexes for common queries
                 "CREATE INDEX IF NOT EXISTS idx_order_items_order_product ON order_items(order_id, product_sku)",
+                "CREATE INDEX IF NOT EXISTS idx_orders_status_created_at ON orders(order_status, created_at DESC)",
                 
                 # ItemDetail and InventoryQuantity indexes
                 "CREATE INDEX IF NOT EXISTS idx_item_detail_product ON item_detail(product)",
@@ -0,0 +1,77 @@
+import os
+import gzip
+import hashlib
+
+from label_cache import UPLOAD_DIR
+
+# Content-addressed store for order attachments on the uploads volume
+ATTACHMENT_DIR = os.getenv('ATTACHMENT_DIR', os.path.join(UPLOAD_DIR, 'attachments'))
+# 'gzip' compresses new files at rest when it actually saves space; 'none' stores them as-is
+ATTACHMENT_COMPRESSION = os.getenv('ATTACHMENT_COMPRESSION', 'none')
+
+class AttachmentStore:
+    """Files stored once per SHA-256 of their content
+
+    A file with hash abcd... lives at <root>/ab/abcd..., or <root>/ab/abcd....gz
+    when compressed. Identical uploads share one file, and the database only
+    keeps the hash.
+    """
+
+    def __init__(self, root, compression='none'):
+        self.root = root
+        self.compression = compression
+
+    def _base_path(self, sha256):
+        return os.path.join(self.root, sha256[:2], sha256)
+
+    def put(self, data):
+        """Store bytes if not already present and return their SHA-256"""
+        sha256 = hashlib.sha256(data).hexdigest()
+        if self.locate(sha256):
+            return sha256
+
+        path = self._base_path(sha256)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        payload = data
+        if self.compression == 'gzip':
+            compressed = gzip.compress(data, mtime=0)
+            # PDFs and ZIPs are often compressed already; only keep real savings
+            if len(compressed) < len(data) * 0.9:
+                payload = compressed
+                path += '.gz'
+
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(payload)
+        os.replace(temp_path, path)
+        return sha256
+
+    def locate(self, sha256):
+        """Return (path, compressed) for a stored hash, or None if it is missing"""
+        path = self._base_path(sha256)
+        if os.path.exists(path):
+            return path, False
+        if os.path.exists(path + '.gz'):
+            return path + '.gz', True
+        return None
+
+    def read(self, sha256):
+        """Return the stored bytes for a hash, or None if it is missing"""
+        location = self.locate(sha256)
+        if not location:
+            return None
+        path, compressed = location
+        opener = gzip.open if compressed else open
+        with opener(path, 'rb') as f:
+            return f.read()
+
+    def iter_chunks(self, sha256, chunk_size=256 * 1024):
+        """Yield the stored (decompressed) content in chunks"""
+        path, compressed = self.locate(sha256)
+        opener = gzip.open if compressed else open
+        with opener(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                yield chunk
+
+attachment_store = AttachmentStore(ATTACHMENT_DIR, ATTACHMENT_COMPRESSION)
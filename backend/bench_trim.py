@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Benchmark parallel label trimming
+
+Builds a synthetic 50-page label PDF and times trim_pdf_margins with
+1..N worker processes. Requires poppler (pdftoppm) like the real pipeline.
+
+Usage: python bench_trim.py [--pages 50] [--max-workers N]
+"""
+
+import argparse
+import io
+import os
+import tempfile
+import time
+
+from PIL import Image, ImageDraw
+
+import shipping_label_creator
+from shipping_label_creator import trim_pdf_margins
+
+def make_label_page(index, dpi=150):
+    """Draw a 4x6 label offset on a letter-size white page"""
+    page = Image.new('RGB', (int(8.5 * dpi), int(11 * dpi)), 'white')
+    draw = ImageDraw.Draw(page)
+
+    left, top = int(0.75 * dpi), int(0.75 * dpi)
+    right, bottom = left + 4 * dpi, top + 6 * dpi
+    draw.rectangle([left, top, right, bottom], outline='black', width=4)
+    draw.text((left + 20, top + 20), f"GYM MOLLY LABEL {index + 1:03d}", fill='black')
+
+    # Barcode-like stripes so the page isn't trivially compressible
+    x = left + 20
+    for bar in range(60):
+        bar_width = 2 + (bar * 7 + index) % 5
+        draw.rectangle([x, top + 2 * dpi, x + bar_width, top + 3 * dpi], fill='black')
+        x += bar_width + 3
+    return page
+
+def make_label_pdf(pages):
+    """Return the bytes of a synthetic multi-page label PDF"""
+    images = [make_label_page(i) for i in range(pages)]
+    buffer = io.BytesIO()
+    images[0].save(buffer, format='PDF', resolution=150, save_all=True, append_images=images[1:])
+    return buffer.getvalue()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--pages', type=int, default=50)
+    parser.add_argument('--max-workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--raster', action='store_true',
+                        help='rasterize every page instead of cropping vector pages in place')
+    args = parser.parse_args()
+
+    # Always take the pool path when more than one worker is requested
+    shipping_label_creator.TRIM_PARALLEL_MIN_PAGES = 1
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        input_pdf = os.path.join(temp_dir, 'labels.pdf')
+        output_pdf = os.path.join(temp_dir, 'labels_trimmed.pdf')
+        with open(input_pdf, 'wb') as f:
+            f.write(make_label_pdf(args.pages))
+
+        results = []
+        for workers in range(1, args.max_workers + 1):
+            start = time.perf_counter()
+            trim_pdf_margins(input_pdf, output_pdf, workers=workers,
+                             vector_pages=() if args.raster else None)
+            results.append((workers, time.perf_counter() - start))
+
+    baseline = results[0][1]
+    print(f"\nTrim benchmark: {args.pages} pages ({'raster' if args.raster else shipping_label_creator.TRIM_MODE} mode)")
+    print(f"{'workers':>8} {'seconds':>10} {'speedup':>8}")
+    for workers, elapsed in results:
+        print(f"{workers:>8} {elapsed:>10.2f} {baseline / elapsed:>7.2f}x")
+
+if __name__ == "__main__":
+    main()
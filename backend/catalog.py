@@ -0,0 +1,111 @@
+import os
+import threading
+import time
+
+# How often a worker asks the database whether another worker changed the catalog
+CATALOG_VERSION_CHECK_SECONDS = float(os.getenv('CATALOG_VERSION_CHECK_SECONDS', '2'))
+
+class CatalogItem:
+    """Product and shipping details for one SKU"""
+    __slots__ = ('sku', 'product', 'size', 'flavor', 'unitsCs', 'length', 'width', 'height', 'weight')
+
+    def __init__(self, sku, product, size, flavor, unitsCs, length=None, width=None, height=None, weight=None):
+        self.sku = sku
+        self.product = product
+        self.size = size
+        self.flavor = flavor
+        self.unitsCs = unitsCs
+        self.length = length
+        self.width = width
+        self.height = height
+        self.weight = weight
+
+    @property
+    def has_shipping(self):
+        """True when the SKU has a shipping_detail row"""
+        return self.weight is not None
+
+    def to_dict(self):
+        return {
+            'sku': self.sku,
+            'product': self.product,
+            'size': self.size,
+            'flavor': self.flavor,
+            'unitsCs': self.unitsCs
+        }
+
+    def shipping_dict(self):
+        return {
+            'length': self.length,
+            'width': self.width,
+            'height': self.height,
+            'weight': self.weight
+        }
+
+class CatalogSnapshot:
+    """Immutable view of the whole catalog at one version, in display order"""
+    __slots__ = ('version', 'items')
+
+    def __init__(self, version, items):
+        self.version = version
+        self.items = {item.sku: item for item in items}
+
+    def get(self, sku):
+        return self.items.get(sku)
+
+    def __contains__(self, sku):
+        return sku in self.items
+
+    def __iter__(self):
+        return iter(self.items.values())
+
+    def __len__(self):
+        return len(self.items)
+
+class Catalog:
+    """Per-process catalog snapshot, reloaded when the catalog version changes
+
+    load_items() returns CatalogItems in display order and read_version()
+    returns the version counter shared by every worker. The writing process
+    calls invalidate() after committing; other workers notice the new
+    version within check_interval seconds.
+    """
+
+    def __init__(self, load_items, read_version, check_interval=CATALOG_VERSION_CHECK_SECONDS):
+        self._load_items = load_items
+        self._read_version = read_version
+        self.check_interval = check_interval
+        self._snapshot = None
+        self._next_check = 0
+        self._lock = threading.Lock()
+        self.loads = 0
+
+    def snapshot(self, version=None):
+        """Return the current snapshot, reloading it if it is missing or stale
+
+        Callers that have just read the catalog version pass it in; that skips
+        the throttled check and guarantees a snapshot at least that new.
+        """
+        snapshot = self._snapshot
+        if snapshot is not None:
+            if version is None and time.monotonic() < self._next_check:
+                return snapshot
+            if version is not None and snapshot.version >= version:
+                return snapshot
+
+        with self._lock:
+            if version is None:
+                version = self._read_version()
+                self._next_check = time.monotonic() + self.check_interval
+            if self._snapshot is None or self._snapshot.version != version:
+                self._snapshot = CatalogSnapshot(version, self._load_items())
+                self.loads += 1
+            return self._snapshot
+
+    def get(self, sku):
+        return self.snapshot().get(sku)
+
+    def invalidate(self):
+        """Drop the snapshot so the next reader reloads it"""
+        with self._lock:
+            self._snapshot = None
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Exercise the ShipStation outbox against a local stub server
+
+Starts a stub createorders endpoint on localhost, points SS_BASE_URL at it
+and places orders through the Flask test client against a throwaway SQLite
+database, draining the outbox after each scenario. The stub's behaviour
+depends on the PO number prefix:
+
+    OK-     accepted at once
+    FLAKY-  503 twice, then accepted
+    SLOW-   first call outlives the read timeout, then accepted
+    BAD-    rejected in the results (dead-lettered on the first attempt)
+    DOWN-   always 503 (dead-lettered after the last retry)
+
+A final batch of BATCH- orders, with every tenth one rejected, checks that
+they go out in full createorders calls and that each result (returned
+shuffled) lands on the right entry. It also checks that order requests
+return without waiting on the stub and that retries reuse the orderKey.
+
+Usage: python check_shipstation_outbox.py [--batch 250]
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+EXPECTED = {'OK': ('sent', 1), 'FLAKY': ('sent', 3), 'SLOW': ('sent', 2), 'BAD': ('dead', 1), 'DOWN': ('dead', 4)}
+
+class StubShipStation(BaseHTTPRequestHandler):
+    calls = defaultdict(int)
+    order_keys = defaultdict(set)
+    assigned = {}  # orderKey -> ShipStation orderId
+    lock = threading.Lock()
+
+    def do_POST(self):
+        if self.path != '/orders/createorders':
+            return self.reply(404, {'Message': 'Not found'})
+        orders = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        kinds = {order['orderNumber'].split('-')[0] for order in orders}
+        with self.lock:
+            for kind in kinds:
+                self.calls[kind] += 1
+            for order in orders:
+                self.order_keys[order['orderNumber'].split('-')[0]].add(order.get('orderKey'))
+            calls = dict(self.calls)
+
+        if 'SLOW' in kinds and calls['SLOW'] == 1:
+            time.sleep(3)
+        if 'DOWN' in kinds or ('FLAKY' in kinds and calls['FLAKY'] <= 2):
+            return self.reply(503, {'Message': 'Service unavailable'})
+
+        results = []
+        for order in orders:
+            rejected = order['orderNumber'].startswith('BAD-') or order['orderNumber'].endswith('0')
+            with self.lock:
+                order_id = None if rejected else self.assigned.setdefault(order['orderKey'], 1000 + len(self.assigned))
+            results.append({'orderId': order_id, 'orderNumber': order['orderNumber'], 'orderKey': order['orderKey'],
+                            'success': not rejected, 'errorMessage': 'Invalid ship to address' if rejected else None})
+        random.shuffle(results)
+        self.reply(200, {'hasErrors': any(not r['success'] for r in results), 'results': results})
+
+    def reply(self, status, body):
+        data = json.dumps(body).encode()
+        try:
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client already gave up (read timeout)
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+def place_order(client, po):
+    """Place a one-line order and return how long the request took"""
+    payload = {
+        'purchase_order_number': po,
+        'shipping_address_id': 1,
+        'shipping_method': 'FedEx Ground',
+        'items': [{'product_sku': 'GYMBCAABR30-cs', 'quantity': 1}]
+    }
+    began = time.perf_counter()
+    response = client.post('/api/orders', data={'data': json.dumps(payload)},
+                           content_type='multipart/form-data')
+    if response.status_code != 201:
+        raise SystemExit(f"Order {po} failed: {response.get_json()}")
+    return time.perf_counter() - began
+
+def drain(app_main, timeout=60):
+    """Run the outbox drain until nothing is pending, sleeping out backoffs"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        wait = app_main.drain_shipstation_outbox()
+        if wait is None:
+            return
+        time.sleep(wait)
+    raise SystemExit("Outbox did not drain in time")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--batch', type=int, default=250, help='orders in the createorders batch scenario')
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubShipStation)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    temp_dir = tempfile.mkdtemp(prefix='check_outbox_')
+    os.environ.update({
+        'DATABASE_URL': f"sqlite:///{os.path.join(temp_dir, 'outbox.db')}",
+        'UPLOAD_DIR': os.path.join(temp_dir, 'uploads'),
+        'SS_BASE_URL': f"http://127.0.0.1:{server.server_port}",
+        'SS_CLIENT_ID': 'stub',
+        'SS_CLIENT_SECRET': 'stub',
+        'SHIPSTATION_READ_TIMEOUT': '1',
+        # The client's own retries would hide the outbox's; one stub call per attempt
+        'SHIPSTATION_MAX_RETRIES': '0',
+        'SHIPSTATION_OUTBOX_BACKOFF_SECONDS': '0.2',
+        'SHIPSTATION_OUTBOX_MAX_ATTEMPTS': '4',
+        # The script drains the outbox itself, one scenario at a time
+        'SHIPSTATION_OUTBOX_WORKER': 'off',
+        'EMAIL_OUTBOX_WORKER': 'off',
+    })
+
+    try:
+        import main as app_main
+        import init_db
+        from shipstationcreate import shipstation_order_key
+        with app_main.app.app_context():
+            app_main.db.drop_all()
+            app_main.init_database()
+            init_db.add_sample_data()
+            app_main.db.session.get(app_main.InventoryQuantity, 'GYMBCAABR30-cs').quantity = args.batch + 100
+            app_main.db.session.commit()
+
+        client = app_main.app.test_client()
+        with client.session_transaction() as session:
+            session['authenticated'] = True
+
+        latencies = []
+        for kind in EXPECTED:
+            latencies.append(place_order(client, f"{kind}-1"))
+            drain(app_main)
+
+        for n in range(1, args.batch + 1):
+            latencies.append(place_order(client, f"BATCH-{n}"))
+        batch_began = time.perf_counter()
+        drain(app_main)
+        batch_elapsed = time.perf_counter() - batch_began
+
+        with app_main.app.app_context():
+            rows = app_main.db.session.query(app_main.Order.purchase_order_number, app_main.ShipStationOutbox)\
+                .join(app_main.ShipStationOutbox, app_main.ShipStationOutbox.order_id == app_main.Order.order_id).all()
+            outcomes = {po.split('-')[0]: (entry.status, entry.attempts, entry.last_error)
+                        for po, entry in rows if not po.startswith('BATCH-')}
+            batch = {po: entry.to_dict() for po, entry in rows if po.startswith('BATCH-')}
+            order_keys = {po: shipstation_order_key(entry.order_id) for po, entry in rows}
+
+        print(f"\nSlowest order request: {max(latencies) * 1000:.0f} ms")
+        print(f"{'order':>6} {'status':>8} {'attempts':>9} {'calls':>6}  result")
+        failures = 0
+        for kind, (status, attempts) in EXPECTED.items():
+            actual_status, actual_attempts, last_error = outcomes.get(kind, ('missing', 0, None))
+            ok = (actual_status, actual_attempts) == (status, attempts) and len(StubShipStation.order_keys[kind]) == 1
+            failures += not ok
+            print(f"{kind:>6} {actual_status:>8} {actual_attempts:>9} {StubShipStation.calls[kind]:>6}  "
+                  f"{'ok' if ok else f'expected {status} after {attempts}'}"
+                  f"{f'  ({last_error[:60]})' if last_error else ''}")
+
+        mismatched = 0
+        for po, entry in batch.items():
+            rejected = po.endswith('0')
+            expected_id = StubShipStation.assigned.get(order_keys[po])
+            if rejected:
+                mismatched += (entry['status'], entry['attempts']) != ('dead', 1)
+            else:
+                mismatched += (entry['status'], entry['attempts'], entry['shipstation_order_id']) != \
+                    ('sent', 1, str(expected_id))
+        expected_calls = math.ceil(args.batch / app_main.SHIPSTATION_CREATE_BATCH_SIZE)
+        batch_ok = not mismatched and StubShipStation.calls['BATCH'] == expected_calls
+        failures += not batch_ok
+        print(f"\nBatch: {args.batch} orders in {StubShipStation.calls['BATCH']} createorders calls "
+              f"(expected {expected_calls}) and {batch_elapsed:.2f}s, {mismatched} entries wrong  "
+              f"{'ok' if batch_ok else 'FAILED'}")
+    finally:
+        server.shutdown()
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    if failures:
+        raise SystemExit(f"{failures} outbox scenarios did not behave as expected")
+
+if __name__ == "__main__":
+    main()
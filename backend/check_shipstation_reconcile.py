@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Exercise the ShipStation reconciler against a local stub of GET /orders
+
+Fills a throwaway SQLite database with Processing orders plus a few voided
+ones, then serves shipped ShipStation orders for most of them (and for POs
+this store never saw) from a stub, paginated the way ShipStation pages
+/orders. It runs the reconciler twice and checks that:
+
+    every matched Processing order is Shipped with the stub's ship date
+    voided orders are left alone
+    the watermark ends at the newest modifyDate
+    the SQL statement count grows with pages, not with orders
+    the second run changes nothing
+
+Usage: python check_shipstation_reconcile.py [--orders 5000]
+"""
+
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+class StubShipStation(BaseHTTPRequestHandler):
+    shipped = []  # ShipStation orders, sorted by modifyDate
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        if url.path != '/orders' or params.get('orderStatus') != 'shipped':
+            return self.reply(404, {'Message': 'Not found'})
+
+        since = params['modifyDateStart']
+        matching = [order for order in self.shipped if order['modifyDate'] >= since.replace(' ', 'T')]
+        page = int(params.get('page', 1))
+        page_size = int(params.get('pageSize', 100))
+        pages = max((len(matching) + page_size - 1) // page_size, 1)
+        self.reply(200, {
+            'orders': matching[(page - 1) * page_size:page * page_size],
+            'total': len(matching),
+            'page': page,
+            'pages': pages
+        })
+
+    def reply(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+def seed_orders(app_main, count):
+    """Insert count Processing orders and return {po: order_id}"""
+    from sqlalchemy import insert
+    created_at = datetime.utcnow() - timedelta(days=3)
+    rows = [{
+        'purchase_order_number': f"REC-{n:06d}",
+        'shipping_address_id': 1,
+        'shipping_method': 'FedEx Ground',
+        'order_status': app_main.ORDER_PROCESSING,
+        'created_at': created_at
+    } for n in range(count)]
+    app_main.db.session.execute(insert(app_main.Order), rows)
+    app_main.db.session.commit()
+    return dict(app_main.db.session.query(app_main.Order.purchase_order_number, app_main.Order.order_id)
+                .filter(app_main.Order.purchase_order_number.like('REC-%')).all())
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--orders', type=int, default=5000, help='local Processing orders')
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubShipStation)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    temp_dir = tempfile.mkdtemp(prefix='check_reconcile_')
+    os.environ.update({
+        'DATABASE_URL': f"sqlite:///{os.path.join(temp_dir, 'reconcile.db')}",
+        'UPLOAD_DIR': os.path.join(temp_dir, 'uploads'),
+        'SS_BASE_URL': f"http://127.0.0.1:{server.server_port}",
+        'SS_CLIENT_ID': 'stub',
+        'SS_CLIENT_SECRET': 'stub',
+        'SHIPSTATION_OUTBOX_WORKER': 'off',
+    })
+
+    failures = []
+    try:
+        import main as app_main
+        import init_db
+        from sqlalchemy import event
+        with app_main.app.app_context():
+            app_main.db.drop_all()
+            app_main.init_database()
+            init_db.add_sample_data()
+            order_ids = seed_orders(app_main, args.orders)
+
+            # Nine in ten local orders shipped, a few voided locally first, plus foreign POs
+            base = datetime(2025, 7, 1, 8, 0, 0)
+            voided = {f"REC-{n:06d}" for n in range(0, args.orders, 97)}
+            app_main.set_orders_status([order_ids[po] for po in voided], app_main.ORDER_VOIDED, 'void')
+            app_main.db.session.commit()
+            expected = {}
+            shipped = []
+            for n in range(args.orders):
+                if n % 10 == 9:
+                    continue
+                po = f"REC-{n:06d}"
+                ship_date = (base + timedelta(days=n % 5)).date()
+                shipped.append({'orderNumber': po, 'orderStatus': 'shipped', 'shipDate': ship_date.isoformat(),
+                                'modifyDate': (base + timedelta(seconds=n)).isoformat() + '.0000000'})
+                if po not in voided:
+                    expected[po] = datetime.combine(ship_date, datetime.min.time())
+            for n in range(args.orders // 10):
+                shipped.append({'orderNumber': f"OTHER-{n}", 'orderStatus': 'shipped', 'shipDate': '2025-07-02',
+                                'modifyDate': (base + timedelta(seconds=args.orders + n)).isoformat() + '.0000000'})
+            shipped.sort(key=lambda order: order['modifyDate'])
+            StubShipStation.shipped = shipped
+
+            statements = []
+            event.listen(app_main.db.engine, 'before_cursor_execute',
+                         lambda conn, cursor, statement, *rest: statements.append(statement))
+
+            state = app_main.db.session.get(app_main.SyncWatermark, app_main.SHIPSTATION_RECONCILE)
+            state.watermark = base
+            app_main.db.session.commit()
+            statements.clear()
+
+            began = time.perf_counter()
+            first = app_main.reconcile_shipstation_orders()
+            elapsed = time.perf_counter() - began
+            first_statements = len(statements)
+            statements.clear()
+            second = app_main.reconcile_shipstation_orders()
+
+            rows = app_main.db.session.query(app_main.Order.purchase_order_number, app_main.Order.order_status,
+                                             app_main.Order.shipped_at)\
+                .filter(app_main.Order.purchase_order_number.like('REC-%')).all()
+            watermark = app_main.db.session.get(app_main.SyncWatermark, app_main.SHIPSTATION_RECONCILE).watermark
+
+        for po, status, shipped_at in rows:
+            if po in expected and (status, shipped_at) != (app_main.ORDER_SHIPPED, expected[po]):
+                failures.append(f"{po} is {status} {shipped_at}, expected shipped {expected[po]}")
+            elif po in voided and status != app_main.ORDER_VOIDED:
+                failures.append(f"voided {po} became {status}")
+            elif po not in expected and po not in voided and status != app_main.ORDER_PROCESSING:
+                failures.append(f"unshipped {po} became {status}")
+        newest = datetime.fromisoformat(shipped[-1]['modifyDate'][:26])
+        if watermark != newest:
+            failures.append(f"watermark {watermark}, expected {newest}")
+        if first['updated'] != len(expected):
+            failures.append(f"first run updated {first['updated']}, expected {len(expected)}")
+        if second['updated']:
+            failures.append(f"second run updated {second['updated']} orders")
+        if first_statements > first['pages'] * 10 + 10:
+            failures.append(f"{first_statements} statements for {first['pages']} pages")
+
+        print(f"\nReconciled {first['shipments']} ShipStation orders in {first['pages']} pages "
+              f"and {elapsed:.2f}s: {first['updated']} updated, {first['unmatched']} unmatched, "
+              f"{first_statements} SQL statements")
+        print(f"Second run: {second['shipments']} re-read, {second['updated']} updated")
+    finally:
+        server.shutdown()
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    for failure in failures[:20]:
+        print(f"FAIL {failure}")
+    if failures:
+        raise SystemExit(f"{len(failures)} reconciliation checks failed")
+    print("ok")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Check that importing main brings an existing database up to date
+
+Builds a throwaway SQLite database with sample orders, then strips what
+init_database() is responsible for: order summaries, the sync watermark,
+the inventory ledger, the normalized PO column, the indexes and WAL mode.
+Two live orders are also given the same PO, as legacy data may have.
+A fresh process then imports main, the way gunicorn starts the app, and
+the script checks that:
+
+    every order has a summary and GET /api/orders lists them all
+    the reconciler's watermark row exists and its endpoint answers
+    every SKU has an opening ledger movement and nothing reports drift
+    the indexes are back and the database is in WAL mode
+    the PO index is not unique while the duplicate is live
+
+The duplicate is then voided and a second import must make the PO index
+unique.
+
+Each stage runs in its own process so the import-time init_database() is
+the only thing that can repair the database.
+
+Usage: python check_startup.py
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+
+INDEXES = ('idx_orders_po_normalized', 'idx_orders_status_created_at', 'idx_order_summaries_created_at',
+           'idx_shipstation_outbox_due', 'idx_email_outbox_due')
+
+def prepare():
+    """Create the database with sample data through the current code"""
+    import main
+    import init_db
+    with main.app.app_context():
+        main.db.drop_all()
+        main.init_database()
+        init_db.add_sample_data()
+
+def strip(db_path):
+    """Take away everything init_database() should put back"""
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=DELETE")
+    for table in ('order_summaries', 'sync_watermarks', 'inventory_movements'):
+        conn.execute(f"DELETE FROM {table}")
+    for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND name LIKE 'idx_%'").fetchall():
+        conn.execute(f"DROP INDEX {name}")
+    conn.execute("ALTER TABLE orders DROP COLUMN po_normalized")
+    conn.execute("UPDATE orders SET purchase_order_number = (SELECT purchase_order_number FROM orders "
+                 "ORDER BY order_id LIMIT 1) WHERE order_id = (SELECT MAX(order_id) FROM orders)")
+    conn.commit()
+    conn.close()
+
+def verify():
+    """Import main and report what the import-time init left behind"""
+    import main
+    client = main.app.test_client()
+    with client.session_transaction() as session:
+        session['authenticated'] = True
+
+    with main.app.app_context():
+        db = main.db
+        report = {
+            'orders': db.session.query(main.Order).count(),
+            'summaries': db.session.query(main.OrderSummary).count(),
+            'unnormalized': db.session.query(main.Order).filter(main.Order.po_normalized.is_(None)).count(),
+            'watermark': db.session.get(main.SyncWatermark, main.SHIPSTATION_RECONCILE) is not None,
+            'skus_without_ledger': db.session.query(main.InventoryQuantity).filter(
+                ~db.session.query(main.InventoryMovement.id)
+                .filter(main.InventoryMovement.sku == main.InventoryQuantity.sku).exists()).count(),
+        }
+    report['listed'] = len(client.get('/api/orders').get_json() or [])
+    report['reconcile_status'] = client.get('/api/shipstation/reconcile').status_code
+    report['drifted'] = len(client.get('/api/inventory/reconcile').get_json().get('mismatches', []))
+
+    conn = sqlite3.connect(main.app.config['SQLALCHEMY_DATABASE_URI'].replace('sqlite:///', '', 1))
+    present = {name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    report['missing_indexes'] = [name for name in INDEXES if name not in present]
+    report['journal_mode'] = conn.execute("PRAGMA journal_mode").fetchone()[0]
+    po_index = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'idx_orders_po_normalized'").fetchone()
+    report['po_index_unique'] = bool(po_index) and 'UNIQUE' in po_index[0].upper()
+    conn.close()
+    print('REPORT ' + json.dumps(report))
+
+def void_duplicate(db_path):
+    """Void the order strip() gave a duplicate PO, as an admin would"""
+    conn = sqlite3.connect(db_path)
+    conn.execute("UPDATE orders SET order_status = 'Voided' WHERE order_id = (SELECT MAX(order_id) FROM orders)")
+    conn.commit()
+    conn.close()
+
+def run_stage(stage, env):
+    result = subprocess.run([sys.executable, os.path.abspath(__file__), '--stage', stage], env=env,
+                            cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True)
+    if result.returncode != 0:
+        print(result.stdout[-2000:], result.stderr[-2000:])
+        raise SystemExit(f"Stage {stage} failed")
+    return result.stdout
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--stage', choices=['prepare', 'verify'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.stage == 'prepare':
+        return prepare()
+    if args.stage == 'verify':
+        return verify()
+
+    temp_dir = tempfile.mkdtemp(prefix='check_startup_')
+    db_path = os.path.join(temp_dir, 'startup.db')
+    env = dict(os.environ,
+               DATABASE_URL=f"sqlite:///{db_path}",
+               UPLOAD_DIR=os.path.join(temp_dir, 'uploads'),
+               SHIPSTATION_OUTBOX_WORKER='off',
+               EMAIL_OUTBOX_WORKER='off')
+    try:
+        run_stage('prepare', env)
+        strip(db_path)
+        output = run_stage('verify', env)
+        void_duplicate(db_path)
+        rerun = json.loads(run_stage('verify', env).split('REPORT ', 1)[1].splitlines()[0])
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    if 'initialization attempt' in output:
+        print(output[output.index('initialization attempt') - 40:][:500])
+    report = json.loads(output.split('REPORT ', 1)[1].splitlines()[0])
+    failures = []
+    if not report['orders']:
+        failures.append("no sample orders")
+    if report['summaries'] != report['orders'] or report['listed'] != report['orders']:
+        failures.append(f"{report['orders']} orders but {report['summaries']} summaries and {report['listed']} listed")
+    if report['unnormalized']:
+        failures.append(f"{report['unnormalized']} orders without a normalized PO")
+    if not report['watermark'] or report['reconcile_status'] != 200:
+        failures.append(f"reconcile watermark missing (GET /api/shipstation/reconcile: {report['reconcile_status']})")
+    if report['skus_without_ledger'] or report['drifted']:
+        failures.append(f"{report['skus_without_ledger']} SKUs without a ledger, {report['drifted']} drifted")
+    if report['missing_indexes']:
+        failures.append(f"indexes missing: {report['missing_indexes']}")
+    if report['journal_mode'] != 'wal':
+        failures.append(f"journal mode {report['journal_mode']}")
+    if report['po_index_unique']:
+        failures.append("PO index is unique although two live orders share a PO")
+    if not rerun['po_index_unique']:
+        failures.append("PO index still not unique after the duplicate was voided")
+
+    print(f"\nStartup on an existing database: {json.dumps(report)}")
+    for failure in failures:
+        print(f"FAIL {failure}")
+    if failures:
+        raise SystemExit(f"{len(failures)} startup checks failed")
+    print("ok")
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
-from main import app, db, ItemDetail, InventoryQuantity, ShippingDetail, ShippingAddress, Order, OrderItem
+from main import app, db, ItemDetail, InventoryQuantity, ShippingDetail, ShippingAddress, Order, OrderItem, backfill_order_summaries, open_inventory_ledger
 from sqlalchemy import text
 from datetime import datetime, timedelta, timezone
 UTC = timezone.utc
@@ -317,6 +317,10 @@ def add_sample_data():
             db.session.add(new_order_item)
 
         db.session.commit()
+
+        # Build the list-view summaries for the sample orders
+        backfill_order_summaries()
+        open_inventory_ledger()
         print("Sample data including orders and order items added successfully")
     except Exception as e:
         print(f"Error adding sample data: {e}")
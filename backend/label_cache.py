@@ -0,0 +1,154 @@
+import os
+import hashlib
+import threading
+import json
+
+# Cache lives on the uploads volume so it survives container restarts;
+# outside Docker fall back to backend/uploads
+UPLOAD_DIR = os.getenv('UPLOAD_DIR', '/app/uploads' if os.path.isdir('/app/uploads')
+                       else os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads'))
+LABEL_CACHE_DIR = os.getenv('LABEL_CACHE_DIR', os.path.join(UPLOAD_DIR, 'label_cache'))
+LABEL_CACHE_MAX_BYTES = int(os.getenv('LABEL_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+
+def label_cache_key(files, params):
+    """Hash uploaded label files plus the pipeline parameters into a cache key
+
+    files is a list of (filename, data) pairs where data is bytes or a seekable
+    binary file-like object. Only the extension of each filename is hashed,
+    since that is all the pipeline looks at.
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps(params, sort_keys=True).encode())
+    for name, data in files:
+        digest.update(os.path.splitext(name)[1].lower().encode() + b'\0')
+        if isinstance(data, (bytes, bytearray)):
+            digest.update(data)
+            digest.update(len(data).to_bytes(8, 'big'))
+        else:
+            # Stream file-like uploads so large files aren't read into memory twice
+            data.seek(0)
+            size = 0
+            for chunk in iter(lambda: data.read(1024 * 1024), b''):
+                digest.update(chunk)
+                size += len(chunk)
+            digest.update(size.to_bytes(8, 'big'))
+            data.seek(0)
+    return digest.hexdigest()
+
+class LabelCache:
+    """Size-bounded on-disk LRU cache of processed label PDFs keyed by content hash
+
+    Each entry is a single file; its mtime is bumped on every hit and the
+    least recently used entries are evicted once the directory grows past
+    max_bytes. Writes go through a temp file and os.replace so concurrent
+    gunicorn workers never see a partial entry.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self.enabled = max_bytes > 0
+        if self.enabled:
+            try:
+                os.makedirs(directory, exist_ok=True)
+            except OSError as e:
+                print(f"Label cache disabled: {e}")
+                self.enabled = False
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.pdf")
+
+    def get(self, key):
+        """Return cached PDF bytes for key, or None on a miss"""
+        if not self.enabled:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            # Mark as recently used
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return data
+
+    def put(self, key, data):
+        """Store PDF bytes under key and evict old entries if over budget"""
+        if not self.enabled or len(data) > self.max_bytes:
+            return
+        path = self._path(key)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except OSError as e:
+            print(f"Could not write label cache entry: {e}")
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            return
+        self.evict()
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits in max_bytes"""
+        entries = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith('.pdf'):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                with self._lock:
+                    self.evictions += 1
+            except FileNotFoundError:
+                # Another worker already evicted it
+                total -= size
+
+    def stats(self):
+        """Hit/miss counters for this process plus the current on-disk size"""
+        entries = 0
+        size = 0
+        if self.enabled:
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith('.pdf'):
+                    try:
+                        size += entry.stat().st_size
+                        entries += 1
+                    except OSError:
+                        pass
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'enabled': self.enabled,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else None,
+                'entries': entries,
+                'size_bytes': size,
+                'max_bytes': self.max_bytes
+            }
+
+label_cache = LabelCache(LABEL_CACHE_DIR, LABEL_CACHE_MAX_BYTES)
@@ -1,9 +1,9 @@
 import requests
-import base64
 import os
 from dotenv import load_dotenv
 from pathlib import Path
 import json
+from shipstation_client import ShipStationClient
 
 # Get the absolute path to the .env file
 base_dir = Path(__file__).resolve().parent
@@ -27,28 +27,13 @@ def list_webhooks():
         print(f"Client Secret: {'Present' if SS_CLIENT_SECRET else 'Missing'}")
         return
 
-    # Create the authorization string
-    auth_string = f"{SS_CLIENT_ID}:{SS_CLIENT_SECRET}"
-    encoded_auth = base64.b64encode(auth_string.encode()).decode()
-    
-    # Print debug info (remove sensitive info in production)
-    print(f"\nDebug Info:")
-    print(f"Auth String (first 10 chars): {auth_string[:10]}...")
-    print(f"Encoded Auth (first 20 chars): {encoded_auth[:20]}...")
-    
-    # API endpoint
-    url = "https://ssapi.shipstation.com/webhooks"
-    
-    # Headers with authentication
-    headers = {
-        'Host': 'ssapi.shipstation.com',
-        'Authorization': f'Basic {encoded_auth}'
-    }
+    client = ShipStationClient(os.getenv('SS_BASE_URL', 'https://ssapi.shipstation.com'),
+                               SS_CLIENT_ID, SS_CLIENT_SECRET)
     
     try:
         # Make the request
         print("\nMaking request to ShipStation API...")
-        response = requests.get(url, headers=headers)
+        response = client.get('/webhooks')
         
         # Check if request was successful
         if response.status_code == 200:
@@ -73,12 +58,10 @@ def list_webhooks():
             else:
                 print("Raw response:")
                 print(json.dumps(webhooks, indent=2))
-        else:
-            print(f"\nError: {response.status_code}")
-            print(f"Response: {response.text}")
-            print("\nRequest Headers:")
-            print(headers)
             
+    except requests.exceptions.HTTPError as e:
+        print(f"\nError: {e.response.status_code}")
+        print(f"Response: {e.response.text}")
     except Exception as e:
         print(f"Error occurred: {str(e)}")
         print("Full error details:")
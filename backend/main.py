@@ -5,13 +5,15 @@ import requests
 import json
 import traceback
 import base64
-from base64 import b64encode
 import logging
 from pathlib import Path
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 import io
-import tempfile
 import zipfile
+import hashlib
+import hmac
+import random
+import re
 from functools import wraps
 
 # Load environment variables ONCE
@@ -51,8 +53,15 @@ from flask_cors import CORS
 from flask_session import Session
 from sendemail import send_order_confirmation_email
 from config import app, db
-from shipstationcreate import create_shipstation_order
-from shipping_label_creator import process_files
+from shipstationcreate import (shipstation, SHIPSTATION_CREATE_BATCH_SIZE, build_shipstation_order,
+                               build_shipstation_orders, post_shipstation_orders, fetch_shipstation_fulfillments,
+                               iter_shipped_orders)
+from shipping_label_creator import process_label_files
+from label_cache import label_cache
+from attachment_store import attachment_store
+from catalog import Catalog, CatalogItem
+from outbox import OutboxWorker
+from processed_labels import store_processed_labels, load_processed_labels, discard_processed_labels
 
 # Initialize Flask-Session
 Session(app)
@@ -61,11 +70,20 @@ CORS(app, resources={
     r"/api/*": {
         "origins": ["http://localhost:3000", "http://localhost:3001", "http://localhost:5001", "https://64.176.218.24","http://64.176.218.24", "https://gymmolly.bodytools.work", "http://gymmolly.bodytools.work"],
         "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-        "allow_headers": ["Content-Type", "Authorization"],
+        "allow_headers": ["Content-Type", "Authorization", "Idempotency-Key"],
+        "expose_headers": ["X-Label-Token", "X-Label-Pages", "X-Label-Files", "X-Next-Cursor", "Idempotent-Replayed"],
         "supports_credentials": True
     }
 })  # Add this right after creating the Flask app
 
+def build_original_zip(uploads):
+    """Zip the original uploaded label files as (filename, data) pairs"""
+    zip_buffer = io.BytesIO()
+    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        for original_name, data in uploads:
+            zip_file.writestr(original_name, data)
+    return zip_buffer.getvalue()
+
 # Authentication decorator
 def login_required(f):
     @wraps(f)
@@ -105,6 +123,36 @@ class InventoryQuantity(db.Model):
             'quantity': self.quantity
         }
 
+# Append-only inventory ledger: every stock change is a row tagged with its cause
+class InventoryMovement(db.Model):
+    __tablename__ = 'inventory_movements'
+    id = db.Column(db.Integer, primary_key=True)
+    # Not a foreign key so history survives product deletion
+    sku = db.Column(db.String(20), nullable=False)
+    change = db.Column(db.Integer, nullable=False)
+    # 'opening', 'product_created', 'order', 'void', 'cancel', 'delete' or 'adjust'
+    reason = db.Column(db.String(20), nullable=False)
+    order_id = db.Column(db.Integer, nullable=True, index=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'sku': self.sku,
+            'change': self.change,
+            'reason': self.reason,
+            'order_id': self.order_id,
+            'created_at': self.created_at
+        }
+
+# Balances of every SKU as of a ledger position, so history queries replay only the delta
+class InventorySnapshot(db.Model):
+    __tablename__ = 'inventory_snapshots'
+    movement_id = db.Column(db.Integer, primary_key=True)  # last movement included
+    sku = db.Column(db.String(20), primary_key=True)
+    quantity = db.Column(db.Integer, nullable=False)
+    taken_at = db.Column(db.DateTime, nullable=False, index=True)
+
 # Define the ShippingDetail model
 class ShippingDetail(db.Model):
     __tablename__ = 'shipping_detail'
@@ -151,20 +199,58 @@ class ShippingAddress(db.Model):
             'email': self.email
         }
 
+# Order lifecycle. order_status holds exactly one of these so it can be
+# indexed and filtered; the text the order lists show is built by
+# order_status_display()
+ORDER_PROCESSING = 'Processing'
+ORDER_SHIPPED = 'Shipped'
+ORDER_CANCELLED = 'Cancelled'
+ORDER_VOIDED = 'Voided'
+ORDER_STATUSES = (ORDER_PROCESSING, ORDER_SHIPPED, ORDER_CANCELLED, ORDER_VOIDED)
+
+def order_status_display(status, shipped_at=None):
+    """Status text for the order lists, e.g. SHIPPED\\n07/12/25 or MANUALLY\\nCANCELLED"""
+    if status == ORDER_SHIPPED and shipped_at:
+        return f"SHIPPED\n{shipped_at.strftime('%m/%d/%y')}"
+    if status == ORDER_CANCELLED:
+        return 'MANUALLY\nCANCELLED'
+    return status
+
+def normalize_po(purchase_order_number):
+    """PO number as compared for uniqueness and matching: trimmed, single-spaced, upper case"""
+    return ' '.join(str(purchase_order_number or '').split()).upper()
+
 # Add after the ShippingAddress model
 class Order(db.Model):
     __tablename__ = 'orders'
     order_id = db.Column(db.Integer, primary_key=True)
     purchase_order_number = db.Column(db.String(100), nullable=False)
+    # normalize_po() of the PO, filled in on insert; idx_orders_po_normalized makes it
+    # unique among orders that aren't voided
+    po_normalized = db.Column(db.String(100), nullable=True, default=lambda context: normalize_po(
+        context.get_current_parameters().get('purchase_order_number')))
     shipping_address_id = db.Column(db.Integer, db.ForeignKey('shipping_addresses.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    attachment = db.Column(db.LargeBinary)
+    # Attachment content lives in the attachment store; list queries only read these columns
+    has_attachment = db.Column(db.Boolean, nullable=False, default=False)
+    attachment_size = db.Column(db.Integer, nullable=True)
     shipping_method = db.Column(db.String(100), nullable=False)  # Add this line
-    order_status = db.Column(db.String(50), nullable=False, default='Processing')
+    order_status = db.Column(db.String(50), nullable=False, default=ORDER_PROCESSING)
+    shipped_at = db.Column(db.DateTime, nullable=True)
     
     # Add this relationship
     items = db.relationship('OrderItem', backref='order', lazy=True)
     shipping_address = db.relationship('ShippingAddress', backref='orders')
+    files = db.relationship('OrderFile', lazy='select', cascade='all, delete-orphan',
+                            passive_deletes=True, backref='order')
+    
+    def add_file(self, kind, data, content_type):
+        """Store a file in the attachment store and reference it from this order"""
+        sha256 = attachment_store.put(data)
+        self.files.append(OrderFile(kind=kind, sha256=sha256, size=len(data), content_type=content_type))
+        if kind == 'labels':
+            self.has_attachment = True
+            self.attachment_size = len(data)
     
     def to_dict(self):
         return {
@@ -172,11 +258,179 @@ class Order(db.Model):
             'purchase_order_number': self.purchase_order_number,
             'shipping_address_id': self.shipping_address_id,
             'created_at': self.created_at,
-            'has_attachment': self.attachment is not None,
+            'has_attachment': self.has_attachment,
+            'attachment_size': self.attachment_size,
             'shipping_method': self.shipping_method,  # Add this line
-            'order_status': self.order_status,
+            'status': self.order_status,
+            'shipped_at': self.shipped_at,
+            'order_status': order_status_display(self.order_status, self.shipped_at),
+        }
+
+class IdempotencyKey(db.Model):
+    """The response to a POST /api/orders that carried an Idempotency-Key header
+
+    Stored in the order's own transaction, so a retry with the same key
+    gets the original response back instead of a second order. Keys are
+    kept for IDEMPOTENCY_KEY_TTL.
+    """
+    __tablename__ = 'idempotency_keys'
+    key = db.Column(db.String(255), primary_key=True)
+    request_hash = db.Column(db.String(64), nullable=False)  # sha256 of the order JSON
+    order_id = db.Column(db.Integer, db.ForeignKey('orders.order_id'), nullable=False, index=True)
+    status_code = db.Column(db.Integer, nullable=False)
+    response = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+class OrderStatusChange(db.Model):
+    """One row per status transition, oldest first"""
+    __tablename__ = 'order_status_history'
+    id = db.Column(db.Integer, primary_key=True)
+    order_id = db.Column(db.Integer, db.ForeignKey('orders.order_id'), nullable=False, index=True)
+    from_status = db.Column(db.String(50), nullable=True)
+    to_status = db.Column(db.String(50), nullable=False)
+    source = db.Column(db.String(20), nullable=False)  # 'manual', 'bulk', 'void', 'webhook', 'migration'
+    changed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'from_status': self.from_status,
+            'to_status': self.to_status,
+            'source': self.source,
+            'changed_at': self.changed_at
+        }
+
+class ShipStationOutbox(db.Model):
+    """ShipStation orders waiting to be created, written in the order's transaction
+
+    drain_shipstation_outbox() posts them in the background. Failures are
+    retried with exponential backoff; entries that keep failing, or that
+    ShipStation rejects outright, are marked dead for an admin to retry.
+    """
+    __tablename__ = 'shipstation_outbox'
+    id = db.Column(db.Integer, primary_key=True)
+    order_id = db.Column(db.Integer, db.ForeignKey('orders.order_id'), nullable=False, index=True)
+    payload = db.Column(db.Text, nullable=False)  # createorder JSON, built when the order was placed
+    status = db.Column(db.String(10), nullable=False, default='pending')  # 'pending', 'sent' or 'dead'
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_error = db.Column(db.Text, nullable=True)
+    shipstation_order_id = db.Column(db.String(50), nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime, nullable=True)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'order_id': self.order_id,
+            'status': self.status,
+            'attempts': self.attempts,
+            'next_attempt_at': self.next_attempt_at,
+            'last_error': self.last_error,
+            'shipstation_order_id': self.shipstation_order_id,
+            'created_at': self.created_at,
+            'sent_at': self.sent_at
+        }
+
+class EmailOutbox(db.Model):
+    """Order confirmation emails waiting to be sent, written in the order's transaction
+
+    drain_email_outbox() builds and sends them in the background, reading
+    attachments from the attachment store only then, with the same retry
+    and dead-letter rules as the ShipStation outbox.
+    """
+    __tablename__ = 'email_outbox'
+    id = db.Column(db.Integer, primary_key=True)
+    order_id = db.Column(db.Integer, db.ForeignKey('orders.order_id'), nullable=False, index=True)
+    status = db.Column(db.String(10), nullable=False, default='pending')  # 'pending', 'sent' or 'dead'
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime, nullable=True)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'order_id': self.order_id,
+            'status': self.status,
+            'attempts': self.attempts,
+            'next_attempt_at': self.next_attempt_at,
+            'last_error': self.last_error,
+            'created_at': self.created_at,
+            'sent_at': self.sent_at
+        }
+
+class ShipStationWebhookEvent(db.Model):
+    """A FULFILLMENT_SHIPPED notification, stored once per resource_url
+
+    The webhook only records the event; drain_shipstation_webhooks() fetches
+    the resource in the background, with the same retry and dead-letter
+    rules as the outbox.
+    """
+    __tablename__ = 'shipstation_webhook_events'
+    id = db.Column(db.Integer, primary_key=True)
+    resource_url = db.Column(db.String(1000), nullable=False, unique=True)
+    resource_type = db.Column(db.String(50), nullable=False)
+    status = db.Column(db.String(10), nullable=False, default='pending')  # 'pending', 'processed' or 'dead'
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_error = db.Column(db.Text, nullable=True)
+    deliveries = db.Column(db.Integer, nullable=False, default=1)  # times ShipStation sent it
+    fulfillments = db.Column(db.Integer, nullable=True)
+    unmatched = db.Column(db.Text, nullable=True)  # JSON list of PO numbers with no order
+    received_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    processed_at = db.Column(db.DateTime, nullable=True)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'resource_url': self.resource_url,
+            'resource_type': self.resource_type,
+            'status': self.status,
+            'attempts': self.attempts,
+            'next_attempt_at': self.next_attempt_at,
+            'last_error': self.last_error,
+            'deliveries': self.deliveries,
+            'fulfillments': self.fulfillments,
+            'unmatched': json.loads(self.unmatched) if self.unmatched else [],
+            'received_at': self.received_at,
+            'processed_at': self.processed_at
+        }
+
+# SyncWatermark row for the ShipStation reconciler; init_database() seeds it at import time
+SHIPSTATION_RECONCILE = 'shipstation_orders'
+
+class SyncWatermark(db.Model):
+    """How far a periodic sync with an external system has got
+
+    next_run_at doubles as a lease: a process only runs the sync after
+    moving it forward with a conditional UPDATE.
+    """
+    __tablename__ = 'sync_watermarks'
+    name = db.Column(db.String(50), primary_key=True)
+    watermark = db.Column(db.DateTime, nullable=True)  # newest remote change already applied
+    next_run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_run_at = db.Column(db.DateTime, nullable=True)
+    last_result = db.Column(db.Text, nullable=True)  # JSON summary of the last run
+    
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'watermark': self.watermark,
+            'next_run_at': self.next_run_at,
+            'last_run_at': self.last_run_at,
+            'last_result': json.loads(self.last_result) if self.last_result else None
         }
 
+class OrderFile(db.Model):
+    __tablename__ = 'order_files'
+    id = db.Column(db.Integer, primary_key=True)
+    order_id = db.Column(db.Integer, db.ForeignKey('orders.order_id'), nullable=False, index=True)
+    kind = db.Column(db.String(20), nullable=False)  # 'labels' or 'originals'
+    sha256 = db.Column(db.String(64), nullable=False, index=True)
+    size = db.Column(db.Integer, nullable=False)
+    content_type = db.Column(db.String(100), nullable=False)
+
 class OrderItem(db.Model):
     __tablename__ = 'order_items'
     id = db.Column(db.Integer, primary_key=True)
@@ -195,6 +449,448 @@ class OrderItem(db.Model):
             'quantity': self.quantity
         }
 
+class ChangeCounter(db.Model):
+    """Version counters bumped in the same transaction as writes to the tables they cover
+
+    'catalog' covers item_detail and shipping_detail, 'inventory' covers
+    inventory_quantity and 'addresses' covers shipping_addresses.
+    """
+    __tablename__ = 'change_counters'
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+CHANGE_COUNTERS = ('catalog', 'inventory', 'addresses')
+
+def read_change_counters(names):
+    """Current versions for the named counters, as a tuple in the same order"""
+    versions = dict(db.session.query(ChangeCounter.name, ChangeCounter.version)
+                    .filter(ChangeCounter.name.in_(names)).all())
+    return tuple(versions.get(name, 0) for name in names)
+
+def bump_change_counters(*names):
+    """Mark tables as changed for every worker; call before committing"""
+    from sqlalchemy import update
+    for name in names:
+        result = db.session.execute(update(ChangeCounter).where(ChangeCounter.name == name)
+                                    .values(version=ChangeCounter.version + 1))
+        if result.rowcount == 0:
+            db.session.add(ChangeCounter(name=name, version=1))
+
+def load_catalog_items():
+    """Every SKU with its shipping details, as plain rows in display order"""
+    rows = db.session.query(
+        ItemDetail.sku, ItemDetail.product, ItemDetail.size, ItemDetail.flavor, ItemDetail.unitsCs,
+        ShippingDetail.length, ShippingDetail.width, ShippingDetail.height, ShippingDetail.weight
+    ).outerjoin(ShippingDetail, ItemDetail.sku == ShippingDetail.sku)\
+     .order_by(ItemDetail.product, ItemDetail.flavor, ItemDetail.size).all()
+    return [CatalogItem(*row) for row in rows]
+
+def read_catalog_version():
+    return read_change_counters(('catalog',))[0]
+
+catalog = Catalog(load_catalog_items, read_catalog_version)
+
+# Serialized GET bodies per process: key -> (counter versions, etag, body)
+response_cache = {}
+
+def cached_json_response(key, counters, build):
+    """Serve a JSON body cached until one of the change counters moves
+
+    build(versions) receives the counter versions the body will be cached
+    under, so it can ask for a catalog snapshot at least that new. The ETag
+    is a hash of the body, so it stays valid across workers and restarts. A
+    matching If-None-Match gets a 304 without building anything.
+    """
+    versions = read_change_counters(counters)
+    entry = response_cache.get(key)
+    if entry is None or entry[0] != versions:
+        body = app.json.dumps(build(dict(zip(counters, versions))))
+        entry = (versions, hashlib.sha256(body.encode()).hexdigest()[:32], body)
+        response_cache[key] = entry
+    
+    _, etag, body = entry
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        response = app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    # Let browsers keep the body but revalidate on every poll
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+class OrderSummary(db.Model):
+    """Denormalized copy of an order as the list views show it
+
+    Kept in step with the order by refresh_order_summary() and
+    set_order_status(), so listing orders reads one row per order instead of
+    loading the order, its items, their products and its address. The
+    address is a snapshot taken when the order was placed.
+    """
+    __tablename__ = 'order_summaries'
+    order_id = db.Column(db.Integer, db.ForeignKey('orders.order_id'), primary_key=True)
+    created_at = db.Column(db.DateTime, nullable=False)
+    purchase_order_number = db.Column(db.String(100), nullable=False)
+    shipping_address_id = db.Column(db.Integer, nullable=False)
+    order_status = db.Column(db.String(50), nullable=False)
+    shipped_at = db.Column(db.DateTime, nullable=True)
+    case_count = db.Column(db.Integer, nullable=False, default=0)
+    total_weight = db.Column(db.Float, nullable=False, default=0)
+    data = db.Column(db.Text, nullable=False)  # JSON served as-is by the orders API
+
+def refresh_order_summary(order):
+    """Rebuild the summary row for an order from its current items
+
+    An address snapshot already in the summary is kept, so later edits to
+    the address book don't rewrite order history.
+    """
+    db.session.flush()
+    lines = db.session.query(OrderItem.product_sku, OrderItem.quantity)\
+        .filter(OrderItem.order_id == order.order_id)\
+        .order_by(OrderItem.id).all()
+    # The summary is stored, so it can't come from a snapshot another worker has moved past
+    products = catalog.snapshot(read_catalog_version())
+    
+    summary = db.session.get(OrderSummary, order.order_id)
+    if summary:
+        shipping_address = json.loads(summary.data)['shipping_address']
+    else:
+        shipping_address = db.session.get(ShippingAddress, order.shipping_address_id).to_dict()
+        summary = OrderSummary(order_id=order.order_id)
+        db.session.add(summary)
+    
+    items = []
+    case_count = 0
+    total_weight = 0
+    for sku, quantity in lines:
+        product = products.get(sku)
+        items.append({
+            'sku': sku,
+            'product': product.product if product else None,
+            'size': product.size if product else None,
+            'flavor': product.flavor if product else None,
+            'quantity': quantity
+        })
+        case_count += quantity
+        if product and product.has_shipping:
+            total_weight += quantity * product.weight
+    total_weight = round(total_weight, 2)
+    
+    summary.created_at = order.created_at
+    summary.purchase_order_number = order.purchase_order_number
+    summary.shipping_address_id = order.shipping_address_id
+    summary.order_status = order.order_status
+    summary.shipped_at = order.shipped_at
+    summary.case_count = case_count
+    summary.total_weight = total_weight
+    summary.data = app.json.dumps({
+        'order_id': order.order_id,
+        'created_at': order.created_at,
+        'purchase_order_number': order.purchase_order_number,
+        'shipping_address': shipping_address,
+        'items': items,
+        'case_count': case_count,
+        'total_weight': total_weight,
+        'has_attachment': order.has_attachment,
+        'attachment_size': order.attachment_size,
+        'shipping_method': order.shipping_method,
+        'status': order.order_status,
+        'shipped_at': order.shipped_at,
+        'order_status': order_status_display(order.order_status, order.shipped_at)
+    })
+    return summary
+
+def set_order_status(order, status, source, shipped_at=None):
+    """Move an order to a new status, updating its summary and history together
+
+    shipped_at defaults to now for orders being marked Shipped.
+    """
+    db.session.add(OrderStatusChange(order_id=order.order_id, from_status=order.order_status,
+                                     to_status=status, source=source))
+    order.order_status = status
+    if status == ORDER_SHIPPED:
+        order.shipped_at = shipped_at or datetime.utcnow()
+    summary = db.session.get(OrderSummary, order.order_id)
+    if not summary:
+        refresh_order_summary(order)
+        return
+    data = json.loads(summary.data)
+    data['status'] = status
+    data['shipped_at'] = order.shipped_at
+    data['order_status'] = order_status_display(status, order.shipped_at)
+    summary.order_status = status
+    summary.shipped_at = order.shipped_at
+    summary.data = app.json.dumps(data)
+
+def set_orders_status(order_ids, status, source, shipped_at=None, from_statuses=None):
+    """Move many orders to a new status with one statement per table
+
+    For Shipped, shipped_at is one datetime for every order or a dict of
+    order_id -> datetime; it defaults to now. With from_statuses only orders
+    still in one of those statuses move, checked by the UPDATE itself so a
+    concurrent request can't move the same order twice. Returns the ids of
+    the orders that moved.
+    """
+    from sqlalchemy import insert, select, update, func, literal, case
+    now = datetime.utcnow()
+    order_filter = [Order.order_id.in_(order_ids)]
+    if from_statuses is not None:
+        order_filter.append(Order.order_status.in_(from_statuses))
+    
+    # History first, while the old statuses are still there to read. This write
+    # takes SQLite's write lock, so the UPDATE below matches the same orders.
+    db.session.execute(insert(OrderStatusChange).from_select(
+        ['order_id', 'from_status', 'to_status', 'source', 'changed_at'],
+        select(Order.order_id, Order.order_status, literal(status), literal(source), literal(now))
+        .where(*order_filter)
+    ))
+    
+    order_values = {'order_status': status}
+    summary_values = {'order_status': status,
+                      'data': func.json_set(OrderSummary.data, '$.status', status,
+                                            '$.order_status', order_status_display(status))}
+    if status == ORDER_SHIPPED:
+        if not isinstance(shipped_at, dict):
+            shipped_at = dict.fromkeys(order_ids, shipped_at or now)
+        # Per-order values as CASE order_id WHEN ... expressions; the JSON gets the
+        # same datetime text the JSON provider writes elsewhere in the summary
+        order_values['shipped_at'] = case(shipped_at, value=Order.order_id)
+        summary_values['shipped_at'] = case(shipped_at, value=OrderSummary.order_id)
+        summary_values['data'] = func.json_set(
+            OrderSummary.data, '$.status', status,
+            '$.shipped_at', case({order_id: json.loads(app.json.dumps(value)) for order_id, value in shipped_at.items()},
+                                 value=OrderSummary.order_id),
+            '$.order_status', case({order_id: order_status_display(status, value) for order_id, value in shipped_at.items()},
+                                   value=OrderSummary.order_id))
+    moved = db.session.execute(
+        update(Order).where(*order_filter)
+        .values(**order_values)
+        .returning(Order.order_id)
+        .execution_options(synchronize_session=False)
+    ).scalars().all()
+    if moved:
+        db.session.execute(
+            update(OrderSummary).where(OrderSummary.order_id.in_(moved))
+            .values(**summary_values)
+            .execution_options(synchronize_session=False)
+        )
+    return moved
+
+def backfill_order_summaries(batch_size=500):
+    """Build summaries for orders created before the summary table existed"""
+    built = 0
+    while True:
+        orders = Order.query.outerjoin(OrderSummary, OrderSummary.order_id == Order.order_id)\
+            .filter(OrderSummary.order_id.is_(None))\
+            .order_by(Order.order_id).limit(batch_size).all()
+        if not orders:
+            break
+        for order in orders:
+            refresh_order_summary(order)
+        db.session.commit()
+        built += len(orders)
+    if built:
+        print(f"Built order summaries for {built} existing orders")
+
+class InventoryShortage(Exception):
+    """Raised when an order asks for more than is in stock; lists every short SKU"""
+    def __init__(self, shortages):
+        self.shortages = shortages
+        details = '; '.join(
+            f"SKU {s['sku']} not found in inventory" if s['available'] is None
+            else f"SKU {s['sku']} available: {s['available']}, requested: {s['requested']}"
+            for s in shortages
+        )
+        super().__init__(f"Insufficient inventory. {details}")
+
+def reserve_inventory(requested, attempts=3):
+    """Take stock for a whole order in one conditional UPDATE
+
+    requested maps SKU to total quantity. A row is only decremented if it
+    still has enough stock, so concurrent orders can't oversell. This must be
+    the first write in the caller's transaction: if any SKU falls short the
+    session is rolled back and InventoryShortage lists every short SKU.
+    """
+    from sqlalchemy import update, case
+    if not requested:
+        return
+    
+    skus = list(requested)
+    wanted = case(requested, value=InventoryQuantity.sku)
+    for _ in range(attempts):
+        result = db.session.execute(
+            update(InventoryQuantity)
+            .where(InventoryQuantity.sku.in_(skus), InventoryQuantity.quantity >= wanted)
+            .values(quantity=InventoryQuantity.quantity - wanted)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount == len(requested):
+            return
+        
+        # Undo the rows that did match, then report against current stock
+        db.session.rollback()
+        available = dict(db.session.query(InventoryQuantity.sku, InventoryQuantity.quantity)
+                         .filter(InventoryQuantity.sku.in_(skus)).all())
+        shortages = [
+            {'sku': sku, 'requested': quantity, 'available': available.get(sku)}
+            for sku, quantity in requested.items()
+            if available.get(sku) is None or available[sku] < quantity
+        ]
+        if shortages:
+            raise InventoryShortage(shortages)
+        # Stock was added between the two statements; try again
+    
+    raise Exception("Inventory changed while reserving stock, please retry")
+
+# Take a snapshot of all balances every this many ledger rows
+INVENTORY_SNAPSHOT_INTERVAL = int(os.getenv('INVENTORY_SNAPSHOT_INTERVAL', '1000'))
+
+def record_inventory_movements(changes, reason, order_id=None):
+    """Append ledger rows for stock changes already applied to inventory_quantity
+
+    changes maps SKU to a signed quantity.
+    """
+    append_inventory_movements([(sku, change, order_id) for sku, change in changes.items()], reason)
+
+def append_inventory_movements(entries, reason):
+    """Insert (sku, change, order_id) ledger rows in one statement
+
+    Also bumps the inventory change counter and takes a snapshot whenever
+    the ledger crosses a multiple of INVENTORY_SNAPSHOT_INTERVAL rows.
+    """
+    from sqlalchemy import insert, func
+    now = datetime.utcnow()
+    rows = [{'sku': sku, 'change': change, 'reason': reason, 'order_id': order_id, 'created_at': now}
+            for sku, change, order_id in entries if change]
+    if not rows:
+        return
+    db.session.execute(insert(InventoryMovement), rows)
+    bump_change_counters('inventory')
+    
+    last_id = db.session.query(func.max(InventoryMovement.id)).scalar()
+    if last_id // INVENTORY_SNAPSHOT_INTERVAL > (last_id - len(rows)) // INVENTORY_SNAPSHOT_INTERVAL:
+        take_inventory_snapshot(last_id)
+
+def add_to_stock(changes):
+    """Add signed quantities to inventory_quantity in one UPDATE
+
+    Raises LookupError naming the first SKU without an inventory row.
+    """
+    from sqlalchemy import update, case
+    if not changes:
+        return
+    
+    delta = case(changes, value=InventoryQuantity.sku)
+    result = db.session.execute(
+        update(InventoryQuantity)
+        .where(InventoryQuantity.sku.in_(list(changes)))
+        .values(quantity=InventoryQuantity.quantity + delta)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != len(changes):
+        found = {sku for sku, in db.session.query(InventoryQuantity.sku)
+                 .filter(InventoryQuantity.sku.in_(list(changes)))}
+        missing = next(sku for sku in changes if sku not in found)
+        raise LookupError(f"Inventory record not found for SKU: {missing}")
+
+def apply_inventory_changes(changes, reason, order_id=None):
+    """Change stock in one UPDATE and record the changes in the ledger"""
+    changes = {sku: change for sku, change in changes.items() if change}
+    add_to_stock(changes)
+    record_inventory_movements(changes, reason, order_id)
+
+def restock_orders(order_ids, reason):
+    """Put the items of one or more orders back in stock
+
+    Stock is updated once per SKU across all the orders; ledger rows stay
+    per order and SKU so every change keeps its cause.
+    """
+    from sqlalchemy import func
+    lines = db.session.query(OrderItem.product_sku, func.sum(OrderItem.quantity), OrderItem.order_id)\
+        .filter(OrderItem.order_id.in_(order_ids))\
+        .group_by(OrderItem.order_id, OrderItem.product_sku).all()
+    totals = {}
+    for sku, quantity, _ in lines:
+        totals[sku] = totals.get(sku, 0) + quantity
+    add_to_stock(totals)
+    append_inventory_movements(lines, reason)
+
+def claim_orders(order_ids, statuses):
+    """Lock the orders still in one of statuses for this transaction; returns {order_id: status}
+
+    The UPDATE changes nothing, but as the transaction's first write it takes
+    SQLite's write lock. A concurrent request claiming the same orders waits
+    for this one to commit and then finds them changed or gone.
+    """
+    from sqlalchemy import update
+    rows = db.session.execute(
+        update(Order).where(Order.order_id.in_(order_ids), Order.order_status.in_(statuses))
+        .values(order_status=Order.order_status)
+        .returning(Order.order_id, Order.order_status)
+        .execution_options(synchronize_session=False)
+    ).all()
+    return dict(rows)
+
+def orders_missing_inventory(order_ids):
+    """Map order id to a SKU of that order that has no inventory row"""
+    rows = db.session.query(OrderItem.order_id, OrderItem.product_sku)\
+        .outerjoin(InventoryQuantity, InventoryQuantity.sku == OrderItem.product_sku)\
+        .filter(OrderItem.order_id.in_(order_ids), InventoryQuantity.sku.is_(None)).all()
+    return dict(rows)
+
+def take_inventory_snapshot(upto_id=None):
+    """Store balances as of a ledger row: the previous snapshot plus the movements since"""
+    from sqlalchemy import insert, func
+    if upto_id is None:
+        upto_id = db.session.query(func.max(InventoryMovement.id)).scalar() or 0
+    balances = inventory_balances(upto_id=upto_id)
+    if not balances:
+        return
+    taken_at = datetime.utcnow()
+    db.session.execute(insert(InventorySnapshot), [
+        {'movement_id': upto_id, 'sku': sku, 'quantity': quantity, 'taken_at': taken_at}
+        for sku, quantity in balances.items()
+    ])
+
+def inventory_balances(at=None, upto_id=None):
+    """Stock per SKU from the ledger, as of a time or a ledger row (default: now)
+
+    Starts from the newest snapshot before that point and adds the movements
+    after it, so the cost is one snapshot plus at most one interval of rows.
+    """
+    from sqlalchemy import func
+    snapshot_query = db.session.query(func.max(InventorySnapshot.movement_id))
+    if at is not None:
+        snapshot_query = snapshot_query.filter(InventorySnapshot.taken_at <= at)
+    if upto_id is not None:
+        snapshot_query = snapshot_query.filter(InventorySnapshot.movement_id <= upto_id)
+    snapshot_id = snapshot_query.scalar() or 0
+    
+    balances = {}
+    if snapshot_id:
+        balances = dict(db.session.query(InventorySnapshot.sku, InventorySnapshot.quantity)
+                        .filter(InventorySnapshot.movement_id == snapshot_id).all())
+    
+    delta = db.session.query(InventoryMovement.sku, func.sum(InventoryMovement.change))\
+        .filter(InventoryMovement.id > snapshot_id)
+    if at is not None:
+        delta = delta.filter(InventoryMovement.created_at <= at)
+    if upto_id is not None:
+        delta = delta.filter(InventoryMovement.id <= upto_id)
+    for sku, change in delta.group_by(InventoryMovement.sku):
+        balances[sku] = balances.get(sku, 0) + change
+    return balances
+
+def open_inventory_ledger():
+    """Record an opening movement for stock that predates the ledger"""
+    from sqlalchemy import select
+    has_history = select(InventoryMovement.id).where(InventoryMovement.sku == InventoryQuantity.sku).exists()
+    unrecorded = db.session.query(InventoryQuantity.sku, InventoryQuantity.quantity)\
+        .filter(~has_history).all()
+    if unrecorded:
+        record_inventory_movements(dict(unrecorded), 'opening')
+        db.session.commit()
+        print(f"Opened inventory ledger for {len(unrecorded)} SKUs")
+
 # Create the database tables only if they don't exist
 import time
 from collections import defaultdict
@@ -202,6 +898,150 @@ from collections import defaultdict
 # Rate limiting for login attempts
 login_attempts = defaultdict(lambda: {'count': 0, 'lockout_until': 0})
 
+def migrate_order_attachments():
+    """Move legacy attachment blobs from the database into the attachment store"""
+    from sqlalchemy import inspect, text
+    inspector = inspect(db.engine)
+    columns = {column['name'] for column in inspector.get_columns('orders')}
+    
+    # Legacy sources: inline orders.attachment, then the order_attachments table
+    sources = []
+    if 'attachment' in columns:
+        sources.append(("SELECT order_id FROM orders WHERE attachment IS NOT NULL",
+                        "SELECT attachment FROM orders WHERE order_id = :order_id",
+                        "UPDATE orders SET attachment = NULL WHERE order_id = :order_id"))
+    if inspector.has_table('order_attachments'):
+        sources.append(("SELECT order_id FROM order_attachments",
+                        "SELECT content FROM order_attachments WHERE order_id = :order_id",
+                        "DELETE FROM order_attachments WHERE order_id = :order_id"))
+    
+    with db.engine.begin() as conn:
+        if 'has_attachment' not in columns:
+            conn.execute(text("ALTER TABLE orders ADD COLUMN has_attachment BOOLEAN NOT NULL DEFAULT 0"))
+        if 'attachment_size' not in columns:
+            conn.execute(text("ALTER TABLE orders ADD COLUMN attachment_size INTEGER"))
+        
+        moved = 0
+        for list_sql, read_sql, clear_sql in sources:
+            order_ids = [row[0] for row in conn.execute(text(list_sql))]
+            # One blob in memory at a time
+            for order_id in order_ids:
+                data = conn.execute(text(read_sql), {'order_id': order_id}).scalar()
+                sha256 = attachment_store.put(data)
+                conn.execute(text("""
+                    INSERT INTO order_files (order_id, kind, sha256, size, content_type)
+                    VALUES (:order_id, 'labels', :sha256, :size, 'application/pdf')
+                """), {'order_id': order_id, 'sha256': sha256, 'size': len(data)})
+                conn.execute(text("""
+                    UPDATE orders SET has_attachment = 1, attachment_size = :size WHERE order_id = :order_id
+                """), {'order_id': order_id, 'size': len(data)})
+                conn.execute(text(clear_sql), {'order_id': order_id})
+                moved += 1
+        if moved:
+            print(f"Moved {moved} order attachments into the attachment store")
+
+def migrate_order_status():
+    """Split legacy display statuses like "SHIPPED\n07/12/25" into order_status and shipped_at"""
+    from sqlalchemy import inspect, text, select, update, insert
+    inspector = inspect(db.engine)
+    order_columns = {column['name'] for column in inspector.get_columns('orders')}
+    summary_columns = {column['name'] for column in inspector.get_columns('order_summaries')}
+    
+    with db.engine.begin() as conn:
+        if 'shipped_at' not in order_columns:
+            conn.execute(text("ALTER TABLE orders ADD COLUMN shipped_at DATETIME"))
+        if 'shipped_at' not in summary_columns:
+            conn.execute(text("ALTER TABLE order_summaries ADD COLUMN shipped_at DATETIME"))
+        # Superseded by idx_orders_status_created_at
+        conn.execute(text("DROP INDEX IF EXISTS idx_orders_order_status"))
+        
+        legacy = conn.execute(select(Order.order_id, Order.order_status)
+                              .where(Order.order_status.not_in(ORDER_STATUSES))).all()
+        migrated = 0
+        for order_id, old_status in legacy:
+            shipped_at = None
+            if old_status.startswith('SHIPPED'):
+                status = ORDER_SHIPPED
+                try:
+                    shipped_at = datetime.strptime(old_status.split('\n', 1)[1].strip(), '%m/%d/%y')
+                except (IndexError, ValueError):
+                    pass
+            elif 'CANCELLED' in old_status.upper():
+                status = ORDER_CANCELLED
+            else:
+                print(f"Warning: unrecognised status {old_status!r} on order {order_id}")
+                continue
+            conn.execute(update(Order).where(Order.order_id == order_id)
+                         .values(order_status=status, shipped_at=shipped_at))
+            conn.execute(insert(OrderStatusChange).values(
+                order_id=order_id, from_status=old_status, to_status=status,
+                source='migration', changed_at=datetime.utcnow()))
+            migrated += 1
+        
+        # Rewrite the summaries' JSON so it carries status, shipped_at and the display text
+        if migrated or 'shipped_at' not in summary_columns:
+            rows = conn.execute(select(OrderSummary.order_id, OrderSummary.data, Order.order_status, Order.shipped_at)
+                                .join(Order, Order.order_id == OrderSummary.order_id)).all()
+            for order_id, data, status, shipped_at in rows:
+                data = json.loads(data)
+                data['status'] = status
+                data['shipped_at'] = shipped_at
+                data['order_status'] = order_status_display(status, shipped_at)
+                conn.execute(update(OrderSummary).where(OrderSummary.order_id == order_id).values(
+                    order_status=status, shipped_at=shipped_at, data=app.json.dumps(data)))
+        if migrated:
+            print(f"Normalized {migrated} legacy order statuses")
+
+# Voided orders sit outside the index, so a voided PO can be entered again
+PO_NORMALIZED_INDEX = ("CREATE UNIQUE INDEX IF NOT EXISTS idx_orders_po_normalized ON orders(po_normalized) "
+                       f"WHERE order_status != '{ORDER_VOIDED}'")
+
+def migrate_order_po_numbers():
+    """Fill orders.po_normalized and put the partial unique index on it
+
+    Orders from before duplicate checks may already share a normalized PO.
+    Then the index is built without UNIQUE so lookups stay indexed, the
+    orders are logged, and the app starts so they can be voided or
+    renumbered; a later start makes the index unique once they're gone.
+    """
+    from sqlalchemy import inspect, text, select, update, bindparam, func
+    columns = {column['name'] for column in inspect(db.engine).get_columns('orders')}
+    orders = Order.__table__
+    
+    with db.engine.begin() as conn:
+        if 'po_normalized' not in columns:
+            conn.execute(text("ALTER TABLE orders ADD COLUMN po_normalized VARCHAR(100)"))
+        # Superseded by idx_orders_po_normalized
+        conn.execute(text("DROP INDEX IF EXISTS idx_orders_purchase_order_number"))
+        
+        missing = conn.execute(select(orders.c.order_id, orders.c.purchase_order_number)
+                               .where(orders.c.po_normalized.is_(None))).all()
+        if missing:
+            conn.execute(update(orders).where(orders.c.order_id == bindparam('b_order_id'))
+                         .values(po_normalized=bindparam('b_po')),
+                         [{'b_order_id': order_id, 'b_po': normalize_po(po)} for order_id, po in missing])
+            print(f"Normalized PO numbers for {len(missing)} orders")
+        
+        duplicates = conn.execute(
+            select(orders.c.po_normalized, func.group_concat(orders.c.order_id))
+            .where(orders.c.order_status != ORDER_VOIDED)
+            .group_by(orders.c.po_normalized).having(func.count() > 1)).all()
+        
+        # Rebuild the first version of the index, which also covered voided orders,
+        # and a non-unique one from a start when duplicates were still there
+        existing = conn.execute(text("SELECT sql FROM sqlite_master WHERE type = 'index' "
+                                     "AND name = 'idx_orders_po_normalized'")).scalar()
+        if existing and ('WHERE' not in existing.upper() or ('UNIQUE' not in existing.upper() and not duplicates)):
+            conn.execute(text("DROP INDEX idx_orders_po_normalized"))
+        if duplicates:
+            logging.warning(
+                "Orders share a PO number, so idx_orders_po_normalized is not unique until they are fixed: %s. "
+                "Void or renumber all but one order of each; the next start makes the index unique.",
+                "; ".join(f"{po!r} on orders {order_ids}" for po, order_ids in duplicates))
+            conn.execute(text(PO_NORMALIZED_INDEX.replace('UNIQUE ', '')))
+        else:
+            conn.execute(text(PO_NORMALIZED_INDEX))
+
 def init_database():
     """Initialize database with retry logic"""
     max_retries = 3
@@ -221,6 +1061,28 @@ def init_database():
             # Create tables
             db.create_all()
             
+            # Move label PDFs stored in the database into the attachment store
+            migrate_order_attachments()
+            
+            # Normalize display-string statuses from before shipped_at existed
+            migrate_order_status()
+            
+            # Give every order a normalized, uniquely indexed PO number
+            migrate_order_po_numbers()
+            
+            for name in CHANGE_COUNTERS:
+                if not db.session.get(ChangeCounter, name):
+                    db.session.add(ChangeCounter(name=name, version=0))
+            if not db.session.get(SyncWatermark, SHIPSTATION_RECONCILE):
+                db.session.add(SyncWatermark(name=SHIPSTATION_RECONCILE))
+            db.session.commit()
+            
+            # Give stock that predates the inventory ledger an opening movement
+            open_inventory_ledger()
+            
+            # Fill the list-view read model for orders that predate it
+            backfill_order_summaries()
+            
             # Create indexes for better performance
             from sqlalchemy import text, func
             with db.engine.connect() as conn:
@@ -232,11 +1094,23 @@ def init_database():
                     
                     # Frequently queried columns
                     "CREATE INDEX IF NOT EXISTS idx_orders_created_at ON orders(created_at DESC)",
-                    "CREATE INDEX IF NOT EXISTS idx_orders_purchase_order_number ON orders(purchase_order_number)",
-                    "CREATE INDEX IF NOT EXISTS idx_orders_order_status ON orders(order_status)",
+                    "CREATE INDEX IF NOT EXISTS idx_orders_shipped_at ON orders(shipped_at)",
                     
                     # Composite indexes for common queries
                     "CREATE INDEX IF NOT EXISTS idx_order_items_order_product ON order_items(order_id, product_sku)",
+                    "CREATE INDEX IF NOT EXISTS idx_orders_status_created_at ON orders(order_status, created_at DESC)",
+                    
+                    # Order list read model: keyset pages overall and per status
+                    "CREATE INDEX IF NOT EXISTS idx_order_summaries_created_at ON order_summaries(created_at DESC, order_id DESC)",
+                    "CREATE INDEX IF NOT EXISTS idx_order_summaries_status_created_at ON order_summaries(order_status, created_at DESC, order_id DESC)",
+                    "CREATE INDEX IF NOT EXISTS idx_order_summaries_address ON order_summaries(shipping_address_id, created_at DESC, order_id DESC)",
+                    "CREATE INDEX IF NOT EXISTS idx_order_summaries_po ON order_summaries(purchase_order_number)",
+                    "CREATE INDEX IF NOT EXISTS idx_order_summaries_shipped_at ON order_summaries(shipped_at)",
+                    
+                    # ShipStation outbox: due entries
+                    "CREATE INDEX IF NOT EXISTS idx_shipstation_outbox_due ON shipstation_outbox(status, next_attempt_at)",
+                    "CREATE INDEX IF NOT EXISTS idx_shipstation_webhook_events_due ON shipstation_webhook_events(status, next_attempt_at)",
+                    "CREATE INDEX IF NOT EXISTS idx_email_outbox_due ON email_outbox(status, next_attempt_at)",
                     
                     # ItemDetail and InventoryQuantity indexes
                     "CREATE INDEX IF NOT EXISTS idx_item_detail_product ON item_detail(product)",
@@ -359,6 +1233,7 @@ def create_shipping_address():
             email=data['email']
         )
         db.session.add(new_address)
+        bump_change_counters('addresses')
         db.session.commit()
         return jsonify(new_address.to_dict()), 201
     except Exception as e:
@@ -366,8 +1241,8 @@ def create_shipping_address():
 
 @app.route('/api/shipping-addresses', methods=['GET'])
 def get_shipping_addresses():
-    addresses = ShippingAddress.query.all()
-    return jsonify([address.to_dict() for address in addresses])
+    return cached_json_response('shipping-addresses', ('addresses',),
+                                lambda versions: [address.to_dict() for address in ShippingAddress.query.all()])
 
 @app.route('/api/shipping-addresses/<int:id>', methods=['GET'])
 def get_shipping_address(id):
@@ -380,6 +1255,7 @@ def update_shipping_address(id):
     data = request.json
     for key, value in data.items():
         setattr(address, key, value)
+    bump_change_counters('addresses')
     db.session.commit()
     return jsonify(address.to_dict())
 
@@ -387,6 +1263,7 @@ def update_shipping_address(id):
 def delete_shipping_address(id):
     address = ShippingAddress.query.get_or_404(id)
     db.session.delete(address)
+    bump_change_counters('addresses')
     db.session.commit()
     return '', 204
 
@@ -394,77 +1271,131 @@ def delete_shipping_address(id):
 
 @app.route('/api/inventory', methods=['GET'])
 def get_inventory():
-    # Join ItemDetail with InventoryQuantity and ShippingDetail
-    inventory = db.session.query(ItemDetail, InventoryQuantity, ShippingDetail)\
-        .join(InventoryQuantity)\
-        .outerjoin(ShippingDetail, ItemDetail.sku == ShippingDetail.sku)\
-        .order_by(ItemDetail.product, ItemDetail.flavor, ItemDetail.size)\
-        .all()
+    return cached_json_response('inventory', ('catalog', 'inventory'), build_inventory)
+
+def build_inventory(versions):
+    # Product details come from the catalog snapshot; only quantities are queried
+    quantities = dict(db.session.query(InventoryQuantity.sku, InventoryQuantity.quantity).all())
     result = []
-    for item, quantity, shipping in inventory:
+    for item in catalog.snapshot(versions['catalog']):
+        if item.sku not in quantities:
+            continue
         item_dict = item.to_dict()
-        item_dict['quantity'] = quantity.quantity
+        item_dict['quantity'] = quantities[item.sku]
         # Add shipping details if available
-        if shipping:
+        if item.has_shipping:
             item_dict['dimensions'] = {
-                'length': shipping.length,
-                'width': shipping.width,
-                'height': shipping.height
+                'length': item.length,
+                'width': item.width,
+                'height': item.height
             }
-            item_dict['weight'] = shipping.weight
+            item_dict['weight'] = item.weight
         else:
             item_dict['dimensions'] = None
             item_dict['weight'] = None
         result.append(item_dict)
-    return jsonify(result)
+    return result
 
 @app.route('/api/inventory/<string:sku>', methods=['PUT'])
 def update_inventory(sku):
-    quantity = InventoryQuantity.query.get_or_404(sku)
+    from sqlalchemy import update
     data = request.json
-    quantity.quantity = data['quantity']
-    db.session.commit()
-    return jsonify(quantity.to_dict())
+    new_quantity = int(data['quantity'])
+    
+    # Overwrite only the value we read, so the ledger records the exact adjustment
+    for _ in range(3):
+        current = db.session.query(InventoryQuantity.quantity).filter(InventoryQuantity.sku == sku).scalar()
+        if current is None:
+            return jsonify({"error": "Inventory record not found"}), 404
+        result = db.session.execute(
+            update(InventoryQuantity)
+            .where(InventoryQuantity.sku == sku, InventoryQuantity.quantity == current)
+            .values(quantity=new_quantity)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount:
+            record_inventory_movements({sku: new_quantity - current}, 'adjust')
+            db.session.commit()
+            return jsonify({'sku': sku, 'quantity': new_quantity})
+        db.session.rollback()
+    
+    return jsonify({"error": "Inventory changed while updating, please retry"}), 409
+
+@app.route('/api/inventory/movements', methods=['GET'])
+@login_required
+def get_inventory_movements():
+    """Ledger rows newest first; page with ?before=<id> and filter with ?sku= or ?order_id="""
+    try:
+        limit = min(max(request.args.get('limit', 100, type=int), 1), 500)
+        query = InventoryMovement.query
+        if request.args.get('sku'):
+            query = query.filter(InventoryMovement.sku == request.args['sku'])
+        if request.args.get('order_id', type=int):
+            query = query.filter(InventoryMovement.order_id == request.args.get('order_id', type=int))
+        if request.args.get('before', type=int):
+            query = query.filter(InventoryMovement.id < request.args.get('before', type=int))
+        movements = query.order_by(InventoryMovement.id.desc()).limit(limit).all()
+        return jsonify([movement.to_dict() for movement in movements]), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/inventory/history', methods=['GET'])
+@login_required
+def get_inventory_history():
+    """Stock per SKU at a point in time (?at=ISO date or datetime, default now)"""
+    try:
+        try:
+            at = parse_date_param('at', end_of_day=True)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        balances = inventory_balances(at=at)
+        return jsonify([{'sku': sku, 'quantity': quantity} for sku, quantity in sorted(balances.items())]), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/inventory/reconcile', methods=['GET'])
+@login_required
+def reconcile_inventory():
+    """Compare live stock with the ledger (latest snapshot plus later movements)"""
+    try:
+        ledger = inventory_balances()
+        stock = dict(db.session.query(InventoryQuantity.sku, InventoryQuantity.quantity).all())
+        mismatches = [
+            {'sku': sku, 'stock': stock.get(sku), 'ledger': ledger.get(sku, 0)}
+            for sku in sorted(set(stock) | set(ledger))
+            if sku in stock and stock[sku] != ledger.get(sku, 0)
+        ]
+        return jsonify({'checked': len(stock), 'mismatches': mismatches}), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
 # Product management endpoints
 @app.route('/api/products', methods=['GET'])
 def get_products():
     try:
-        products = ItemDetail.query.all()
-        products_data = []
+        return cached_json_response('products', ('catalog', 'inventory'), build_products)
         
-        for product in products:
-            product_dict = {
-                'sku': product.sku,
-                'product': product.product,
-                'size': product.size,
-                'flavor': product.flavor,
-                'unitsCs': product.unitsCs
-            }
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+def build_products(versions):
+    # Product details come from the catalog snapshot; only quantities are queried
+    quantities = dict(db.session.query(InventoryQuantity.sku, InventoryQuantity.quantity).all())
+    products_data = []
+    
+    for product in catalog.snapshot(versions['catalog']):
+        product_dict = product.to_dict()
+        
+        # Add inventory quantity if available
+        product_dict['quantity'] = quantities.get(product.sku, 0)
             
-            # Add inventory quantity if available
-            inventory = InventoryQuantity.query.get(product.sku)
-            if inventory:
-                product_dict['quantity'] = inventory.quantity
-            else:
-                product_dict['quantity'] = 0
-                
-            # Add shipping details if available
-            shipping = ShippingDetail.query.get(product.sku)
-            if shipping:
-                product_dict['shipping'] = {
-                    'length': shipping.length,
-                    'width': shipping.width,
-                    'height': shipping.height,
-                    'weight': shipping.weight
-                }
-                
-            products_data.append(product_dict)
+        # Add shipping details if available
+        if product.has_shipping:
+            product_dict['shipping'] = product.shipping_dict()
             
-        return jsonify(products_data), 200
+        products_data.append(product_dict)
         
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+    return products_data
 
 @app.route('/api/products', methods=['POST'])
 def create_product():
@@ -487,12 +1418,13 @@ def create_product():
         db.session.add(new_product)
         
         # Create inventory entry
-        initial_quantity = data.get('quantity', 0)
+        initial_quantity = int(data.get('quantity') or 0)
         new_inventory = InventoryQuantity(
             sku=data['sku'],
             quantity=initial_quantity
         )
         db.session.add(new_inventory)
+        record_inventory_movements({data['sku']: initial_quantity}, 'product_created')
         
         # Create shipping details if provided
         if any(data.get(field) for field in ['length', 'width', 'height', 'weight']):
@@ -505,7 +1437,9 @@ def create_product():
             )
             db.session.add(new_shipping)
             
+        bump_change_counters('catalog', 'inventory')
         db.session.commit()
+        catalog.invalidate()
         
         return jsonify({
             "message": "Product created successfully",
@@ -537,7 +1471,9 @@ def delete_product(sku):
         
         # Delete the product
         db.session.delete(product)
+        bump_change_counters('catalog', 'inventory')
         db.session.commit()
+        catalog.invalidate()
         
         return jsonify({
             "message": f"Product {sku} deleted successfully"
@@ -547,18 +1483,70 @@ def delete_product(sku):
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
 
+# A retried order with the same Idempotency-Key replays the original response for this long
+IDEMPOTENCY_KEY_TTL = timedelta(hours=24)
+
+def replay_idempotent_response(key, request_hash):
+    """The stored response for an Idempotency-Key, or None if the key is new or expired"""
+    record = db.session.get(IdempotencyKey, key)
+    if not record or record.created_at < datetime.utcnow() - IDEMPOTENCY_KEY_TTL:
+        return None
+    if record.request_hash != request_hash:
+        return jsonify({"error": "Idempotency-Key was already used for a different order"}), 422
+    response = app.response_class(record.response, status=record.status_code, mimetype='application/json')
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+def duplicate_po_response(purchase_order_number):
+    """409 naming the existing order if a live order has this PO, else None
+
+    Voided orders don't hold their PO, matching idx_orders_po_normalized.
+    """
+    existing = db.session.query(Order.order_id)\
+        .filter(Order.po_normalized == normalize_po(purchase_order_number),
+                Order.order_status != ORDER_VOIDED).scalar()
+    if existing is None:
+        return None
+    return jsonify({
+        "error": f"PO number {str(purchase_order_number).strip()} has already been used",
+        "order_id": existing
+    }), 409
+
 # Add after the existing routes
 @app.route('/api/orders', methods=['POST'])
 def create_order():
+    """Create an order, at most once per PO number
+
+    A client that may retry should send an Idempotency-Key header; a repeat
+    with the same key and order JSON gets the original 201 back.
+    """
+    from sqlalchemy.exc import IntegrityError
+    idempotency_key = request.headers.get('Idempotency-Key')
     try:
         # Get the JSON data from the form
-        order_data = json.loads(request.form.get('data'))
+        raw_data = request.form.get('data')
+        order_data = json.loads(raw_data)
+        request_hash = hashlib.sha256(raw_data.encode('utf-8')).hexdigest()
+        
+        if idempotency_key:
+            if len(idempotency_key) > 255:
+                return jsonify({"error": "Idempotency-Key must be at most 255 characters"}), 400
+            replay = replay_idempotent_response(idempotency_key, request_hash)
+            if replay:
+                return replay
         
         # Extract order details
         purchase_order_number = order_data.get('purchase_order_number')
         shipping_address_id = order_data.get('shipping_address_id')
         shipping_method = order_data.get('shipping_method')
         items = order_data.get('items', [])
+        
+        if not normalize_po(purchase_order_number):
+            return jsonify({"error": "Purchase order number is required"}), 400
+        # One indexed probe before any label processing or stock changes
+        duplicate = duplicate_po_response(purchase_order_number)
+        if duplicate:
+            return duplicate
 
         # Create new order
         new_order = Order(
@@ -567,64 +1555,60 @@ def create_order():
             shipping_method=shipping_method
         )
 
-        # Process and handle file attachments
-        pdf_data = None
-        zip_data = None
-        if 'attachment' in request.files:
+        # Process file attachments; they are stored once the order is known to go through
+        # Reuse the labels already processed by /api/process-labels if the token is still live
+        label_token = request.form.get('label_token') or order_data.get('label_token')
+        stored_labels = load_processed_labels(label_token)
+        reused_labels = stored_labels is not None
+        files_to_store = []
+        if stored_labels:
+            pdf_data, zip_data = stored_labels
+            files_to_store = [('labels', pdf_data, 'application/pdf'), ('originals', zip_data, 'application/zip')]
+        elif 'attachment' in request.files:
             files = request.files.getlist('attachment')
             if files:
-                with tempfile.TemporaryDirectory() as temp_dir:
-                    # Save uploaded files
-                    saved_files = []
-                    for file in files:
-                        file_path = os.path.join(temp_dir, file.filename)
-                        file.save(file_path)
-                        saved_files.append((file_path, file.filename))
-                    
-                    # Create zip file of original files
-                    zip_buffer = io.BytesIO()
-                    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-                        for file_path, original_name in saved_files:
-                            zip_file.write(file_path, original_name)
-                    zip_data = zip_buffer.getvalue()
-                    
-                    # Process the files
-                    output_path = os.path.join(temp_dir, "processed_labels.pdf")
-                    process_files(temp_dir, output_path)
-                    
-                    # Try to read the trimmed version first
-                    trimmed_path = output_path.replace('.pdf', '_trimmed.pdf')
-                    if os.path.exists(trimmed_path):
-                        with open(trimmed_path, 'rb') as f:
-                            pdf_data = f.read()
-                    else:
-                        # Fall back to original if trimmed doesn't exist
-                        with open(output_path, 'rb') as f:
-                            pdf_data = f.read()
-                    
-                    new_order.attachment = pdf_data  # Save to database
+                # Read uploads into memory
+                uploads = [(file.filename, file.read()) for file in files]
+                
+                # Create zip file of original files
+                zip_data = build_original_zip(uploads)
+                
+                # Process the files (trimmed version if trimming succeeded)
+                pdf_data, _ = process_label_files(uploads)
+                
+                if pdf_data:
+                    files_to_store.append(('labels', pdf_data, 'application/pdf'))
+                files_to_store.append(('originals', zip_data, 'application/zip'))
+        pdf_data = zip_data = uploads = stored_labels = None
+
+        # Total quantity per SKU, validated before touching stock
+        requested = {}
+        for item in items:
+            raw_quantity = item.get('quantity')
+            try:
+                quantity = int(raw_quantity)
+            except (TypeError, ValueError):
+                quantity = 0
+            if quantity <= 0:
+                raise Exception(f"Invalid quantity for SKU {item.get('product_sku')}: {raw_quantity}")
+            item['quantity'] = quantity
+            requested[item['product_sku']] = requested.get(item['product_sku'], 0) + item['quantity']
+        
+        # Reserve stock for every line at once; this is the first write of the transaction
+        reserve_inventory(requested)
 
         db.session.add(new_order)
         db.session.flush()  # Get the order ID
+        record_inventory_movements({sku: -quantity for sku, quantity in requested.items()},
+                                   'order', new_order.order_id)
 
-        # Add order items and prepare items for email
+        # Add order items
         order_items = []
-        email_items = []
+        # The ShipStation payload is stored, so read the catalog version rather than
+        # trust a snapshot that may be a few seconds behind another worker's change
+        products = catalog.snapshot(read_catalog_version())
         
-        # Update inventory quantities
         for item in items:
-            # Get current inventory
-            inventory = db.session.get(InventoryQuantity, item['product_sku'])
-            if not inventory:
-                raise Exception(f"SKU {item['product_sku']} not found in inventory")
-                
-            # Check if we have enough inventory
-            if inventory.quantity < item['quantity']:
-                raise Exception(f"Insufficient inventory for SKU {item['product_sku']}. Available: {inventory.quantity}, Requested: {item['quantity']}")
-                
-            # Update inventory quantity
-            inventory.quantity -= item['quantity']
-            
             # Create OrderItem for database
             order_item = OrderItem(
                 order_id=new_order.order_id,
@@ -634,110 +1618,804 @@ def create_order():
             db.session.add(order_item)
             order_items.append(order_item)
 
-            # Get item details for email
-            item_detail = db.session.get(ItemDetail, item['product_sku'])
-            if item_detail:
-                email_items.append({
-                    'sku': item['product_sku'],
-                    'product': item_detail.product,
-                    'size': item_detail.size,
-                    'flavor': item_detail.flavor,
-                    'quantity': item['quantity']
-                })
-
-        db.session.commit()
-
-        # Get shipping address and item details
+        # Get shipping address
         shipping_address = db.session.get(ShippingAddress, shipping_address_id)
-        print(f"Debug - Shipping Address: {shipping_address.to_dict()}")
         if not shipping_address:
             raise Exception(f"Shipping address with ID {shipping_address_id} not found")
+        print(f"Debug - Shipping Address: {shipping_address.to_dict()}")
 
-        # Create item_details dictionary
-        item_details = {item.sku: item for item in ItemDetail.query.all()}
+        # Only an order that passed validation and reserved its stock writes files, so a
+        # rejected one leaves nothing behind on the uploads volume. The email reads them
+        # back from the store, so the bytes aren't held for the rest of the request.
+        for kind, data, content_type in files_to_store:
+            new_order.add_file(kind, data, content_type)
+        files_to_store = None
+
+        refresh_order_summary(new_order)
+        
+        # Queue the ShipStation order in the same transaction; product details
+        # come from the same catalog snapshot and the outbox worker sends it
+        db.session.add(ShipStationOutbox(
+            order_id=new_order.order_id,
+            payload=json.dumps(build_shipstation_order(new_order, shipping_address, order_items, products))
+        ))
+        # The confirmation email is sent in the background too
+        db.session.add(EmailOutbox(order_id=new_order.order_id))
+        
+        response_body = {"message": "Order created successfully", "order_id": new_order.order_id}
+        if idempotency_key:
+            # Expired keys go first so an old key can be used again
+            IdempotencyKey.query.filter(IdempotencyKey.created_at < datetime.utcnow() - IDEMPOTENCY_KEY_TTL)\
+                .delete(synchronize_session=False)
+            db.session.add(IdempotencyKey(key=idempotency_key, request_hash=request_hash,
+                                          order_id=new_order.order_id, status_code=201,
+                                          response=json.dumps(response_body)))
+        db.session.commit()
+        shipstation_outbox_worker.notify()
+        email_outbox_worker.notify()
+        
+        # The stored labels are now attached to the order
+        if reused_labels:
+            discard_processed_labels(label_token)
 
-        # Send confirmation email with PDF and ZIP attachments
-        try:
-            send_order_confirmation_email(
-                new_order,
-                shipping_address,
-                email_items,
-                pdf_data,
-                zip_data
-            )
-        except Exception as e:
-            print(f"Email error details: {str(e)}")
-            pass
-
-        # Create ShipStation order
-        create_shipstation_order(
-            new_order,
-            shipping_address,
-            order_items,
-            item_details,
-            db
+        return jsonify(response_body), 201
+
+    except IntegrityError as e:
+        # A concurrent request committed this key or PO first; our stock changes roll back with the rest
+        db.session.rollback()
+        replay = replay_idempotent_response(idempotency_key, request_hash) if idempotency_key else None
+        duplicate = replay or duplicate_po_response(purchase_order_number)
+        if duplicate:
+            return duplicate
+        return jsonify({"error": str(e)}), 400
+    except InventoryShortage as e:
+        db.session.rollback()
+        return jsonify({"error": str(e), "shortages": e.shortages}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 400
+
+# ShipStation outbox: delivery runs on a background thread in each process
+SHIPSTATION_OUTBOX_WORKER = os.getenv('SHIPSTATION_OUTBOX_WORKER', 'on') == 'on'
+SHIPSTATION_OUTBOX_MAX_ATTEMPTS = int(os.getenv('SHIPSTATION_OUTBOX_MAX_ATTEMPTS', '8'))
+SHIPSTATION_OUTBOX_BACKOFF_SECONDS = float(os.getenv('SHIPSTATION_OUTBOX_BACKOFF_SECONDS', '30'))
+SHIPSTATION_OUTBOX_MAX_BACKOFF_SECONDS = 3600
+# A claimed entry becomes due again after this long, in case its process died mid-send
+SHIPSTATION_OUTBOX_LEASE_SECONDS = 120
+
+def outbox_backoff(attempts, retry_after=None):
+    """Seconds to wait before the next attempt: exponential with jitter, capped"""
+    delay = min(SHIPSTATION_OUTBOX_BACKOFF_SECONDS * 2 ** (attempts - 1), SHIPSTATION_OUTBOX_MAX_BACKOFF_SECONDS)
+    delay *= random.uniform(0.8, 1.2)
+    if retry_after:
+        delay = max(delay, retry_after)
+    return delay
+
+def claim_due_entries(model, limit):
+    """Lease up to limit due pending rows of an outbox-style table and return their ids
+
+    Each claim is a conditional UPDATE on the next_attempt_at the row had
+    when it was read, so two workers can't both handle the same row.
+    """
+    from sqlalchemy import update
+    now = datetime.utcnow()
+    due = db.session.query(model.id, model.next_attempt_at)\
+        .filter(model.status == 'pending', model.next_attempt_at <= now)\
+        .order_by(model.next_attempt_at).limit(limit).all()
+    claimed = []
+    for entry_id, seen in due:
+        result = db.session.execute(
+            update(model)
+            .where(model.id == entry_id, model.status == 'pending', model.next_attempt_at == seen)
+            .values(next_attempt_at=now + timedelta(seconds=SHIPSTATION_OUTBOX_LEASE_SECONDS),
+                    attempts=model.attempts + 1)
         )
+        if result.rowcount == 1:
+            claimed.append(entry_id)
+    db.session.commit()
+    return claimed
+
+def next_due_in(model):
+    """Seconds until the next pending row of an outbox-style table is due, or None"""
+    from sqlalchemy import func
+    next_due = db.session.query(func.min(model.next_attempt_at)).filter(model.status == 'pending').scalar()
+    if next_due is None:
+        return None
+    return max((next_due - datetime.utcnow()).total_seconds(), 0.05)
+
+def record_failed_attempt(entry, error, description, retryable=None):
+    """Schedule a retry for a claimed row after a failed ShipStation call, or mark it dead
+
+    Unless the caller says otherwise, timeouts, connection errors, throttling
+    and 5xx are worth retrying; other 4xx responses won't change.
+    """
+    response = getattr(error, 'response', None)
+    status_code = response.status_code if response is not None else None
+    if retryable is None:
+        retryable = status_code is None or status_code in (408, 429) or status_code >= 500
+    entry.last_error = f"{status_code}: {response.text[:500]}" if response is not None else str(error)
+    if retryable and entry.attempts < SHIPSTATION_OUTBOX_MAX_ATTEMPTS:
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        delay = outbox_backoff(entry.attempts, float(retry_after) if retry_after and retry_after.isdigit() else None)
+        entry.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay)
+        logging.warning(f"{description} failed (attempt {entry.attempts}), "
+                        f"retrying in {delay:.0f}s: {entry.last_error}")
+    else:
+        entry.status = 'dead'
+        logging.error(f"{description} dead-lettered after {entry.attempts} attempts: {entry.last_error}")
+
+def deliver_outbox_entries(entry_ids):
+    """Post claimed entries through createorders and record each order's outcome
+
+    A failed call counts against every entry in its batch. An order that
+    ShipStation rejects within a successful call is dead-lettered like a
+    4xx; one missing from the results is retried.
+    """
+    entries = {entry.order_id: entry for entry in
+               ShipStationOutbox.query.filter(ShipStationOutbox.id.in_(entry_ids)).all()}
+    payloads = {order_id: json.loads(entry.payload) for order_id, entry in entries.items()}
+    # No transaction is held open while waiting on ShipStation
+    db.session.commit()
+    
+    for order_ids, results, error in post_shipstation_orders(payloads):
+        now = datetime.utcnow()
+        for order_id in order_ids:
+            entry = entries[order_id]
+            description = f"ShipStation order for order {order_id}"
+            result = results.get(order_id)
+            if error is not None:
+                record_failed_attempt(entry, error, description)
+            elif result is None:
+                record_failed_attempt(entry, 'No result returned for this order', description)
+            elif not result.get('success'):
+                record_failed_attempt(entry, result.get('errorMessage') or 'Rejected by ShipStation',
+                                      description, retryable=False)
+            else:
+                entry.status = 'sent'
+                entry.sent_at = now
+                entry.last_error = None
+                if result.get('orderId') is not None:
+                    entry.shipstation_order_id = str(result['orderId'])
+        db.session.commit()
 
-        return jsonify({"message": "Order created successfully"}), 201
+def drain_shipstation_outbox(batch_size=SHIPSTATION_CREATE_BATCH_SIZE):
+    """Deliver due outbox entries; returns seconds until the next one is due, or None"""
+    with app.app_context():
+        entry_ids = claim_due_entries(ShipStationOutbox, batch_size)
+        if entry_ids:
+            deliver_outbox_entries(entry_ids)
+        return 0 if entry_ids else next_due_in(ShipStationOutbox)
+
+def parse_shipstation_date(value):
+    """Parse a ShipStation timestamp into a naive UTC datetime"""
+    # ShipStation sends 7-digit fractions ('2025-07-12T00:00:00.0000000'); Python takes 6
+    value = re.sub(r'\.(\d{6})\d+', r'.\1', value)
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def apply_shipments(ship_dates, source, processing_only=False):
+    """Mark orders Shipped by PO number with one bulk status update
+
+    ship_dates maps PO number to ship date. POs are matched on
+    po_normalized among orders that aren't voided, one unique-index probe
+    each. Orders already Shipped are left alone, so a replayed notification
+    changes nothing; with processing_only so are cancelled ones. Returns
+    the updated order ids and the PO numbers that matched no order.
+    """
+    normalized = {}
+    for po, ship_date in ship_dates.items():
+        key = normalize_po(po)
+        normalized[key] = min(normalized.get(key, ship_date), ship_date)
+    rows = db.session.query(Order.order_id, Order.po_normalized, Order.order_status)\
+        .filter(Order.po_normalized.in_(list(normalized)), Order.order_status != ORDER_VOIDED).all()
+    from_statuses = [ORDER_PROCESSING] if processing_only else [ORDER_PROCESSING, ORDER_CANCELLED]
+    shipped_at = {order_id: normalized[po] for order_id, po, status in rows if status in from_statuses}
+    shipped = []
+    if shipped_at:
+        shipped = set_orders_status(list(shipped_at), ORDER_SHIPPED, source, shipped_at, from_statuses=from_statuses)
+    matched = {po for _, po, _ in rows}
+    return shipped, sorted(po for po in ship_dates if normalize_po(po) not in matched)
+
+def drain_shipstation_webhooks(batch_size=20):
+    """Fetch due webhook resources and apply all their shipments at once
+
+    Returns seconds until the next event is due, or None.
+    """
+    with app.app_context():
+        event_ids = claim_due_entries(ShipStationWebhookEvent, batch_size)
+        if not event_ids:
+            return next_due_in(ShipStationWebhookEvent)
+        resource_urls = dict(db.session.query(ShipStationWebhookEvent.id, ShipStationWebhookEvent.resource_url)
+                             .filter(ShipStationWebhookEvent.id.in_(event_ids)).all())
+        db.session.commit()
+        
+        # Each resource is fetched once; a PO shipped in several fulfillments keeps its first ship date
+        ship_dates = {}
+        fetched = {}
+        for event_id, resource_url in resource_urls.items():
+            try:
+                fulfillments = fetch_shipstation_fulfillments(resource_url)
+            except requests.exceptions.RequestException as e:
+                record_failed_attempt(db.session.get(ShipStationWebhookEvent, event_id), e,
+                                      f"ShipStation webhook {event_id}")
+                continue
+            purchase_order_numbers = set()
+            for fulfillment in fulfillments:
+                po = fulfillment.get('orderNumber')
+                try:
+                    ship_date = parse_shipstation_date(fulfillment.get('shipDate') or '')
+                except ValueError:
+                    ship_date = None
+                if not po or not ship_date:
+                    logging.warning(f"Skipping fulfillment without order number or ship date: {fulfillment}")
+                    continue
+                ship_dates[po] = min(ship_dates.get(po, ship_date), ship_date)
+                purchase_order_numbers.add(po)
+            fetched[event_id] = (len(fulfillments), purchase_order_numbers)
+        
+        updated, unmatched = apply_shipments(ship_dates, 'webhook') if ship_dates else ([], [])
+        if unmatched:
+            logging.warning(f"Shipped POs with no matching order: {unmatched}")
+        now = datetime.utcnow()
+        for event_id, (count, purchase_order_numbers) in fetched.items():
+            event = db.session.get(ShipStationWebhookEvent, event_id)
+            missing = sorted(purchase_order_numbers.intersection(unmatched))
+            event.status = 'processed'
+            event.processed_at = now
+            event.fulfillments = count
+            event.unmatched = json.dumps(missing) if missing else None
+            event.last_error = None
+        db.session.commit()
+        logging.info(f"Applied {len(ship_dates)} shipments from {len(fetched)} webhooks, updated {len(updated)} orders")
+        return 0
+
+# Reconciliation catches shipments whose webhook never arrived; 0 turns it off
+SHIPSTATION_RECONCILE_INTERVAL_SECONDS = float(os.getenv('SHIPSTATION_RECONCILE_INTERVAL_SECONDS', '900'))
+SHIPSTATION_RECONCILE_LOOKBACK_DAYS = int(os.getenv('SHIPSTATION_RECONCILE_LOOKBACK_DAYS', '30'))
+# Re-read a little before the watermark in case ShipStation was still paging through changes
+SHIPSTATION_RECONCILE_OVERLAP = timedelta(minutes=10)
+
+def reconcile_shipstation_orders():
+    """Mark Processing orders Shipped from ShipStation's shipped orders since the watermark
+
+    Each page (up to 500 ShipStation orders) is applied in one transaction
+    with one lookup by PO number and one bulk status update, and the
+    watermark moves forward in that same transaction, so an interrupted run
+    resumes where it stopped. Returns a summary of the run.
+    """
+    state = db.session.get(SyncWatermark, SHIPSTATION_RECONCILE)
+    if state.watermark:
+        since = state.watermark - SHIPSTATION_RECONCILE_OVERLAP
+    else:
+        since = datetime.utcnow() - timedelta(days=SHIPSTATION_RECONCILE_LOOKBACK_DAYS)
+    db.session.commit()
+    
+    summary = {'since': since.isoformat(), 'pages': 0, 'shipments': 0, 'updated': 0, 'unmatched': 0}
+    for shipped_orders in iter_shipped_orders(since):
+        ship_dates = {}
+        newest = None
+        for shipped in shipped_orders:
+            po = shipped.get('orderNumber')
+            try:
+                ship_date = parse_shipstation_date(shipped.get('shipDate') or '')
+                modified = parse_shipstation_date(shipped.get('modifyDate') or '')
+            except ValueError:
+                logging.warning(f"Skipping ShipStation order with unreadable dates: {po}")
+                continue
+            if po:
+                ship_dates[po] = min(ship_dates.get(po, ship_date), ship_date)
+            newest = modified if newest is None else max(newest, modified)
+        
+        updated, unmatched = apply_shipments(ship_dates, 'reconcile', processing_only=True) if ship_dates else ([], [])
+        state = db.session.get(SyncWatermark, SHIPSTATION_RECONCILE)
+        if newest and (state.watermark is None or newest > state.watermark):
+            state.watermark = newest
+        db.session.commit()
+        
+        summary['pages'] += 1
+        summary['shipments'] += len(shipped_orders)
+        summary['updated'] += len(updated)
+        summary['unmatched'] += len(unmatched)
+    
+    state = db.session.get(SyncWatermark, SHIPSTATION_RECONCILE)
+    state.last_run_at = datetime.utcnow()
+    state.last_result = json.dumps(summary)
+    db.session.commit()
+    if summary['updated']:
+        logging.info(f"ShipStation reconciliation marked {summary['updated']} orders shipped")
+    return summary
+
+def run_due_shipstation_reconcile():
+    """Run the reconciler if it is due and this process wins the run
+
+    Returns seconds until the next run is due.
+    """
+    from sqlalchemy import update
+    with app.app_context():
+        now = datetime.utcnow()
+        claimed = db.session.execute(
+            update(SyncWatermark)
+            .where(SyncWatermark.name == SHIPSTATION_RECONCILE, SyncWatermark.next_run_at <= now)
+            .values(next_run_at=now + timedelta(seconds=SHIPSTATION_RECONCILE_INTERVAL_SECONDS))
+        ).rowcount
+        db.session.commit()
+        if claimed:
+            try:
+                reconcile_shipstation_orders()
+            except requests.exceptions.RequestException as e:
+                db.session.rollback()
+                logging.error(f"ShipStation reconciliation failed: {e}")
+                state = db.session.get(SyncWatermark, SHIPSTATION_RECONCILE)
+                state.last_run_at = datetime.utcnow()
+                state.last_result = json.dumps({'error': str(e)})
+                db.session.commit()
+        next_run_at = db.session.query(SyncWatermark.next_run_at)\
+            .filter(SyncWatermark.name == SHIPSTATION_RECONCILE).scalar()
+        return max((next_run_at - datetime.utcnow()).total_seconds(), 1)
+
+shipstation_outbox_worker = OutboxWorker(drain_shipstation_outbox)
+shipstation_webhook_worker = OutboxWorker(drain_shipstation_webhooks)
+shipstation_reconcile_worker = OutboxWorker(run_due_shipstation_reconcile, idle_interval=60)
+
+# Confirmation emails: sent on a background thread in each process
+EMAIL_OUTBOX_WORKER = os.getenv('EMAIL_OUTBOX_WORKER', 'on') == 'on'
+# Where email recipients download attachments too large to send inline
+EMAIL_LINK_BASE_URL = os.getenv('EMAIL_LINK_BASE_URL', 'https://gymmolly.bodytools.work').rstrip('/')
+# How long an emailed download link keeps working
+EMAIL_LINK_TTL_DAYS = int(os.getenv('EMAIL_LINK_TTL_DAYS', '30'))
+EMAIL_LINK_SECRET = os.getenv('EMAIL_LINK_SECRET') or app.config['SECRET_KEY']
+EMAIL_ATTACHMENTS = {
+    # kind: file name
+    'labels': 'shipping_labels_PO_{po}.pdf',
+    'originals': 'original_labels_PO_{po}.zip'
+}
+
+def sign_email_link(order_id, kind, sha256, expires):
+    """HMAC binding a download link to one stored file and its expiry time"""
+    message = f"{order_id}|{kind}|{sha256}|{expires}".encode()
+    return hmac.new(EMAIL_LINK_SECRET.encode(), message, hashlib.sha256).hexdigest()
+
+def email_link_url(order_id, kind, sha256):
+    """Signed, expiring URL for an order file, for recipients who aren't logged in"""
+    expires = int((datetime.now(timezone.utc) + timedelta(days=EMAIL_LINK_TTL_DAYS)).timestamp())
+    signature = sign_email_link(order_id, kind, sha256, expires)
+    return (f"{EMAIL_LINK_BASE_URL}/api/email-files/{order_id}/{kind}"
+            f"?sha256={sha256}&expires={expires}&signature={signature}")
+
+def deliver_order_email(entry_id):
+    """Build and send one claimed confirmation email and record the outcome
+
+    Only file metadata is loaded here; sendemail reads each attachment from
+    the store while building the message, so memory per email is bounded by
+    EMAIL_INLINE_ATTACHMENT_MAX_BYTES rather than the size of the uploads.
+    """
+    entry = db.session.get(EmailOutbox, entry_id)
+    order = db.session.get(Order, entry.order_id) if entry else None
+    if not order:
+        return
+    shipping_address = db.session.get(ShippingAddress, order.shipping_address_id)
+    products = catalog.snapshot(read_catalog_version())
+    items = []
+    for order_item in OrderItem.query.filter_by(order_id=order.order_id).order_by(OrderItem.id).all():
+        product = products.get(order_item.product_sku)
+        if product:
+            items.append({
+                'sku': order_item.product_sku,
+                'product': product.product,
+                'size': product.size,
+                'flavor': product.flavor,
+                'quantity': order_item.quantity
+            })
+    attachments = []
+    for record in OrderFile.query.filter_by(order_id=order.order_id).order_by(OrderFile.id).all():
+        if record.kind not in EMAIL_ATTACHMENTS:
+            continue
+        attachments.append({
+            'file_name': EMAIL_ATTACHMENTS[record.kind].format(po=order.purchase_order_number),
+            'content_type': record.content_type,
+            'sha256': record.sha256,
+            'size': record.size,
+            'url': email_link_url(order.order_id, record.kind, record.sha256)
+        })
+    # No transaction is held open while waiting on SendGrid
+    db.session.commit()
+    
+    try:
+        send_order_confirmation_email(order, shipping_address, items, attachments)
+    except Exception as e:
+        # SendGrid errors carry status_code; a 4xx other than throttling won't succeed on retry
+        status_code = getattr(e, 'status_code', None)
+        retryable = status_code is None or status_code in (408, 429) or status_code >= 500
+        record_failed_attempt(entry, e, f"Confirmation email for order {order.order_id}", retryable=retryable)
+    else:
+        entry.status = 'sent'
+        entry.sent_at = datetime.utcnow()
+        entry.last_error = None
+    db.session.commit()
 
+def drain_email_outbox(batch_size=10):
+    """Send due confirmation emails; returns seconds until the next one is due, or None"""
+    with app.app_context():
+        entry_ids = claim_due_entries(EmailOutbox, batch_size)
+        for entry_id in entry_ids:
+            deliver_order_email(entry_id)
+        return 0 if entry_ids else next_due_in(EmailOutbox)
+
+email_outbox_worker = OutboxWorker(drain_email_outbox)
+
+@app.before_request
+def start_background_workers():
+    # Started from a request so only serving processes run them, not scripts importing main
+    if SHIPSTATION_OUTBOX_WORKER:
+        shipstation_outbox_worker.start()
+        shipstation_webhook_worker.start()
+        if SHIPSTATION_RECONCILE_INTERVAL_SECONDS > 0:
+            shipstation_reconcile_worker.start()
+    if EMAIL_OUTBOX_WORKER:
+        email_outbox_worker.start()
+
+@app.route('/api/email/outbox', methods=['GET'])
+@login_required
+def get_email_outbox():
+    """Confirmation emails, newest first; ?status=pending|sent|dead (default: everything not sent)"""
+    try:
+        status = request.args.get('status')
+        limit = min(max(request.args.get('limit', 100, type=int), 1), 500)
+        query = EmailOutbox.query
+        if status:
+            query = query.filter(EmailOutbox.status == status)
+        else:
+            query = query.filter(EmailOutbox.status != 'sent')
+        entries = query.order_by(EmailOutbox.id.desc()).limit(limit).all()
+        return jsonify([entry.to_dict() for entry in entries]), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/email/outbox/<int:entry_id>/retry', methods=['POST'])
+@login_required
+def retry_email_outbox(entry_id):
+    """Put a dead (or waiting) email back in the queue for an immediate attempt"""
+    try:
+        entry = db.session.get(EmailOutbox, entry_id)
+        if not entry:
+            return jsonify({"error": "Email not found"}), 404
+        if entry.status == 'sent':
+            return jsonify({"error": "Email was already sent"}), 400
+        entry.status = 'pending'
+        entry.attempts = 0
+        entry.next_attempt_at = datetime.utcnow()
+        db.session.commit()
+        email_outbox_worker.notify()
+        return jsonify(entry.to_dict()), 200
     except Exception as e:
         db.session.rollback()
-        return jsonify({"error": str(e)}), 400
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/shipstation/reconcile', methods=['GET'])
+@login_required
+def get_shipstation_reconcile():
+    """Watermark, schedule and last result of the ShipStation reconciler"""
+    try:
+        return jsonify(db.session.get(SyncWatermark, SHIPSTATION_RECONCILE).to_dict()), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/shipstation/reconcile', methods=['POST'])
+@login_required
+def run_shipstation_reconcile():
+    """Make the reconciler due now; a background worker picks it up"""
+    try:
+        state = db.session.get(SyncWatermark, SHIPSTATION_RECONCILE)
+        state.next_run_at = datetime.utcnow()
+        db.session.commit()
+        shipstation_reconcile_worker.notify()
+        return jsonify({"message": "Reconciliation queued"}), 202
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/shipstation/outbox', methods=['GET'])
+@login_required
+def get_shipstation_outbox():
+    """Outbox entries, newest first; ?status=pending|sent|dead (default: everything not sent)"""
+    try:
+        status = request.args.get('status')
+        limit = min(max(request.args.get('limit', 100, type=int), 1), 500)
+        query = ShipStationOutbox.query
+        if status:
+            query = query.filter(ShipStationOutbox.status == status)
+        else:
+            query = query.filter(ShipStationOutbox.status != 'sent')
+        entries = query.order_by(ShipStationOutbox.id.desc()).limit(limit).all()
+        return jsonify([entry.to_dict() for entry in entries]), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/shipstation/outbox/<int:entry_id>/retry', methods=['POST'])
+@login_required
+def retry_shipstation_outbox(entry_id):
+    """Put a dead (or waiting) entry back in the queue for an immediate attempt"""
+    try:
+        entry = db.session.get(ShipStationOutbox, entry_id)
+        if not entry:
+            return jsonify({"error": "Outbox entry not found"}), 404
+        if entry.status == 'sent':
+            return jsonify({"error": "Entry was already sent"}), 400
+        entry.status = 'pending'
+        entry.attempts = 0
+        entry.next_attempt_at = datetime.utcnow()
+        db.session.commit()
+        shipstation_outbox_worker.notify()
+        return jsonify(entry.to_dict()), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/shipstation/outbox/retry', methods=['POST'])
+@login_required
+def retry_shipstation_outbox_entries():
+    """Requeue many unsent entries at once, e.g. after an outage
+
+    Takes optional JSON {"ids": [...], "rebuild": true}. Without ids every
+    dead entry is requeued. With rebuild the payloads are rebuilt from the
+    orders as they stand now, so corrected addresses or products go out.
+    The worker then sends them through createorders in batches.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        query = ShipStationOutbox.query.filter(ShipStationOutbox.status != 'sent')
+        if data.get('ids'):
+            query = query.filter(ShipStationOutbox.id.in_(data['ids']))
+        else:
+            query = query.filter(ShipStationOutbox.status == 'dead')
+        entries = query.all()
+        
+        if entries and data.get('rebuild'):
+            orders = Order.query.filter(Order.order_id.in_([entry.order_id for entry in entries])).all()
+            addresses = {address.id: address for address in ShippingAddress.query.filter(
+                ShippingAddress.id.in_({order.shipping_address_id for order in orders})).all()}
+            order_items = {}
+            for item in OrderItem.query.filter(OrderItem.order_id.in_([order.order_id for order in orders])).all():
+                order_items.setdefault(item.order_id, []).append(item)
+            payloads = build_shipstation_orders(orders, addresses, order_items,
+                                                catalog.snapshot(read_catalog_version()))
+            for entry in entries:
+                if entry.order_id in payloads:
+                    entry.payload = json.dumps(payloads[entry.order_id])
+        
+        now = datetime.utcnow()
+        for entry in entries:
+            entry.status = 'pending'
+            entry.attempts = 0
+            entry.next_attempt_at = now
+        db.session.commit()
+        shipstation_outbox_worker.notify()
+        return jsonify({"requeued": len(entries)}), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+
+def send_order_file(order_id, kind, download_name, sha256=None):
+    """Serve a stored order file from disk with ETag and Range support"""
+    query = OrderFile.query.filter_by(order_id=order_id, kind=kind)
+    if sha256:
+        query = query.filter_by(sha256=sha256)
+    record = query.first()
+    location = attachment_store.locate(record.sha256) if record else None
+    if not location:
+        return jsonify({'error': 'No attachment found'}), 404
+    path, compressed = location
+    
+    if not compressed:
+        # Zero-copy: Werkzeug answers If-None-Match with 304 and Range with 206
+        return send_file(
+            path,
+            mimetype=record.content_type,
+            as_attachment=True,
+            download_name=download_name,
+            conditional=True,
+            etag=record.sha256
+        )
+    
+    if 'gzip' in request.accept_encodings:
+        # Hand the compressed file straight to the client
+        response = send_file(
+            path,
+            mimetype=record.content_type,
+            as_attachment=True,
+            download_name=download_name,
+            conditional=True,
+            etag=f"{record.sha256}.gz"
+        )
+        response.headers['Content-Encoding'] = 'gzip'
+        response.vary.add('Accept-Encoding')
+        return response
+    
+    # Client can't take gzip: stream it decompressed
+    if request.if_none_match.contains(record.sha256):
+        response = app.response_class(status=304)
+        response.set_etag(record.sha256)
+        return response
+    response = app.response_class(attachment_store.iter_chunks(record.sha256), mimetype=record.content_type)
+    response.set_etag(record.sha256)
+    response.headers['Content-Disposition'] = f'attachment; filename={download_name}'
+    response.vary.add('Accept-Encoding')
+    return response
 
 # Add this route for downloading attachments
 @app.route('/api/orders/<int:order_id>/attachment', methods=['GET'])
+@login_required
 def get_order_attachment(order_id):
     try:
+        return send_order_file(order_id, 'labels', f'order_{order_id}_attachment.pdf')
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/orders/<int:order_id>/originals', methods=['GET'])
+@login_required
+def get_order_originals(order_id):
+    """Download the ZIP of the label files originally uploaded with the order"""
+    try:
+        return send_order_file(order_id, 'originals', f'order_{order_id}_original_labels.zip')
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/email-files/<int:order_id>/<kind>', methods=['GET'])
+def get_email_file(order_id, kind):
+    """Download an order file through a signed link from a confirmation email"""
+    try:
+        sha256 = request.args.get('sha256', '')
+        signature = request.args.get('signature', '')
+        try:
+            expires = int(request.args.get('expires', ''))
+        except ValueError:
+            return jsonify({'error': 'Invalid download link'}), 403
+        if kind not in EMAIL_ATTACHMENTS or \
+                not hmac.compare_digest(signature, sign_email_link(order_id, kind, sha256, expires)):
+            return jsonify({'error': 'Invalid download link'}), 403
+        if expires < datetime.now(timezone.utc).timestamp():
+            return jsonify({'error': 'This download link has expired'}), 410
         order = db.session.get(Order, order_id)
         if not order:
             return jsonify({'error': 'No attachment found'}), 404
-            
-        return send_file(
-            io.BytesIO(order.attachment),
-            mimetype='application/pdf',  # Adjust mimetype based on your attachment type
-            as_attachment=True,
-            download_name=f'order_{order_id}_attachment.pdf'  # Adjust file extension based on your attachment type
-        )
+        download_name = EMAIL_ATTACHMENTS[kind].format(po=order.purchase_order_number)
+        return send_order_file(order_id, kind, download_name, sha256=sha256)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 # Add this new route for getting orders
+ORDERS_PAGE_SIZE = 100
+ORDERS_MAX_PAGE_SIZE = 500
+
+def encode_orders_cursor(created_at, order_id):
+    """Opaque cursor pointing just past an order in (created_at, order_id) DESC order"""
+    raw = f"{created_at.isoformat()}|{order_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_orders_cursor(cursor):
+    """Return (created_at, order_id) for a cursor, raising ValueError if malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, order_id = raw.rsplit('|', 1)
+        return datetime.fromisoformat(created_at), int(order_id)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+def parse_date_param(name, end_of_day=False):
+    """Parse an ISO date or datetime query parameter; bare dates cover the whole day"""
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Invalid {name}: expected an ISO date such as 2025-01-31")
+    if end_of_day and len(value) == 10:
+        parsed = parsed.replace(hour=23, minute=59, second=59, microsecond=999999)
+    return parsed
+
 @app.route('/api/orders', methods=['GET'])
 def get_orders():
+    """List orders newest first, one page at a time
+
+    Query parameters:
+        limit: page size (default 100, max 500)
+        cursor: value of X-Next-Cursor from the previous page
+        status: order status, may be repeated or comma-separated
+        created_from / created_to: ISO dates, inclusive
+        shipped_from / shipped_to: ISO dates, inclusive; only shipped orders
+        po: purchase order number (case-insensitive prefix match)
+        shipping_address_id: only orders shipped to this address
+
+    The body is a JSON array of orders; when more pages exist the cursor
+    for the next one is returned in the X-Next-Cursor header.
+    """
     try:
-        # Use eager loading to fetch all related data in a single query
-        from sqlalchemy.orm import joinedload
+        from sqlalchemy import or_, and_
         
-        orders = Order.query.options(
-            joinedload(Order.items).joinedload(OrderItem.product_detail),
-            joinedload(Order.shipping_address)
-        ).all()
+        try:
+            limit = min(max(int(request.args.get('limit', ORDERS_PAGE_SIZE)), 1), ORDERS_MAX_PAGE_SIZE)
+            created_from = parse_date_param('created_from')
+            created_to = parse_date_param('created_to', end_of_day=True)
+            shipped_from = parse_date_param('shipped_from')
+            shipped_to = parse_date_param('shipped_to', end_of_day=True)
+            shipping_address_id = request.args.get('shipping_address_id', type=int)
+            cursor = request.args.get('cursor')
+            after = decode_orders_cursor(cursor) if cursor else None
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        # Read plain columns from the summary table; each row already holds the
+        # order's JSON, so no ORM objects are built and nothing is re-serialized
+        query = db.session.query(OrderSummary.created_at, OrderSummary.order_id, OrderSummary.data)
+        
+        statuses = [s.strip() for value in request.args.getlist('status') for s in value.split(',') if s.strip()]
+        if statuses:
+            query = query.filter(OrderSummary.order_status.in_(statuses))
+        if created_from:
+            query = query.filter(OrderSummary.created_at >= created_from)
+        if created_to:
+            query = query.filter(OrderSummary.created_at <= created_to)
+        if shipped_from:
+            query = query.filter(OrderSummary.shipped_at >= shipped_from)
+        if shipped_to:
+            query = query.filter(OrderSummary.shipped_at <= shipped_to)
+        po = request.args.get('po', '').strip()
+        if po:
+            escaped = po.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            query = query.filter(OrderSummary.purchase_order_number.ilike(f"{escaped}%", escape='\\'))
+        if shipping_address_id:
+            query = query.filter(OrderSummary.shipping_address_id == shipping_address_id)
+        
+        # Keyset pagination: seek past the last row of the previous page instead
+        # of using OFFSET, so every page is an index range scan on
+        # idx_order_summaries_created_at (or the status/address variants)
+        if after:
+            after_created_at, after_order_id = after
+            query = query.filter(or_(
+                OrderSummary.created_at < after_created_at,
+                and_(OrderSummary.created_at == after_created_at, OrderSummary.order_id < after_order_id)
+            ))
+        
+        # Fetch one extra row to learn whether another page exists
+        rows = query.order_by(OrderSummary.created_at.desc(), OrderSummary.order_id.desc())\
+            .limit(limit + 1).all()
+        
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        
+        response = app.response_class('[' + ','.join(row.data for row in rows) + ']',
+                                      mimetype='application/json')
+        if has_more:
+            response.headers['X-Next-Cursor'] = encode_orders_cursor(rows[-1].created_at, rows[-1].order_id)
+        return response, 200
         
-        orders_data = []
-        for order in orders:
-            items = []
-            for item in order.items:
-                items.append({
-                    'sku': item.product_sku,
-                    'product': item.product_detail.product,
-                    'size': item.product_detail.size,
-                    'flavor': item.product_detail.flavor,
-                    'quantity': item.quantity
-                })
-            
-            order_data = {
-                'order_id': order.order_id,
-                'created_at': order.created_at,
-                'purchase_order_number': order.purchase_order_number,
-                'shipping_address': order.shipping_address.to_dict(),
-                'items': items,
-                'has_attachment': order.attachment is not None,
-                'shipping_method': order.shipping_method,
-                'order_status': order.order_status
-            }
-            orders_data.append(order_data)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/orders/<int:order_id>/status-history', methods=['GET'])
+@login_required
+def get_order_status_history(order_id):
+    """Status transitions for one order, oldest first"""
+    try:
+        if not db.session.get(Order, order_id):
+            return jsonify({"error": "Order not found"}), 404
+        changes = OrderStatusChange.query.filter_by(order_id=order_id)\
+            .order_by(OrderStatusChange.id).all()
+        return jsonify([change.to_dict() for change in changes]), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/orders/<int:order_id>', methods=['GET'])
+def get_order(order_id):
+    try:
+        data = db.session.query(OrderSummary.data).filter(OrderSummary.order_id == order_id).scalar()
+        if data is None:
+            return jsonify({"error": "Order not found"}), 404
         
-        return jsonify(orders_data), 200
+        return app.response_class(data, mimetype='application/json'), 200
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -751,59 +2429,86 @@ def process_shipping_labels():
 
         files = request.files.getlist('files')
         
-        # Create a temporary directory to store uploaded files
-        with tempfile.TemporaryDirectory() as temp_dir:
-            # Save uploaded files to temp directory
-            saved_files = []
-            for file in files:
-                if file.filename:
-                    file_path = os.path.join(temp_dir, file.filename)
-                    file.save(file_path)
-                    saved_files.append(file_path)
-            
-            if not saved_files:
-                return jsonify({"error": "No valid files uploaded"}), 400
-            
-            # Process the files using your existing script
-            output_path = os.path.join(temp_dir, "processed_labels.pdf")
-            
-            try:
-                total_pages = process_files(temp_dir, output_path)
-                
-                # Try to read the trimmed version first
-                trimmed_path = output_path.replace('.pdf', '_trimmed.pdf')
-                if os.path.exists(trimmed_path):
-                    with open(trimmed_path, 'rb') as f:
-                        processed_content = f.read()
-                    print(f"Using trimmed PDF: {trimmed_path}")
-                else:
-                    # Fall back to original if trimmed doesn't exist
-                    with open(output_path, 'rb') as f:
-                        processed_content = f.read()
-                    print(f"Trimmed PDF not found, using original: {output_path}")
-            except Exception as process_error:
-                print(f"Label processing failed: {process_error}")
-                # If processing fails, just use the original files
-                # This allows testing with non-shipping-label PDFs
-                processed_content = b"dummy_processed_content"
-                total_pages = len(saved_files)
+        # Read uploaded files into memory
+        uploads = [(file.filename, file.read()) for file in files if file.filename]
+        
+        if not uploads:
+            return jsonify({"error": "No valid files uploaded"}), 400
+        
+        # Clients that ask for application/pdf (or ?format=pdf) get the processed
+        # PDF once as the body instead of a copy per file inside the JSON
+        wants_pdf = request.args.get('format') == 'pdf' or \
+            request.accept_mimetypes.best_match(['application/json', 'application/pdf']) == 'application/pdf'
+        processed_files = [{"name": file.filename, "type": file.content_type} for file in files if file.filename]
+        
+        label_token = None
+        processed = False
+        try:
+            # Process the files in memory (trimmed version if trimming succeeded)
+            processed_content, total_pages = process_label_files(uploads)
+            if processed_content is None:
+                raise ValueError("No image (PNG/JPG/JPEG) or PDF files found")
             
-            # Return the processed files data
-            return jsonify({
-                "message": f"Successfully processed {total_pages} labels",
-                "processedFiles": [{
-                    "name": file.filename,
-                    "content": processed_content.decode('latin1'),  # Convert bytes to string for JSON
-                    "type": file.content_type
-                } for file in files if file.filename]
-            })
+            # Keep the result so /api/orders can attach it without reprocessing
+            label_token = store_processed_labels(processed_content, build_original_zip(uploads))
+            processed = True
+        except Exception as process_error:
+            print(f"Label processing failed: {process_error}")
+            # If processing fails, just use the original files
+            # This allows testing with non-shipping-label PDFs
+            processed_content = b"dummy_processed_content"
+            total_pages = len(uploads)
+        
+        if wants_pdf:
+            if not processed:
+                # Nothing worth sending; report the files without a body
+                return jsonify({
+                    "message": f"Successfully processed {total_pages} labels",
+                    "label_token": None,
+                    "processedFiles": processed_files
+                })
             
+            # Per-file metadata goes in headers so the body is just the PDF
+            response = send_file(
+                io.BytesIO(processed_content),
+                mimetype='application/pdf',
+                download_name='processed_labels.pdf'
+            )
+            response.headers['X-Label-Token'] = label_token or ''
+            response.headers['X-Label-Pages'] = str(total_pages)
+            response.headers['X-Label-Files'] = json.dumps(processed_files)
+            return response
+        
+        # Return the processed files data
+        return jsonify({
+            "message": f"Successfully processed {total_pages} labels",
+            "label_token": label_token,
+            "processedFiles": [{
+                "name": file.filename,
+                "content": processed_content.decode('latin1'),  # Convert bytes to string for JSON
+                "type": file.content_type
+            } for file in files if file.filename]
+        })
     except Exception as e:
         import traceback
         error_details = traceback.format_exc()
         print(f"Error processing labels: {error_details}")
         return jsonify({"error": f"Failed to process shipping labels: {str(e)}"}), 400
 
+# Label cache statistics
+@app.route('/api/label-cache/stats', methods=['GET'])
+@login_required
+def get_label_cache_stats():
+    """Hit/miss counters for this worker and on-disk size of the label cache"""
+    return jsonify(label_cache.stats()), 200
+
+# ShipStation client statistics
+@app.route('/api/shipstation/client-stats', methods=['GET'])
+@login_required
+def get_shipstation_client_stats():
+    """Per-endpoint ShipStation call latency and rate limiter state for this worker"""
+    return jsonify(shipstation.stats()), 200
+
 # Add new void order endpoint
 @app.route('/api/orders/<int:order_id>/void', methods=['POST'])
 def void_order(order_id):
@@ -812,7 +2517,7 @@ def void_order(order_id):
         if not order:
             return jsonify({"error": "Order not found"}), 404
             
-        if order.order_status != 'Processing':
+        if order.order_status != ORDER_PROCESSING:
             return jsonify({
                 "error": f"Cannot void order in {order.order_status} status"
             }), 400
@@ -820,19 +2525,18 @@ def void_order(order_id):
         # Start transaction
         db.session.begin_nested()
         
+        # Update order status, unless a concurrent request already moved it
+        if not set_orders_status([order_id], ORDER_VOIDED, 'void', from_statuses=[ORDER_PROCESSING]):
+            db.session.rollback()
+            return jsonify({"error": "Cannot void order: it is no longer Processing"}), 400
+        
         # Return items to inventory
-        for order_item in OrderItem.query.filter_by(order_id=order_id).all():
-            inventory = db.session.get(InventoryQuantity, order_item.product_sku)
-            if inventory:
-                inventory.quantity += order_item.quantity
-            else:
-                db.session.rollback()
-                return jsonify({
-                    "error": f"Inventory record not found for SKU: {order_item.product_sku}"
-                }), 400
+        try:
+            restock_orders([order_id], 'void')
+        except LookupError as e:
+            db.session.rollback()
+            return jsonify({"error": str(e)}), 400
         
-        # Update order status
-        order.order_status = 'Voided'
         db.session.commit()
         
         return jsonify({"message": "Order voided successfully"}), 200
@@ -850,7 +2554,7 @@ def delete_order(order_id):
             return jsonify({"error": "Order not found"}), 404
         
         # Allow deletion of voided and shipped orders
-        if order.order_status not in ['Voided', 'Shipped'] and not order.order_status.startswith('SHIPPED'):
+        if order.order_status not in (ORDER_VOIDED, ORDER_SHIPPED):
             return jsonify({
                 "error": f"Cannot delete order in {order.order_status} status. Only voided or shipped orders can be deleted."
             }), 400
@@ -859,29 +2563,37 @@ def delete_order(order_id):
         db.session.begin_nested()
         
         try:
+            # Claim the order so an overlapping delete can't restock it a second time
+            claimed = claim_orders([order_id], (ORDER_VOIDED, ORDER_SHIPPED))
+            if not claimed:
+                db.session.rollback()
+                return jsonify({"error": "Cannot delete order: it was changed or deleted by another request"}), 400
+            inventory_restored = claimed[order_id] == ORDER_SHIPPED
+            
             # For shipped orders, restore inventory (voided orders already had inventory restored)
-            if order.order_status == 'Shipped' or order.order_status.startswith('SHIPPED'):
-                for order_item in OrderItem.query.filter_by(order_id=order_id).all():
-                    inventory = db.session.get(InventoryQuantity, order_item.product_sku)
-                    if inventory:
-                        inventory.quantity += order_item.quantity
-                        logging.info(f"Restored {order_item.quantity} units of {order_item.product_sku} to inventory")
-                    else:
-                        db.session.rollback()
-                        return jsonify({
-                            "error": f"Cannot delete order: Inventory record not found for SKU: {order_item.product_sku}"
-                        }), 400
+            if inventory_restored:
+                try:
+                    restock_orders([order_id], 'delete')
+                    logging.info(f"Restored inventory for deleted order {order_id}")
+                except LookupError as e:
+                    db.session.rollback()
+                    return jsonify({
+                        "error": f"Cannot delete order: {e}"
+                    }), 400
             
-            # Delete order items first (foreign key constraint)
+            # Delete order items, file references, the summary and status history first (foreign key constraint)
             OrderItem.query.filter_by(order_id=order_id).delete()
+            OrderFile.query.filter_by(order_id=order_id).delete()
+            OrderSummary.query.filter_by(order_id=order_id).delete()
+            OrderStatusChange.query.filter_by(order_id=order_id).delete()
+            ShipStationOutbox.query.filter_by(order_id=order_id).delete()
+            IdempotencyKey.query.filter_by(order_id=order_id).delete()
+            EmailOutbox.query.filter_by(order_id=order_id).delete()
             
             # Delete the order
             db.session.delete(order)
             db.session.commit()
             
-            # Determine if inventory was restored
-            inventory_restored = order.order_status == 'Shipped' or order.order_status.startswith('SHIPPED')
-            
             return jsonify({
                 "message": f"Order {order.purchase_order_number} deleted successfully",
                 "inventory_restored": inventory_restored
@@ -895,6 +2607,9 @@ def delete_order(order_id):
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
 
+# Statuses an admin can set by hand, as the frontend names them
+MANUAL_ORDER_STATUSES = {'Shipped': ORDER_SHIPPED, 'Manually Cancelled': ORDER_CANCELLED}
+
 # Add order status update endpoint
 @app.route('/api/orders/<int:order_id>/update-status', methods=['PUT'])
 def update_order_status(order_id):
@@ -908,20 +2623,9 @@ def update_order_status(order_id):
         if not new_status:
             return jsonify({"error": "Status is required"}), 400
             
-        if new_status not in ['Shipped', 'Manually Cancelled']:
+        if new_status not in MANUAL_ORDER_STATUSES:
             return jsonify({"error": "Invalid status. Must be 'Shipped' or 'Manually Cancelled'"}), 400
             
-        # Format status for display
-        if new_status == 'Manually Cancelled':
-            display_status = 'MANUALLY\nCANCELLED'
-        elif new_status == 'Shipped':
-            # Format shipped date as MM/DD/YY
-            from datetime import datetime
-            today = datetime.now()
-            display_status = f"SHIPPED\n{today.strftime('%m/%d/%y')}"
-        else:
-            display_status = new_status
-            
         # Verify password
         if password != 'GREGS':
             return jsonify({"error": "Invalid password"}), 401
@@ -932,29 +2636,26 @@ def update_order_status(order_id):
             return jsonify({"error": "Order not found"}), 404
             
         # Check current status
-        if order.order_status != 'Processing':
+        if order.order_status != ORDER_PROCESSING:
             return jsonify({
                 "error": f"Cannot update order in {order.order_status} status. Only Processing orders can be updated."
             }), 400
             
+        # Update order status, unless a concurrent request already moved it
+        if not set_orders_status([order_id], MANUAL_ORDER_STATUSES[new_status], 'manual',
+                                 from_statuses=[ORDER_PROCESSING]):
+            db.session.rollback()
+            return jsonify({"error": "Cannot update order: it is no longer Processing"}), 400
+        
         # Handle Manually Cancelled status (replenish inventory like void)
         if new_status == 'Manually Cancelled':
-            # Start transaction
-            db.session.begin_nested()
-            
             # Return items to inventory
-            for order_item in OrderItem.query.filter_by(order_id=order_id).all():
-                inventory = db.session.get(InventoryQuantity, order_item.product_sku)
-                if inventory:
-                    inventory.quantity += order_item.quantity
-                else:
-                    db.session.rollback()
-                    return jsonify({
-                        "error": f"Inventory record not found for SKU: {order_item.product_sku}"
-                    }), 400
+            try:
+                restock_orders([order_id], 'cancel')
+            except LookupError as e:
+                db.session.rollback()
+                return jsonify({"error": str(e)}), 400
         
-        # Update order status
-        order.order_status = display_status
         db.session.commit()
         
         action = "cancelled and inventory replenished" if new_status == 'Manually Cancelled' else "marked as shipped"
@@ -964,6 +2665,173 @@ def update_order_status(order_id):
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
 
+# Bulk order endpoints: each batch is one transaction with set-based statements
+BULK_ORDER_LIMIT = 500
+
+def read_bulk_order_ids(data):
+    """De-duplicated order ids from a bulk request body, in request order"""
+    order_ids = data.get('order_ids')
+    if not isinstance(order_ids, list) or not order_ids:
+        raise ValueError("order_ids must be a non-empty list")
+    if len(order_ids) > BULK_ORDER_LIMIT:
+        raise ValueError(f"At most {BULK_ORDER_LIMIT} orders per request")
+    try:
+        return list(dict.fromkeys(int(order_id) for order_id in order_ids))
+    except (TypeError, ValueError):
+        raise ValueError("order_ids must be integers")
+
+def partition_bulk_orders(order_ids, allowed, action):
+    """Look up statuses for a batch and reject orders that can't take the action
+
+    Returns (statuses, results, eligible): results maps rejected order ids to
+    their outcome and eligible lists the rest in request order.
+    """
+    statuses = dict(db.session.query(Order.order_id, Order.order_status)
+                    .filter(Order.order_id.in_(order_ids)).all())
+    results = {}
+    for order_id in order_ids:
+        status = statuses.get(order_id)
+        if status is None:
+            results[order_id] = {'order_id': order_id, 'success': False, 'error': 'Order not found'}
+        elif not allowed(status):
+            results[order_id] = {'order_id': order_id, 'success': False,
+                                 'error': f"Cannot {action} order in {status} status"}
+    eligible = [order_id for order_id in order_ids if order_id not in results]
+    return statuses, results, eligible
+
+def reject_orders_missing_inventory(order_ids, results):
+    """Move orders whose items have no inventory row into results; return the rest"""
+    missing = orders_missing_inventory(order_ids) if order_ids else {}
+    for order_id, sku in missing.items():
+        results[order_id] = {'order_id': order_id, 'success': False,
+                             'error': f"Inventory record not found for SKU: {sku}"}
+    return [order_id for order_id in order_ids if order_id not in missing]
+
+def bulk_response(order_ids, results):
+    outcomes = [results[order_id] for order_id in order_ids]
+    succeeded = sum(1 for outcome in outcomes if outcome['success'])
+    return jsonify({
+        'succeeded': succeeded,
+        'failed': len(outcomes) - succeeded,
+        'results': outcomes
+    }), 200
+
+@app.route('/api/orders/bulk-void', methods=['POST'])
+@login_required
+def bulk_void_orders():
+    """Void many Processing orders and restock their items in one transaction"""
+    try:
+        try:
+            order_ids = read_bulk_order_ids(request.json or {})
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        _, results, eligible = partition_bulk_orders(order_ids, lambda status: status == ORDER_PROCESSING, 'void')
+        to_void = reject_orders_missing_inventory(eligible, results)
+        
+        if to_void:
+            # Only restock what this request actually voided; a concurrent void may have won
+            to_void = set_orders_status(to_void, ORDER_VOIDED, 'void', from_statuses=[ORDER_PROCESSING])
+            if to_void:
+                restock_orders(to_void, 'void')
+            db.session.commit()
+        for order_id in to_void:
+            results[order_id] = {'order_id': order_id, 'success': True}
+        for order_id in order_ids:
+            results.setdefault(order_id, {'order_id': order_id, 'success': False,
+                                          'error': "Order is no longer Processing"})
+        
+        return bulk_response(order_ids, results)
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/orders/bulk-delete', methods=['POST'])
+@login_required
+def bulk_delete_orders():
+    """Delete many voided or shipped orders in one transaction
+
+    Shipped orders have their items restocked, as with single deletes.
+    """
+    try:
+        try:
+            order_ids = read_bulk_order_ids(request.json or {})
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        _, results, eligible = partition_bulk_orders(
+            order_ids, lambda status: status in (ORDER_VOIDED, ORDER_SHIPPED), 'delete')
+        # Claim before restocking, with the status each order has now; orders an
+        # overlapping delete got to first drop out here
+        claimed = claim_orders(eligible, (ORDER_VOIDED, ORDER_SHIPPED)) if eligible else {}
+        shipped = reject_orders_missing_inventory(
+            [order_id for order_id in eligible if claimed.get(order_id) == ORDER_SHIPPED], results)
+        to_delete = [order_id for order_id in eligible if order_id in claimed and order_id not in results]
+        
+        if to_delete:
+            if shipped:
+                restock_orders(shipped, 'delete')
+            # Children first (foreign key constraints), then the orders
+            for model in (OrderItem, OrderFile, OrderSummary, OrderStatusChange, ShipStationOutbox, IdempotencyKey,
+                          EmailOutbox, Order):
+                model.query.filter(model.order_id.in_(to_delete)).delete(synchronize_session=False)
+        db.session.commit()
+        
+        shipped = set(shipped)
+        for order_id in to_delete:
+            results[order_id] = {'order_id': order_id, 'success': True,
+                                 'inventory_restored': order_id in shipped}
+        for order_id in order_ids:
+            results.setdefault(order_id, {'order_id': order_id, 'success': False,
+                                          'error': "Order was changed or deleted by another request"})
+        
+        return bulk_response(order_ids, results)
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/orders/bulk-update-status', methods=['PUT'])
+@login_required
+def bulk_update_order_status():
+    """Mark many Processing orders Shipped or Manually Cancelled (password protected)"""
+    try:
+        data = request.json or {}
+        new_status = data.get('status')
+        
+        if new_status not in MANUAL_ORDER_STATUSES:
+            return jsonify({"error": "Invalid status. Must be 'Shipped' or 'Manually Cancelled'"}), 400
+        if data.get('password') != 'GREGS':
+            return jsonify({"error": "Invalid password"}), 401
+        try:
+            order_ids = read_bulk_order_ids(data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        _, results, to_update = partition_bulk_orders(order_ids, lambda status: status == ORDER_PROCESSING, 'update')
+        if new_status == 'Manually Cancelled':
+            to_update = reject_orders_missing_inventory(to_update, results)
+        
+        if to_update:
+            # Only restock orders this request actually moved; a concurrent update may have won
+            to_update = set_orders_status(to_update, MANUAL_ORDER_STATUSES[new_status], 'bulk',
+                                          from_statuses=[ORDER_PROCESSING])
+            if to_update and new_status == 'Manually Cancelled':
+                restock_orders(to_update, 'cancel')
+            db.session.commit()
+        for order_id in to_update:
+            results[order_id] = {'order_id': order_id, 'success': True}
+        for order_id in order_ids:
+            results.setdefault(order_id, {'order_id': order_id, 'success': False,
+                                          'error': "Order is no longer Processing"})
+        
+        return bulk_response(order_ids, results)
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+
 # Add shipping webhook endpoint
 @app.route('/api/webhooks/shipping', methods=['POST'])
 def shipping_webhook():
@@ -978,12 +2846,12 @@ def shipping_webhook():
         if not order:
             return jsonify({"error": "Order not found"}), 404
             
-        if order.order_status != 'Processing':
+        if order.order_status != ORDER_PROCESSING:
             return jsonify({
                 "error": f"Cannot update shipping for order in {order.order_status} status"
             }), 400
             
-        order.order_status = 'Shipped'
+        set_order_status(order, ORDER_SHIPPED, 'webhook')
         db.session.commit()
         
         return jsonify({"message": "Order status updated to Shipped"}), 200
@@ -997,30 +2865,37 @@ def shipping_webhook():
 def get_products_full_details():
     """Get all products with their shipping details for editing"""
     try:
-        # Query products with their shipping details using a join
-        products = db.session.query(ItemDetail, ShippingDetail)\
-            .join(ShippingDetail, ItemDetail.sku == ShippingDetail.sku)\
-            .all()
-        
-        result = []
-        for item, shipping in products:
-            result.append({
-                'sku': item.sku,
-                'product': item.product,
-                'size': item.size,
-                'flavor': item.flavor,
-                'unitsCs': item.unitsCs,
-                'length': shipping.length,
-                'width': shipping.width,
-                'height': shipping.height,
-                'weight': shipping.weight
-            })
+        # Products that have shipping details, from the catalog snapshot
+        def build(versions):
+            return [{**item.to_dict(), **item.shipping_dict()}
+                    for item in catalog.snapshot(versions['catalog']) if item.has_shipping]
         
-        return jsonify(result), 200
+        return cached_json_response('products-full-details', ('catalog',), build)
     except Exception as e:
         print(f"Error fetching product details: {e}")
         return jsonify({'error': 'Failed to fetch product details'}), 500
 
+PRODUCT_TEXT_FIELDS = ('product', 'size', 'flavor', 'unitsCs')
+PRODUCT_SHIPPING_FIELDS = ('length', 'width', 'height', 'weight')
+
+def upsert_rows(model, rows, fields):
+    """INSERT ... ON CONFLICT (sku) DO UPDATE for many rows in one executemany
+
+    The update only fires when a value actually differs, so unchanged rows
+    are never rewritten.
+    """
+    from sqlalchemy import or_
+    from sqlalchemy.dialects.sqlite import insert
+    if not rows:
+        return
+    statement = insert(model)
+    statement = statement.on_conflict_do_update(
+        index_elements=['sku'],
+        set_={field: statement.excluded[field] for field in fields},
+        where=or_(*[getattr(model, field).is_not(statement.excluded[field]) for field in fields])
+    )
+    db.session.execute(statement, rows)
+
 @app.route('/api/products/bulk-update', methods=['PUT'])
 @login_required
 def bulk_update_products():
@@ -1038,36 +2913,70 @@ def bulk_update_products():
         if not products:
             return jsonify({'error': 'No products provided'}), 400
         
-        # Update each product
+        # Compare the payload with the current catalog and keep only real changes
+        current = catalog.snapshot(read_catalog_version())
+        item_rows = []
+        shipping_rows = []
+        changes = []
+        not_found = []
         for product_data in products:
             sku = product_data.get('sku')
             if not sku:
                 continue
+            item = current.get(sku)
+            if not item:
+                not_found.append(sku)
+                continue
             
-            # Update ItemDetail
-            item = ItemDetail.query.get(sku)
-            if item:
-                item.product = product_data.get('product', item.product)
-                item.size = product_data.get('size', item.size)
-                item.flavor = product_data.get('flavor', item.flavor)
-                item.unitsCs = product_data.get('unitsCs', item.unitsCs)
-            
-            # Update ShippingDetail
-            shipping = ShippingDetail.query.get(sku)
-            if shipping:
+            diff = {}
+            for field in PRODUCT_TEXT_FIELDS:
+                if product_data.get(field) is None:
+                    continue
+                value = str(product_data[field])
+                if value != getattr(item, field):
+                    diff[field] = {'from': getattr(item, field), 'to': value}
+            for field in PRODUCT_SHIPPING_FIELDS:
+                if field not in product_data:
+                    continue
                 # Validate numeric fields
                 try:
-                    shipping.length = float(product_data.get('length', shipping.length))
-                    shipping.width = float(product_data.get('width', shipping.width))
-                    shipping.height = float(product_data.get('height', shipping.height))
-                    shipping.weight = float(product_data.get('weight', shipping.weight))
-                except ValueError as ve:
+                    value = float(product_data[field])
+                except (TypeError, ValueError) as ve:
                     return jsonify({'error': f'Invalid numeric value for SKU {sku}: {str(ve)}'}), 400
+                if value != getattr(item, field):
+                    diff[field] = {'from': getattr(item, field), 'to': value}
+            if not diff:
+                continue
+            
+            changes.append({'sku': sku, 'changes': diff})
+            if any(field in diff for field in PRODUCT_TEXT_FIELDS):
+                item_rows.append({'sku': sku, **{field: diff[field]['to'] if field in diff else getattr(item, field)
+                                                 for field in PRODUCT_TEXT_FIELDS}})
+            if any(field in diff for field in PRODUCT_SHIPPING_FIELDS):
+                row = {'sku': sku, **{field: diff[field]['to'] if field in diff else getattr(item, field)
+                                      for field in PRODUCT_SHIPPING_FIELDS}}
+                # A new shipping row needs every dimension
+                if None in row.values():
+                    return jsonify({'error': f'SKU {sku} has no shipping details; provide length, width, height and weight'}), 400
+                shipping_rows.append(row)
+        
+        # One upsert per table; rows that already hold the new values aren't rewritten
+        upsert_rows(ItemDetail, item_rows, PRODUCT_TEXT_FIELDS)
+        upsert_rows(ShippingDetail, shipping_rows, PRODUCT_SHIPPING_FIELDS)
         
         # Commit all changes
-        db.session.commit()
+        if changes:
+            bump_change_counters('catalog')
+            db.session.commit()
+            catalog.invalidate()
         
-        return jsonify({'message': f'Successfully updated {len(products)} products'}), 200
+        return jsonify({
+            'message': f'Successfully updated {len(changes)} of {len(products)} products',
+            'updated': len(changes),
+            'unchanged': len(products) - len(changes) - len(not_found),
+            'not_found': not_found,
+            'changes': changes
+        }), 200
         
     except Exception as e:
         db.session.rollback()
@@ -1076,177 +2985,72 @@ def bulk_update_products():
 
 @app.route('/api/webhooks/shipstation', methods=['POST'])
 def shipstation_webhook():
-    print("\n=== WEBHOOK ENDPOINT HIT ===")
-    logging.info("=== ShipStation Webhook Received ===")
-    
-    # Log all request details
-    logging.info(f"Request method: {request.method}")
-    logging.info(f"Request URL: {request.url}")
-    logging.info(f"Request headers: {dict(request.headers)}")
-    logging.info(f"Request content type: {request.content_type}")
-    logging.info(f"Raw request data: {request.get_data()}")
-    
+    """Record a ShipStation webhook and return 202; the webhook worker applies it
+
+    Notifications are stored once per resource_url, so a redelivered or
+    duplicated webhook only bumps the delivery count.
+    """
+    from sqlalchemy.dialects.sqlite import insert
     try:
-        data = request.get_json()
-        logging.info(f"Parsed JSON webhook data: {data}")
-        logging.info(f"Resource type: {data.get('resource_type')}")
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({"error": "Invalid JSON in webhook payload"}), 400
+        resource_type = data.get('resource_type')
+        resource_url = data.get('resource_url')
+        logging.info(f"ShipStation webhook: {resource_type} {resource_url}")
+        
+        if resource_type != 'FULFILLMENT_SHIPPED':
+            return jsonify({"message": f"Ignored {resource_type} webhook"}), 200
+        if not resource_url:
+            return jsonify({"error": "resource_url is required"}), 400
+        
+        statement = insert(ShipStationWebhookEvent).values(resource_url=resource_url, resource_type=resource_type)
+        statement = statement.on_conflict_do_update(
+            index_elements=['resource_url'],
+            set_={'deliveries': ShipStationWebhookEvent.deliveries + 1}
+        )
+        db.session.execute(statement)
+        db.session.commit()
+        shipstation_webhook_worker.notify()
         
-        if data.get('resource_type') == 'FULFILLMENT_SHIPPED':
-            resource_url = data.get('resource_url')
-            logging.info(f"Resource URL: {resource_url}")
-            
-            if not SS_CLIENT_ID or not SS_CLIENT_SECRET:
-                error_msg = "ShipStation credentials not found"
-                logging.error(error_msg)
-                return jsonify({"error": error_msg}), 500
-            
-            # Create auth header
-            auth_string = f"{SS_CLIENT_ID}:{SS_CLIENT_SECRET}"
-            ss_auth = b64encode(auth_string.encode()).decode()
-            
-            headers = {
-                'Authorization': f'Basic {ss_auth}',
-                'Content-Type': 'application/json'
-            }
-            
-            logging.info("Making request to ShipStation API...")
-            try:
-                response = requests.get(resource_url, headers=headers, timeout=10)
-                logging.info(f"Response status: {response.status_code}")
-                
-                if response.ok:
-                    fulfillment_data = response.json()
-                    
-                    # Extract the first fulfillment
-                    if fulfillment_data.get('fulfillments') and len(fulfillment_data['fulfillments']) > 0:
-                        fulfillment = fulfillment_data['fulfillments'][0]
-                        
-                        # Extract order number and ship date
-                        order_number = fulfillment.get('orderNumber')
-                        ship_date_str = fulfillment.get('shipDate')
-                        
-                        logging.info(f"Extracted from fulfillment - Order number: '{order_number}', Ship date: '{ship_date_str}'")
-                        logging.info(f"Order number type: {type(order_number)}, length: {len(str(order_number)) if order_number else 0}")
-                        
-                        if order_number and ship_date_str:
-                            # Parse the date and format as MM/DD/YY
-                            from datetime import datetime
-                            import re
-                            
-                            # Fix ShipStation's 7-digit microseconds to 6-digit max for Python
-                            # ShipStation sends: '2025-07-12T00:00:00.0000000'
-                            # Python needs: '2025-07-12T00:00:00.000000'
-                            ship_date_fixed = re.sub(r'\.(\d{6})\d+', r'.\1', ship_date_str)
-                            logging.info(f"Original ship_date: {ship_date_str}")
-                            logging.info(f"Fixed ship_date: {ship_date_fixed}")
-                            
-                            ship_date = datetime.fromisoformat(ship_date_fixed.replace('Z', '+00:00'))
-                            formatted_ship_date = ship_date.strftime('%m/%d/%y')
-                            logging.info(f"Formatted ship date: {formatted_ship_date}")
-                            
-                            # Log database query details
-                            logging.info(f"Searching for order with purchase_order_number: '{order_number}'")
-                            
-                            # Check all orders to see what's in the database
-                            all_orders = Order.query.all()
-                            logging.info(f"Total orders in database: {len(all_orders)}")
-                            if all_orders:
-                                logging.info("First 5 order PO numbers in database:")
-                                for i, ord in enumerate(all_orders[:5]):
-                                    logging.info(f"  {i+1}. PO: '{ord.purchase_order_number}' (type: {type(ord.purchase_order_number)})")
-                            
-                            # Update the order in the database
-                            order = Order.query.filter_by(purchase_order_number=order_number).first()
-                            logging.info(f"Database query result: {order is not None}")
-                            
-                            if order:
-                                # Log order details before update
-                                logging.info(f"Order found! ID: {order.order_id}")
-                                logging.info(f"Current order status BEFORE update: '{order.order_status}'")
-                                logging.info(f"Order PO number in DB: '{order.purchase_order_number}'")
-                                
-                                # Update status
-                                old_status = order.order_status
-                                new_status = f"SHIPPED\n{formatted_ship_date}"
-                                order.order_status = new_status
-                                
-                                logging.info(f"Status change: '{old_status}' -> '{new_status}'")
-                                
-                                # Commit to database
-                                try:
-                                    db.session.commit()
-                                    logging.info("Database commit successful!")
-                                    
-                                    # Verify the update
-                                    updated_order = Order.query.filter_by(purchase_order_number=order_number).first()
-                                    logging.info(f"Status AFTER commit: '{updated_order.order_status}'")
-                                    
-                                    logging.info(f"✅ Successfully updated order {order_number} status to: {new_status}")
-                                    return jsonify({
-                                        "message": "Order status updated",
-                                        "order_number": order_number,
-                                        "old_status": old_status,
-                                        "new_status": new_status
-                                    }), 200
-                                    
-                                except Exception as commit_error:
-                                    logging.error(f"❌ Database commit failed: {str(commit_error)}")
-                                    db.session.rollback()
-                                    return jsonify({"error": f"Failed to commit status update: {str(commit_error)}"}), 500
-                                    
-                            else:
-                                logging.warning(f"❌ Order not found in database: '{order_number}'")
-                                # Try alternative search methods
-                                logging.info("Trying case-insensitive search...")
-                                order_case_insensitive = Order.query.filter(func.lower(Order.purchase_order_number) == func.lower(order_number)).first()
-                                if order_case_insensitive:
-                                    logging.info(f"Found order with case-insensitive search: {order_case_insensitive.purchase_order_number}")
-                                else:
-                                    logging.info("No order found even with case-insensitive search")
-                                
-                                return jsonify({"error": f"Order {order_number} not found"}), 404
-                        else:
-                            logging.error(f"❌ Missing order number or ship date in fulfillment data")
-                            logging.error(f"Fulfillment data: {fulfillment}")
-                            return jsonify({"error": "Missing required fulfillment data"}), 400
-                    else:
-                        logging.error(f"❌ No fulfillments found in response")
-                        logging.error(f"Full fulfillment response: {fulfillment_data}")
-                        return jsonify({"error": "No fulfillments found"}), 400
-                else:
-                    logging.error(f"❌ ShipStation API error response: {response.status_code}")
-                    logging.error(f"Response text: {response.text}")
-                    logging.error(f"Response headers: {response.headers}")
-                    return jsonify({"error": "Failed to fetch fulfillment details"}), response.status_code
-                    
-            except requests.exceptions.Timeout as e:
-                error_msg = f"❌ ShipStation API timeout: {str(e)}"
-                logging.error(error_msg)
-                return jsonify({"error": error_msg}), 500
-            except requests.exceptions.ConnectionError as e:
-                error_msg = f"❌ ShipStation API connection error: {str(e)}"
-                logging.error(error_msg)
-                return jsonify({"error": error_msg}), 500
-            except requests.exceptions.RequestException as e:
-                error_msg = f"❌ ShipStation API request failed: {str(e)}"
-                logging.error(error_msg)
-                return jsonify({"error": error_msg}), 500
-        else:
-            logging.info(f"ℹ️  Ignoring webhook - resource type is '{data.get('resource_type')}', not 'FULFILLMENT_SHIPPED'")
-                
-        return jsonify({"message": "Webhook processed"}), 200
+        return jsonify({"message": "Webhook queued"}), 202
         
-    except json.JSONDecodeError as e:
-        error_msg = f"❌ Invalid JSON in webhook payload: {str(e)}"
-        logging.error(error_msg)
-        logging.error(f"Raw request data: {request.get_data()}")
-        return jsonify({"error": error_msg}), 400
     except Exception as e:
-        error_msg = f"❌ Unexpected error processing webhook: {str(e)}"
-        logging.error(error_msg)
-        logging.error(f"Exception type: {type(e).__name__}")
-        traceback.print_exc()
-        return jsonify({"error": error_msg}), 500
+        db.session.rollback()
+        logging.error(f"Could not record ShipStation webhook: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/shipstation/webhook-events', methods=['GET'])
+@login_required
+def get_shipstation_webhook_events():
+    """Recorded webhooks, newest first; ?status=pending|processed|dead"""
+    try:
+        limit = min(max(request.args.get('limit', 100, type=int), 1), 500)
+        query = ShipStationWebhookEvent.query
+        if request.args.get('status'):
+            query = query.filter(ShipStationWebhookEvent.status == request.args['status'])
+        events = query.order_by(ShipStationWebhookEvent.id.desc()).limit(limit).all()
+        return jsonify([event.to_dict() for event in events]), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/shipstation/webhook-events/<int:event_id>/retry', methods=['POST'])
+@login_required
+def retry_shipstation_webhook_event(event_id):
+    """Fetch and apply a webhook's resource again"""
+    try:
+        event = db.session.get(ShipStationWebhookEvent, event_id)
+        if not event:
+            return jsonify({"error": "Webhook event not found"}), 404
+        event.status = 'pending'
+        event.attempts = 0
+        event.next_attempt_at = datetime.utcnow()
+        db.session.commit()
+        shipstation_webhook_worker.notify()
+        return jsonify(event.to_dict()), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
 
 # Database backup endpoints
 @app.route('/api/database-info', methods=['GET'])
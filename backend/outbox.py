@@ -0,0 +1,53 @@
+import threading
+
+class OutboxWorker:
+    """Background thread that keeps draining an outbox table
+
+    drain() delivers whatever is due and returns how many seconds until the
+    next entry falls due: 0 to loop straight away, None when nothing is
+    waiting. The thread sleeps that long (at most idle_interval seconds) or
+    until notify() is called, e.g. right after a request commits a new
+    entry. Every gunicorn worker runs its own thread, so drain() must claim
+    entries before delivering them.
+    """
+
+    def __init__(self, drain, idle_interval=5):
+        self._drain = drain
+        self.idle_interval = idle_interval
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start the thread if it isn't running; cheap to call on every request"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name='outbox-worker', daemon=True)
+            self._thread.start()
+
+    def notify(self):
+        """Wake the thread so a new entry goes out without waiting for the next poll"""
+        self._wake.set()
+
+    def stop(self, timeout=None):
+        self._stopping.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                wait = self._drain()
+            except Exception as e:
+                print(f"Outbox worker error: {e}")
+                wait = None
+            if wait is not None and wait <= 0:
+                continue
+            self._wake.wait(self.idle_interval if wait is None else min(wait, self.idle_interval))
+            self._wake.clear()
@@ -0,0 +1,78 @@
+import os
+import re
+import secrets
+import time
+
+from label_cache import UPLOAD_DIR
+
+# Processed label previews handed out by /api/process-labels, kept on the
+# shared uploads volume so any gunicorn worker can pick them up
+PROCESSED_LABELS_DIR = os.getenv('PROCESSED_LABELS_DIR', os.path.join(UPLOAD_DIR, 'processed_labels'))
+PROCESSED_LABELS_TTL_SECONDS = int(os.getenv('PROCESSED_LABELS_TTL_SECONDS', '1800'))
+
+TOKEN_PATTERN = re.compile(r'^[A-Za-z0-9_-]{32}$')
+
+def _paths(token):
+    base = os.path.join(PROCESSED_LABELS_DIR, token)
+    return f"{base}.pdf", f"{base}.zip"
+
+def _write_atomic(path, data):
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(data)
+    os.replace(temp_path, path)
+
+def purge_expired_labels():
+    """Remove stored results older than the TTL"""
+    cutoff = time.time() - PROCESSED_LABELS_TTL_SECONDS
+    try:
+        entries = list(os.scandir(PROCESSED_LABELS_DIR))
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        try:
+            if entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+        except OSError:
+            pass
+
+def store_processed_labels(pdf_data, zip_data):
+    """Store a processed label PDF and the original-files ZIP, returning a token or None"""
+    try:
+        os.makedirs(PROCESSED_LABELS_DIR, exist_ok=True)
+        purge_expired_labels()
+        token = secrets.token_urlsafe(24)
+        pdf_path, zip_path = _paths(token)
+        # Write the ZIP first; the PDF's presence marks the entry as complete
+        _write_atomic(zip_path, zip_data)
+        _write_atomic(pdf_path, pdf_data)
+        return token
+    except OSError as e:
+        print(f"Could not store processed labels: {e}")
+        return None
+
+def load_processed_labels(token):
+    """Return (pdf_data, zip_data) for a live token, or None if unknown or expired"""
+    if not token or not TOKEN_PATTERN.match(token):
+        return None
+    pdf_path, zip_path = _paths(token)
+    try:
+        if os.path.getmtime(pdf_path) < time.time() - PROCESSED_LABELS_TTL_SECONDS:
+            return None
+        with open(pdf_path, 'rb') as f:
+            pdf_data = f.read()
+        with open(zip_path, 'rb') as f:
+            zip_data = f.read()
+    except OSError:
+        return None
+    return pdf_data, zip_data
+
+def discard_processed_labels(token):
+    """Delete a stored result once it has been attached to an order"""
+    if not token or not TOKEN_PATTERN.match(token):
+        return
+    for path in _paths(token):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -6,6 +6,7 @@ from sendgrid.helpers.mail import (
 import base64
 import os
 from dotenv import load_dotenv
+from attachment_store import attachment_store
 
 # Load environment variables from .env file
 load_dotenv()
@@ -14,96 +15,87 @@ load_dotenv()
 SENDGRID_API_KEY = os.getenv('SENDGRID_API_KEY')
 SENDER_EMAIL = os.getenv('SENDER_EMAIL')
 RECIPIENT_EMAIL = os.getenv('RECIPIENT_EMAIL')
+# Attachments go inline up to this many bytes per email; larger ones are sent as links.
+# Base64 makes the message a third bigger, so this also bounds memory per send.
+EMAIL_INLINE_ATTACHMENT_MAX_BYTES = int(os.getenv('EMAIL_INLINE_ATTACHMENT_MAX_BYTES', str(5 * 1024 * 1024)))
 
-def send_order_confirmation_email(order, shipping_address, items, pdf_data=None, zip_data=None):
-    try:
-        # Add debug logging
-        print(f"Attempting to send email with SendGrid API key: {SENDGRID_API_KEY[:10]}...")
-        print(f"From: {SENDER_EMAIL}")
-        print(f"Shipping Address Email: {shipping_address.email}")
-        print(f"Recipient Email: {RECIPIENT_EMAIL}")
-        
-        if not SENDGRID_API_KEY:
-            raise ValueError("SendGrid API key is missing")
-        
-        # Add size check for PDF (SendGrid has a 30MB limit)
-        if pdf_data and len(pdf_data) > 30_000_000:  # 30MB in bytes
-            print("PDF too large for email attachment")
-            pdf_data = None  # Don't attach if too large
+def encode_attachment(sha256):
+    """Base64 of a stored file, encoded piece by piece so the raw bytes are never all in memory"""
+    encoded = bytearray()
+    remainder = b''
+    # Whole 3-byte groups encode independently, so the pieces join into valid base64
+    for chunk in attachment_store.iter_chunks(sha256, chunk_size=3 * 64 * 1024):
+        chunk = remainder + chunk
+        cut = len(chunk) - len(chunk) % 3
+        encoded += base64.b64encode(chunk[:cut])
+        remainder = chunk[cut:]
+    encoded += base64.b64encode(remainder)
+    return encoded.decode('ascii')
 
-        sg = SendGridAPIClient(SENDGRID_API_KEY)
-        
-        # Define recipients
-        admin_emails = RECIPIENT_EMAIL.split(',') if RECIPIENT_EMAIL else []  # Split the comma-separated emails
-        to_emails = admin_emails.copy()  # Start with admin emails
-        
-        if shipping_address.email:  # Add customer email if it exists
-            to_emails.append(shipping_address.email)
-        
-        # Create email message
-        message = Mail(
-            from_email=SENDER_EMAIL,
-            to_emails=to_emails,
-            subject=f'Order Confirmation - PO #{order.purchase_order_number}',
-            html_content=create_email_content(order, shipping_address, items)
-        )
+def send_order_confirmation_email(order, shipping_address, items, attachments=()):
+    """Send the order confirmation through SendGrid, raising if it fails
 
-        # Add PDF attachment if provided
-        if pdf_data:
-            try:
-                # Convert binary PDF data to base64
-                encoded_pdf = base64.b64encode(pdf_data).decode()
-                
-                # Create attachment
-                attachment = Attachment()
-                attachment.file_content = FileContent(encoded_pdf)
-                attachment.file_type = FileType('application/pdf')
-                attachment.file_name = FileName(f'shipping_labels_PO_{order.purchase_order_number}.pdf')
-                attachment.disposition = Disposition('attachment')
-                attachment.content_id = ContentId('Shipping Labels')
-                
-                # Add attachment to email
-                message.add_attachment(attachment)  # Changed from message.attachment = attachment
-            except Exception as e:
-                print(f"Error processing attachment: {str(e)}")
-                # Continue without attachment if there's an error
+    attachments are dicts with file_name, content_type, sha256, size and
+    url. Files are read from the attachment store here, at send time. They
+    go inline until their total would pass EMAIL_INLINE_ATTACHMENT_MAX_BYTES;
+    the rest are sent as download links.
+    """
+    # Add debug logging
+    print(f"From: {SENDER_EMAIL}")
+    print(f"Shipping Address Email: {shipping_address.email}")
+    print(f"Recipient Email: {RECIPIENT_EMAIL}")
+    
+    if not SENDGRID_API_KEY:
+        raise ValueError("SendGrid API key is missing")
 
-        # Add ZIP attachment if provided
-        if zip_data:
-            try:
-                # Convert binary ZIP data to base64
-                encoded_zip = base64.b64encode(zip_data).decode()
-                
-                # Create ZIP attachment
-                zip_attachment = Attachment()
-                zip_attachment.file_content = FileContent(encoded_zip)
-                zip_attachment.file_type = FileType('application/zip')
-                zip_attachment.file_name = FileName(f'original_labels_PO_{order.purchase_order_number}.zip')
-                zip_attachment.disposition = Disposition('attachment')
-                zip_attachment.content_id = ContentId('Original Labels')
-                
-                # Add ZIP attachment to email
-                message.add_attachment(zip_attachment)
-            except Exception as e:
-                print(f"Error processing ZIP attachment: {str(e)}")
-                # Continue without ZIP attachment if there's an error
+    inline = []
+    links = []
+    inline_bytes = 0
+    for attachment in attachments:
+        if inline_bytes + attachment['size'] <= EMAIL_INLINE_ATTACHMENT_MAX_BYTES:
+            inline.append(attachment)
+            inline_bytes += attachment['size']
+        else:
+            print(f"{attachment['file_name']} is {attachment['size']} bytes; sending a link instead")
+            links.append(attachment)
 
-        try:
-            response = sg.send(message)
-            print(f'Email sent successfully. Status code: {response.status_code}')
-            print(f'Response headers: {response.headers}')
-            return True
-        except Exception as e:
-            print(f'SendGrid API error: {str(e)}')
-            if hasattr(e, 'body'):
-                print(f'Error body: {e.body}')
-            raise
+    sg = SendGridAPIClient(SENDGRID_API_KEY)
+    
+    # Define recipients
+    admin_emails = RECIPIENT_EMAIL.split(',') if RECIPIENT_EMAIL else []  # Split the comma-separated emails
+    to_emails = admin_emails.copy()  # Start with admin emails
+    
+    if shipping_address.email:  # Add customer email if it exists
+        to_emails.append(shipping_address.email)
+    
+    # Create email message
+    message = Mail(
+        from_email=SENDER_EMAIL,
+        to_emails=to_emails,
+        subject=f'Order Confirmation - PO #{order.purchase_order_number}',
+        html_content=create_email_content(order, shipping_address, items, links)
+    )
+
+    for item in inline:
+        attachment = Attachment()
+        attachment.file_content = FileContent(encode_attachment(item['sha256']))
+        attachment.file_type = FileType(item['content_type'])
+        attachment.file_name = FileName(item['file_name'])
+        attachment.disposition = Disposition('attachment')
+        attachment.content_id = ContentId(item['file_name'])
+        message.add_attachment(attachment)
 
+    try:
+        response = sg.send(message)
+        print(f'Email sent successfully. Status code: {response.status_code}')
+        return True
     except Exception as e:
-        print(f'Error sending email: {str(e)}')
-        return False
+        print(f'SendGrid API error: {str(e)}')
+        if hasattr(e, 'body'):
+            print(f'Error body: {e.body}')
+        raise
 
-def create_email_content(order, shipping_address, items):
+def create_email_content(order, shipping_address, items, links=()):
     # Create the order details table in HTML
     items_table = """
     <table style="border-collapse: collapse; width: 600px; margin: 5pt 0;">
@@ -129,6 +121,12 @@ def create_email_content(order, shipping_address, items):
     
     items_table += "</table>"
 
+    downloads = ""
+    if links:
+        downloads = "<p><strong>Too large to attach, download here:</strong><br>" + "<br>".join(
+            f'<a href="{link["url"]}">{link["file_name"]}</a> ({link["size"] / 1_000_000:.1f} MB)' for link in links
+        ) + "</p>"
+
     # Create the email content
     html_content = f"""
     <html>
@@ -152,7 +150,8 @@ def create_email_content(order, shipping_address, items):
             <h3>Ordered Items:</h3>
             {items_table}
             
-            <p><strong>Attachment:</strong> {' Yes' if order.attachment else ' No'}</p>
+            <p><strong>Attachment:</strong> {' Yes' if order.has_attachment else ' No'}</p>
+            {downloads}
             
             <p><strong>Shipping Method:</strong> {order.shipping_method}</p>
         </body>
@@ -1,7 +1,46 @@
 import os
 from PIL import Image, ImageChops
 from PyPDF2 import PdfReader, PdfWriter
+from PyPDF2.generic import RectangleObject
 import io
+import subprocess
+import tempfile
+import threading
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from label_cache import label_cache, label_cache_key
+
+# Number of worker processes used to trim label pages in parallel
+TRIM_WORKERS = int(os.getenv('LABEL_TRIM_WORKERS', '0')) or (os.cpu_count() or 1)
+# Jobs with fewer pages than this are trimmed serially
+TRIM_PARALLEL_MIN_PAGES = int(os.getenv('LABEL_TRIM_PARALLEL_MIN_PAGES', '8'))
+# 'vector' crops PDF label pages in place and only rasterizes image inputs;
+# 'raster' re-renders every page as a 300 DPI bitmap
+TRIM_MODE = os.getenv('LABEL_TRIM_MODE', 'vector')
+# Resolution used to find the content box of vector pages
+BBOX_DPI = int(os.getenv('LABEL_BBOX_DPI', '150'))
+# Intermediate label PDFs stay in memory until they grow past this many bytes
+SPOOL_THRESHOLD_BYTES = int(os.getenv('LABEL_SPOOL_THRESHOLD_BYTES', str(32 * 1024 * 1024)))
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+def new_spool_buffer():
+    """Buffer that lives in memory and only spills to disk past SPOOL_THRESHOLD_BYTES"""
+    return tempfile.SpooledTemporaryFile(max_size=SPOOL_THRESHOLD_BYTES)
+
+def as_stream(source):
+    """Wrap raw bytes in a stream; paths and file-like objects are returned as-is"""
+    if isinstance(source, (bytes, bytearray)):
+        return io.BytesIO(source)
+    return source
+
+def write_pdf(writer, output):
+    """Write a PdfWriter to a path or a binary file-like object"""
+    if isinstance(output, (str, os.PathLike)):
+        with open(output, 'wb') as f:
+            writer.write(f)
+    else:
+        writer.write(output)
 
 def detect_image_dpi(image):
     """Detect DPI from image metadata or use intelligent defaults"""
@@ -85,39 +124,44 @@ def save_image_as_pdf_with_exact_size(image, output_filename, width_in=4, height
     print(f"Saved PDF with DPI: {dpi:.1f} for exact {width_in}\"x{height_in}\" page size")
     return dpi
 
-def resize_pdf_to_exact_dimensions(input_pdf, output_pdf, target_width_in=4, target_height_in=6):
-    """Resize PDF pages to exact dimensions in inches - only if they're close to target size"""
+def fit_page_to_exact_dimensions(page, index, target_width_in=4, target_height_in=6):
+    """Set a page's media box to exact dimensions in inches - only if it's close to target size"""
     target_width_pts = target_width_in * 72  # 288 pts for 4 inches
     target_height_pts = target_height_in * 72  # 432 pts for 6 inches
-    
+
+    # Get current dimensions
+    current_width = float(page.mediabox.width)
+    current_height = float(page.mediabox.height)
+
+    # Check if the page is already close to the target size (within 10%)
+    width_ratio = current_width / target_width_pts
+    height_ratio = current_height / target_height_pts
+
+    # Only resize if the page is within reasonable bounds (0.5x to 1.5x target)
+    # This prevents distortion of pages that are significantly different sizes
+    if 0.5 <= width_ratio <= 1.5 and 0.5 <= height_ratio <= 1.5:
+        # Set the media box to exact target size, keeping its origin so
+        # vector-cropped pages stay on their content
+        left, bottom = float(page.mediabox.left), float(page.mediabox.bottom)
+        page.mediabox.lower_left = (left, bottom)
+        page.mediabox.upper_right = (left + target_width_pts, bottom + target_height_pts)
+        if '/CropBox' in page:
+            page.cropbox = page.mediabox
+        print(f"Resized page {index+1} from {current_width:.1f}x{current_height:.1f} pts to {target_width_pts}x{target_height_pts} pts")
+    else:
+        # Keep original size for pages that are too different
+        print(f"Kept page {index+1} at original size {current_width:.1f}x{current_height:.1f} pts (too different from target)")
+    return page
+
+def resize_pdf_to_exact_dimensions(input_pdf, output_pdf, target_width_in=4, target_height_in=6):
+    """Resize PDF pages to exact dimensions in inches - only if they're close to target size"""
     reader = PdfReader(input_pdf)
     writer = PdfWriter()
     
     for i, page in enumerate(reader.pages):
-        # Get current dimensions
-        current_width = float(page.mediabox.width)
-        current_height = float(page.mediabox.height)
-        
-        # Check if the page is already close to the target size (within 10%)
-        width_ratio = current_width / target_width_pts
-        height_ratio = current_height / target_height_pts
-        
-        # Only resize if the page is within reasonable bounds (0.5x to 1.5x target)
-        # This prevents distortion of pages that are significantly different sizes
-        if 0.5 <= width_ratio <= 1.5 and 0.5 <= height_ratio <= 1.5:
-            # Set the media box to exact target size
-            page.mediabox.lower_left = (0, 0)
-            page.mediabox.upper_right = (target_width_pts, target_height_pts)
-            print(f"Resized page {i+1} from {current_width:.1f}x{current_height:.1f} pts to {target_width_pts}x{target_height_pts} pts")
-        else:
-            # Keep original size for pages that are too different
-            print(f"Kept page {i+1} at original size {current_width:.1f}x{current_height:.1f} pts (too different from target)")
-        
-        # Add the page
-        writer.add_page(page)
+        writer.add_page(fit_page_to_exact_dimensions(page, i, target_width_in, target_height_in))
     
-    with open(output_pdf, 'wb') as f:
-        writer.write(f)
+    write_pdf(writer, output_pdf)
 
 def check_aspect_ratio(width, height):
     """Check if aspect ratio is between 65-68%"""
@@ -126,97 +170,45 @@ def check_aspect_ratio(width, height):
         print(f"WRONG RATIO: {ratio:.1f}%")
     return ratio
 
+def image_to_pdf_page(image_file, label, target_width_in=4, target_height_in=6):
+    """Convert one label image to a single PDF page sized to the target dimensions"""
+    img = Image.open(as_stream(image_file)).convert('RGB')
+
+    # Validate quality
+    try:
+        validate_label_quality(img)
+    except ValueError as e:
+        print(f"Warning for {label}: {e}")
+
+    width_in, height_in, dpi = get_size_inches(img)
+    print(f"{label}: {width_in:.2f}\" x {height_in:.2f}\" at {dpi} DPI")
+    check_aspect_ratio(img.width, img.height)
+
+    # Save as an in-memory PDF with exact size
+    page_pdf = io.BytesIO()
+    save_image_as_pdf_with_exact_size(img, page_pdf, target_width_in, target_height_in)
+    page_pdf.seek(0)
+    return PdfReader(page_pdf).pages[0]
+
 def combine_pngs_to_pdf(image_files, output_filename, target_width_in=4, target_height_in=6):
     """Combine PNG images into a PDF with exact page dimensions"""
-    import tempfile
-    import os
-    
     if not image_files:
         return 0
     
-    # If only one image, save it directly with exact size
-    if len(image_files) == 1:
-        img = Image.open(image_files[0]).convert('RGB')
-        
-        # Validate quality
-        try:
-            validate_label_quality(img)
-        except ValueError as e:
-            print(f"Warning: {e}")
-        
-        width_in, height_in, dpi = get_size_inches(img)
-        print(f"Image: {width_in:.2f}\" x {height_in:.2f}\" at {dpi} DPI")
-        check_aspect_ratio(img.width, img.height)
-        
-        # Save with exact size
-        save_image_as_pdf_with_exact_size(img, output_filename, target_width_in, target_height_in)
-        
-        # Ensure the PDF has exact dimensions
-        temp_output = output_filename + '.temp'
-        resize_pdf_to_exact_dimensions(output_filename, temp_output, target_width_in, target_height_in)
-        os.replace(temp_output, output_filename)
-        
-        return 1
-    
-    # For multiple images, create individual PDFs then combine
-    temp_pdfs = []
-    temp_dir = tempfile.mkdtemp()
+    writer = PdfWriter()
+    for i, img_file in enumerate(image_files):
+        page = image_to_pdf_page(img_file, f"Page {i+1} (Image)", target_width_in, target_height_in)
+        writer.add_page(fit_page_to_exact_dimensions(page, i, target_width_in, target_height_in))
     
-    try:
-        for i, img_file in enumerate(image_files):
-            img = Image.open(img_file).convert('RGB')
-            
-            # Validate quality
-            try:
-                validate_label_quality(img)
-            except ValueError as e:
-                print(f"Warning for image {i+1}: {e}")
-            
-            width_in, height_in, dpi = get_size_inches(img)
-            print(f"Page {i+1} (Image): {width_in:.2f}\" x {height_in:.2f}\" at {dpi} DPI")
-            check_aspect_ratio(img.width, img.height)
-            
-            # Save each image as a PDF with exact size
-            temp_pdf = os.path.join(temp_dir, f"page_{i+1}.pdf")
-            save_image_as_pdf_with_exact_size(img, temp_pdf, target_width_in, target_height_in)
-            temp_pdfs.append(temp_pdf)
-        
-        # Combine all PDFs
-        writer = PdfWriter()
-        for pdf_file in temp_pdfs:
-            reader = PdfReader(pdf_file)
-            for page in reader.pages:
-                writer.add_page(page)
-        
-        # Write combined PDF
-        with open(output_filename, 'wb') as f:
-            writer.write(f)
-        
-        # Ensure all pages have exact dimensions
-        temp_output = output_filename + '.temp'
-        resize_pdf_to_exact_dimensions(output_filename, temp_output, target_width_in, target_height_in)
-        os.replace(temp_output, output_filename)
-        
-        return len(image_files)
-        
-    finally:
-        # Clean up temp files
-        for temp_pdf in temp_pdfs:
-            try:
-                os.remove(temp_pdf)
-            except:
-                pass
-        try:
-            os.rmdir(temp_dir)
-        except:
-            pass
+    write_pdf(writer, output_filename)
+    return len(image_files)
 
 def combine_pdfs(pdf_files, output_filename):
     writer = PdfWriter()
     total_pages = 0
     
     for pdf_file in pdf_files:
-        reader = PdfReader(pdf_file)
+        reader = PdfReader(as_stream(pdf_file))
         current_page = total_pages
         
         for i, page in enumerate(reader.pages):
@@ -237,8 +229,7 @@ def combine_pdfs(pdf_files, output_filename):
         total_pages += len(reader.pages)
     
     # Write the combined PDF to the output file
-    with open(output_filename, 'wb') as output_file:
-        writer.write(output_file)
+    write_pdf(writer, output_filename)
     
     return total_pages
 
@@ -282,143 +273,428 @@ def add_padding_for_ratio(image, target_ratio=66.7):
     
     return new_image
 
-def trim_pdf_margins(input_pdf, output_pdf):
-    """Create a new PDF with trimmed margins and 66.7% ratio"""
-    reader = PdfReader(input_pdf)
+def trim_label_image(pil_image):
+    """Trim white margins from a rendered label and pad it to the 66.7% ratio"""
+    bg = Image.new(pil_image.mode, pil_image.size, 'white')
+    diff = ImageChops.difference(pil_image, bg)
+    bbox = diff.getbbox()
+    if bbox:
+        trimmed_image = pil_image.crop(bbox)
+    else:
+        trimmed_image = pil_image
+
+    # Add padding to maintain 66.7% ratio
+    return add_padding_for_ratio(trimmed_image, 66.7)
+
+def _read_ppm_token(stream):
+    """Read one whitespace-delimited header token from a PPM stream"""
+    token = b''
+    while True:
+        char = stream.read(1)
+        if not char:
+            return token or None
+        if char.isspace():
+            if token:
+                return token
+            continue
+        token += char
+
+def _read_ppm_image(stream):
+    """Read the next binary PPM (P6) image from a stream, or None at end of stream"""
+    magic = _read_ppm_token(stream)
+    if magic is None:
+        return None
+    if magic != b'P6':
+        raise ValueError(f"Unexpected image format from pdftoppm: {magic!r}")
+    width = int(_read_ppm_token(stream))
+    height = int(_read_ppm_token(stream))
+    int(_read_ppm_token(stream))  # maxval, always 255 for pdftoppm
+    data = stream.read(width * height * 3)
+    if len(data) != width * height * 3:
+        raise ValueError("Truncated page image from pdftoppm")
+    return Image.frombytes('RGB', (width, height), data)
+
+def _feed_stdin(pipe, source):
+    """Copy a PDF into pdftoppm's stdin from a background thread"""
+    try:
+        if isinstance(source, (bytes, bytearray)):
+            pipe.write(source)
+        else:
+            shutil.copyfileobj(source, pipe)
+    except BrokenPipeError:
+        pass
+    finally:
+        pipe.close()
+
+def iter_pdf_page_images(pdf_source, dpi=300, first_page=None, last_page=None):
+    """Render PDF pages with a single pdftoppm process, yielding one PIL image per page
+
+    pdf_source is a path, PDF bytes or a binary file-like object; the latter two
+    are piped to pdftoppm's stdin so nothing is written to disk. Pages are read
+    off pdftoppm's stdout as they are rendered, so only the page currently being
+    handled is held in memory.
+    """
+    from_path = isinstance(pdf_source, (str, os.PathLike))
+
+    cmd = ['pdftoppm', '-r', str(dpi)]
+    if first_page:
+        cmd += ['-f', str(first_page)]
+    if last_page:
+        cmd += ['-l', str(last_page)]
+    cmd.append(os.fspath(pdf_source) if from_path else '-')
+
+    process = subprocess.Popen(
+        cmd,
+        stdin=subprocess.DEVNULL if from_path else subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE
+    )
+    # Drain stderr alongside stdout so pdftoppm can't stall on a full pipe
+    stderr_output = []
+    stderr_reader = threading.Thread(target=lambda: stderr_output.append(process.stderr.read()), daemon=True)
+    stderr_reader.start()
+    feeder = None
+    if not from_path:
+        feeder = threading.Thread(target=_feed_stdin, args=(process.stdin, pdf_source), daemon=True)
+        feeder.start()
+    exhausted = False
+    try:
+        while True:
+            image = _read_ppm_image(process.stdout)
+            if image is None:
+                exhausted = True
+                break
+            yield image
+    finally:
+        # Stop the renderer only if the caller stops iterating early; after
+        # EOF it is already exiting and gets to report its own status
+        if not exhausted and process.poll() is None:
+            process.kill()
+        process.stdout.close()
+        process.wait()
+        stderr_reader.join()
+        process.stderr.close()
+        if feeder:
+            feeder.join()
+
+    if process.returncode != 0:
+        message = stderr_output[0].decode(errors='replace').strip()[-500:] if stderr_output else ''
+        raise RuntimeError(f"pdftoppm failed with exit code {process.returncode}: {message or 'no error output'}")
+
+def encode_trimmed_page(pil_image):
+    """Trim a rendered page and return it as single-page PDF bytes"""
+    final_image = trim_label_image(pil_image)
+
+    # Convert back to PDF with high DPI
+    pdf_bytes = io.BytesIO()
+    final_image.save(pdf_bytes, format='PDF', resolution=300)
+    return pdf_bytes.getvalue()
+
+def pad_box_for_ratio(box, target_ratio=66.7):
+    """Grow a (left, top, right, bottom) box around its centre to the target ratio (width/height * 100)"""
+    left, top, right, bottom = box
+    width = right - left
+    height = bottom - top
+    current_ratio = (width / height) * 100
+
+    # If ratio is already between 65-68%, keep original dimensions
+    if 65 <= current_ratio <= 68:
+        return box
+
+    if current_ratio > target_ratio:
+        # Need to add height
+        extra = width * 100 / target_ratio - height
+        top, bottom = top - extra / 2, bottom + extra / 2
+    else:
+        # Need to add width
+        extra = height * target_ratio / 100 - width
+        left, right = left - extra / 2, right + extra / 2
+    return (left, top, right, bottom)
+
+def find_content_box(pil_image):
+    """Return the content bounding box of a rendered page padded to the 66.7% ratio, or None if blank"""
+    bg = Image.new(pil_image.mode, pil_image.size, 'white')
+    bbox = ImageChops.difference(pil_image, bg).getbbox()
+    if not bbox:
+        return None
+    return pad_box_for_ratio(bbox, 66.7)
+
+def crop_page_to_box(page, box, dpi):
+    """Crop a PDF page to a box in rendered-pixel coordinates, keeping its vector content"""
+    scale = dpi / 72
+    llx, lly = float(page.mediabox.left), float(page.mediabox.bottom)
+    urx, ury = float(page.mediabox.right), float(page.mediabox.top)
+    rotation = (page.rotation or 0) % 360
+
+    def to_pdf_point(px, py):
+        # pdftoppm renders the media box with /Rotate applied; undo that here
+        px, py = px / scale, py / scale
+        if rotation == 90:
+            return llx + py, lly + px
+        if rotation == 180:
+            return urx - px, lly + py
+        if rotation == 270:
+            return urx - py, ury - px
+        return llx + px, ury - py
+
+    left, top, right, bottom = box
+    xs, ys = zip(to_pdf_point(left, top), to_pdf_point(right, bottom))
+    crop = RectangleObject([min(xs), min(ys), max(xs), max(ys)])
+    page.mediabox = crop
+    page.cropbox = crop
+    return page
+
+def trim_rendered_page(index, pil_image, vector_pages):
+    """Trim one rendered page: a crop box for vector pages, re-encoded PDF bytes otherwise"""
+    if index in vector_pages:
+        return ('box', find_content_box(pil_image))
+    return ('pdf', encode_trimmed_page(pil_image))
+
+def trim_page_range(pdf_source, first_page, last_page, dpi=300, vector_pages=()):
+    """Render and trim a contiguous page range with one renderer process"""
+    images = iter_pdf_page_images(pdf_source, dpi, first_page, last_page)
+    return [trim_rendered_page(first_page - 1 + offset, image, vector_pages)
+            for offset, image in enumerate(images)]
+
+def iter_trimmed_pages(pdf_source, page_count, workers, dpi=300, vector_pages=()):
+    """Yield a trim result per page in page order
+
+    Results are ('box', padded pixel box or None) for pages in vector_pages and
+    ('pdf', trimmed single-page PDF bytes) for everything else. Serial jobs
+    stream straight from one renderer. Parallel jobs give each worker a
+    contiguous page range so every page is still rendered only once.
+    """
+    if workers <= 1:
+        for index, image in enumerate(iter_pdf_page_images(pdf_source, dpi)):
+            yield trim_rendered_page(index, image, vector_pages)
+        return
+
+    # Workers need a picklable source: a path or the raw bytes
+    if not isinstance(pdf_source, (str, os.PathLike, bytes)):
+        pdf_source = pdf_source.read()
+
+    chunk_size = -(-page_count // workers)
+    ranges = [(first, min(first + chunk_size - 1, page_count))
+              for first in range(1, page_count + 1, chunk_size)]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(trim_page_range, pdf_source, first, last, dpi, vector_pages)
+                   for first, last in ranges]
+        # Collect in submission order so page order is kept
+        for future in futures:
+            for result in future.result():
+                yield result
+
+def trim_pdf_margins(input_pdf, output_pdf, workers=None, vector_pages=None):
+    """Create a new PDF with trimmed margins and 66.7% ratio
+
+    input_pdf and output_pdf may be paths or binary file-like objects.
+
+    Pages whose index is in vector_pages keep their original vector content:
+    the content box is found on a low-resolution render (BBOX_DPI) and the
+    page's media/crop box is set to it. Other pages are rasterized at 300 DPI,
+    trimmed and re-embedded. vector_pages defaults to every page when
+    TRIM_MODE is 'vector' and to none when it is 'raster'.
+
+    The document is rendered once rather than once per page. Jobs with at
+    least TRIM_PARALLEL_MIN_PAGES pages are split into page ranges across a
+    process pool of `workers` processes (TRIM_WORKERS by default). Smaller
+    jobs stay serial to avoid paying the pool start-up cost.
+    """
+    source = as_stream(input_pdf)
+    if not isinstance(source, (str, os.PathLike)):
+        # The renderer and the reader both need the document; share one copy
+        source = source.read()
+        reader = PdfReader(io.BytesIO(source))
+    else:
+        reader = PdfReader(source)
+    page_count = len(reader.pages)
     writer = PdfWriter()
-    
+
+    if vector_pages is None:
+        vector_pages = range(page_count) if TRIM_MODE == 'vector' else ()
+    vector_pages = frozenset(vector_pages)
+    # Box detection alone doesn't need print resolution
+    dpi = BBOX_DPI if len(vector_pages) == page_count else 300
+
+    if workers is None:
+        workers = TRIM_WORKERS
+    workers = max(1, min(workers, page_count))
+    if page_count < TRIM_PARALLEL_MIN_PAGES:
+        workers = 1
+    if workers > 1:
+        print(f"Trimming {page_count} pages with {workers} worker processes")
+
     print("\nTrimmed Output PDF dimensions:")
-    for i, page in enumerate(reader.pages):
-        # Convert PDF page to PIL Image for trimming
-        from pdf2image import convert_from_bytes
-        
-        # Convert PDF page to bytes
-        temp_writer = PdfWriter()
-        temp_writer.add_page(page)
-        page_bytes = io.BytesIO()
-        temp_writer.write(page_bytes)
-        page_bytes.seek(0)
-        
-        # Convert to image with high DPI for quality preservation
-        pil_image = convert_from_bytes(page_bytes.getvalue(), dpi=300)[0]
-        
-        # Trim white margins
-        bg = Image.new(pil_image.mode, pil_image.size, 'white')
-        diff = ImageChops.difference(pil_image, bg)
-        bbox = diff.getbbox()
-        if bbox:
-            trimmed_image = pil_image.crop(bbox)
+    results = iter_trimmed_pages(source, page_count, workers, dpi, vector_pages)
+    for i, (kind, value) in enumerate(results):
+        if kind == 'box':
+            # Vector page: crop in place, blank pages are kept as they are
+            page = reader.pages[i]
+            if value:
+                crop_page_to_box(page, value, dpi)
         else:
-            trimmed_image = pil_image
-        
-        # Add padding to maintain 66.7% ratio
-        final_image = add_padding_for_ratio(trimmed_image, 66.7)
-            
-        # Convert back to PDF with high DPI
-        pdf_bytes = io.BytesIO()
-        final_image.save(pdf_bytes, format='PDF', resolution=300)
-        pdf_bytes.seek(0)
-        
-        # Add to writer
-        temp_reader = PdfReader(pdf_bytes)
-        writer.add_page(temp_reader.pages[0])
-        
+            page = PdfReader(io.BytesIO(value)).pages[0]
+        writer.add_page(page)
+
         # Print dimensions
-        width_in = float(temp_reader.pages[0].mediabox.width) / 72
-        height_in = float(temp_reader.pages[0].mediabox.height) / 72
+        width_in = float(page.mediabox.width) / 72
+        height_in = float(page.mediabox.height) / 72
         ratio = (width_in / height_in) * 100
         print(f"Trimmed Page {i+1} dimensions: {width_in:.2f}\" x {height_in:.2f}\" (ratio: {ratio:.1f}%)")
-    
+
     # Save the trimmed PDF
-    with open(output_pdf, 'wb') as output_file:
-        writer.write(output_file)
+    write_pdf(writer, output_pdf)
 
-def process_files(input_dir, output_filename):
-    # Get all files in the input directory
-    files = [f for f in os.listdir(input_dir) if os.path.isfile(os.path.join(input_dir, f))]
-    
-    # Separate image and PDF files
-    image_files = [os.path.join(input_dir, f) for f in files 
-                   if f.lower().endswith(('.png', '.jpg', '.jpeg'))]
-    pdf_files = [os.path.join(input_dir, f) for f in files if f.lower().endswith('.pdf')]
-    
+def split_label_files(files):
+    """Split (filename, data) pairs into image and PDF sources, keeping upload order"""
+    image_files = [data for name, data in files if name.lower().endswith(IMAGE_EXTENSIONS)]
+    pdf_files = [data for name, data in files if name.lower().endswith('.pdf')]
+    return image_files, pdf_files
+
+def combine_label_files(image_files, pdf_files, output):
+    """Combine image and PDF label sources into one PDF written to `output`"""
     total_pages = 0
     
     # Process based on file type
     if image_files and pdf_files:
-        # Handle mixed file types: convert images to PDFs first, then combine all
-        import tempfile
-        temp_pdfs = []
-        
-        # Convert each image to a temporary PDF
-        for img_file in image_files:
-            temp_pdf = os.path.join(input_dir, f"temp_{os.path.basename(img_file)}.pdf")
-            img = Image.open(img_file).convert('RGB')
-            
-            # Validate quality
-            try:
-                validate_label_quality(img)
-            except ValueError as e:
-                print(f"Warning for {os.path.basename(img_file)}: {e}")
-            
-            # Print dimensions with detected DPI
-            width_in, height_in, dpi = get_size_inches(img)
-            print(f"Converting image {os.path.basename(img_file)}: {width_in:.2f}\" x {height_in:.2f}\" at {dpi} DPI")
-            check_aspect_ratio(img.width, img.height)
-            
+        # Handle mixed file types: convert images to PDF pages, then combine all
+        image_pdf = io.BytesIO()
+        image_writer = PdfWriter()
+        for i, img_file in enumerate(image_files):
             # Save as PDF with exact 4x6 inch size
-            save_image_as_pdf_with_exact_size(img, temp_pdf, 4, 6)
-            temp_pdfs.append(temp_pdf)
+            image_writer.add_page(image_to_pdf_page(img_file, f"Converting image {i + 1}", 4, 6))
+        image_writer.write(image_pdf)
+        image_pdf.seek(0)
         
         # Combine all PDFs (original + converted images)
-        all_pdfs = pdf_files + temp_pdfs
-        total_pages = combine_pdfs(all_pdfs, output_filename)
-        
-        # Clean up temporary PDFs
-        for temp_pdf in temp_pdfs:
-            try:
-                os.remove(temp_pdf)
-            except:
-                pass
-                
+        total_pages = combine_pdfs(pdf_files + [image_pdf], output)
         print(f"Combined {len(image_files)} image files and {len(pdf_files)} PDF files into {total_pages} pages")
     elif image_files:
-        total_pages = combine_pngs_to_pdf(image_files, output_filename)
+        total_pages = combine_pngs_to_pdf(image_files, output)
         print(f"Created PDF from {len(image_files)} image files with {total_pages} pages")
     elif pdf_files:
-        total_pages = combine_pdfs(pdf_files, output_filename)
+        total_pages = combine_pdfs(pdf_files, output)
         print(f"Combined {len(pdf_files)} PDF files with total {total_pages} pages")
-    else:
-        print("No image (PNG/JPG/JPEG) or PDF files found in the specified directory")
-        return total_pages
+    
+    return total_pages
+
+def build_label_pdfs(image_files, pdf_files, output, trimmed_output):
+    """Run the label pipeline, writing the combined PDF to `output` and the trimmed one to `trimmed_output`
+
+    Both outputs are binary file-like objects. Returns (total_pages, trimmed)
+    where trimmed is False if trimming was skipped.
+    """
+    combined = new_spool_buffer()
+    total_pages = combine_label_files(image_files, pdf_files, combined)
+    if not total_pages:
+        print("No image (PNG/JPG/JPEG) or PDF files found")
+        return 0, False
     
     # Print dimensions of output PDF
-    print_output_dimensions(output_filename)
+    combined.seek(0)
+    print_output_dimensions(combined)
     
     # Only resize if we processed images (not pure PDFs)
+    combined.seek(0)
     if image_files:
         # Ensure all pages are exactly 4x6 inches for images
-        temp_output = output_filename + '.resized'
-        resize_pdf_to_exact_dimensions(output_filename, temp_output, 4, 6)
-        os.replace(temp_output, output_filename)
+        resize_pdf_to_exact_dimensions(combined, output, 4, 6)
         print("\nApplied size corrections where needed")
     else:
+        shutil.copyfileobj(combined, output)
         print("\nKeeping original PDF dimensions (no images to resize)")
+    combined.close()
+    
+    # PDF uploads come first in the combined document; keep their vector
+    # content and only rasterize the pages that came from images
+    pdf_pages = range(total_pages - len(image_files)) if TRIM_MODE == 'vector' else ()
     
     # Skip trimming if poppler is not installed
+    output.seek(0)
     try:
-        # Create trimmed version
-        output_trimmed = output_filename.replace('.pdf', '_trimmed.pdf')
-        trim_pdf_margins(output_filename, output_trimmed)
-        
-        # Only resize trimmed version if we had images
         if image_files:
-            temp_trimmed = output_trimmed + '.resized'
-            resize_pdf_to_exact_dimensions(output_trimmed, temp_trimmed, 4, 6)
-            os.replace(temp_trimmed, output_trimmed)
+            # Only resize trimmed version if we had images
+            trimmed = new_spool_buffer()
+            trim_pdf_margins(output, trimmed, vector_pages=pdf_pages)
+            trimmed.seek(0)
+            resize_pdf_to_exact_dimensions(trimmed, trimmed_output, 4, 6)
+            trimmed.close()
+        else:
+            trim_pdf_margins(output, trimmed_output, vector_pages=pdf_pages)
     except Exception as e:
         print(f"Skipping PDF trimming: {e}")
         # Continue without trimming
+        return total_pages, False
+    
+    return total_pages, True
+
+def label_pipeline_params():
+    """Parameters that change the pipeline's output; part of the label cache key"""
+    return {
+        'target_width_in': 4,
+        'target_height_in': 6,
+        'dpi': 300,
+        'bbox_dpi': BBOX_DPI,
+        'trim_ratio': 66.7,
+        'trim_mode': TRIM_MODE
+    }
+
+def process_label_files(files, use_cache=True):
+    """Process uploaded label files entirely in memory
+
+    files is a list of (filename, data) pairs where data is bytes or a binary
+    file-like object. Intermediate PDFs only spill to disk once they exceed
+    SPOOL_THRESHOLD_BYTES. Returns (pdf_bytes, total_pages), preferring the
+    trimmed PDF and falling back to the untrimmed one; pdf_bytes is None if
+    no image or PDF files were given.
+
+    Trimmed results are cached by a hash of the uploads and the pipeline
+    parameters, so re-uploading the same labels skips the pipeline.
+    """
+    cache_key = None
+    if use_cache and label_cache.enabled:
+        cache_key = label_cache_key(files, label_pipeline_params())
+        cached = label_cache.get(cache_key)
+        if cached is not None:
+            print(f"Label cache hit: {cache_key[:12]}")
+            return cached, len(PdfReader(io.BytesIO(cached)).pages)
+    
+    image_files, pdf_files = split_label_files(files)
+    
+    with new_spool_buffer() as output, new_spool_buffer() as trimmed_output:
+        total_pages, trimmed = build_label_pdfs(image_files, pdf_files, output, trimmed_output)
+        if not total_pages:
+            return None, 0
+        
+        result = trimmed_output if trimmed else output
+        result.seek(0)
+        pdf_data = result.read()
+    
+    # Only cache fully trimmed output so a missing poppler isn't remembered
+    if cache_key and trimmed:
+        label_cache.put(cache_key, pdf_data)
+    return pdf_data, total_pages
+
+def process_files(input_dir, output_filename):
+    """Process every label file in a directory, writing `output_filename` and its _trimmed.pdf sibling"""
+    # Get all files in the input directory
+    files = [(f, os.path.join(input_dir, f)) for f in os.listdir(input_dir)
+             if os.path.isfile(os.path.join(input_dir, f))]
+    image_files, pdf_files = split_label_files(files)
+    
+    output_trimmed = output_filename.replace('.pdf', '_trimmed.pdf')
+    with new_spool_buffer() as output, new_spool_buffer() as trimmed_output:
+        total_pages, trimmed = build_label_pdfs(image_files, pdf_files, output, trimmed_output)
+        if not total_pages:
+            return total_pages
+        
+        output.seek(0)
+        with open(output_filename, 'wb') as f:
+            shutil.copyfileobj(output, f)
+        if trimmed:
+            trimmed_output.seek(0)
+            with open(output_trimmed, 'wb') as f:
+                shutil.copyfileobj(trimmed_output, f)
     
     return total_pages
 
@@ -0,0 +1,200 @@
+import os
+import base64
+import random
+import threading
+import time
+from collections import deque
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# (connect, read) timeouts so a slow ShipStation can't hang a worker
+SHIPSTATION_TIMEOUT = (float(os.getenv('SHIPSTATION_CONNECT_TIMEOUT', '5')),
+                       float(os.getenv('SHIPSTATION_READ_TIMEOUT', '30')))
+# ShipStation allows 40 calls per minute per API key unless told otherwise by X-Rate-Limit-Limit
+SHIPSTATION_RATE_LIMIT = int(os.getenv('SHIPSTATION_RATE_LIMIT', '40'))
+SHIPSTATION_MAX_RETRIES = int(os.getenv('SHIPSTATION_MAX_RETRIES', '2'))
+SHIPSTATION_RETRY_BACKOFF_SECONDS = float(os.getenv('SHIPSTATION_RETRY_BACKOFF_SECONDS', '1'))
+
+class TokenBucket:
+    """Token bucket for a per-window request quota
+
+    Tokens refill continuously at limit/window per second. update() feeds in
+    the server's own counters, which also covers calls made by other
+    processes sharing the API key: the bucket never holds more tokens than
+    the server says remain, and once none remain it waits for the reset.
+    """
+
+    def __init__(self, limit, window=60):
+        self.window = window
+        self.capacity = limit
+        self.tokens = float(limit)
+        self._updated = time.monotonic()
+        self._blocked_until = 0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.capacity / self.window)
+        self._updated = now
+
+    def acquire(self):
+        """Block until a request may be sent; returns the seconds spent waiting"""
+        waited = 0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self._blocked_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                wait = max(self._blocked_until - now, (1 - self.tokens) * self.window / self.capacity)
+            time.sleep(wait)
+            waited += wait
+
+    def update(self, limit=None, remaining=None, reset=None):
+        """Apply X-Rate-Limit-Limit, -Remaining and -Reset (seconds) from a response"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if limit:
+                self.capacity = limit
+            if remaining is not None:
+                self.tokens = min(self.tokens, remaining)
+                if remaining <= 0 and reset is not None:
+                    self._blocked_until = max(self._blocked_until, now + reset)
+
+    def state(self):
+        with self._lock:
+            self._refill(time.monotonic())
+            return {
+                'limit': self.capacity,
+                'tokens': round(self.tokens, 2),
+                'blocked_for': round(max(self._blocked_until - time.monotonic(), 0), 2)
+            }
+
+class ShipStationClient:
+    """Shared ShipStation API client
+
+    One keep-alive requests.Session with a connection pool, Basic auth and
+    timeouts on every call. Calls wait for the rate limiter. Throttled
+    calls (429) are retried once the quota resets. 5xx responses and
+    connection errors are retried with jittered backoff, but only for GETs
+    or calls the caller marks idempotent. Latency is recorded per endpoint.
+    """
+
+    def __init__(self, base_url, client_id, client_secret, timeout=SHIPSTATION_TIMEOUT,
+                 rate_limit=SHIPSTATION_RATE_LIMIT, max_retries=SHIPSTATION_MAX_RETRIES, pool_size=10):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.limiter = TokenBucket(rate_limit)
+
+        credentials = base64.b64encode(f"{client_id}:{client_secret}".encode('utf-8')).decode('utf-8')
+        self.session = requests.Session()
+        self.session.headers.update({
+            'Authorization': f"Basic {credentials}",
+            'Content-Type': 'application/json'
+        })
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self._stats = {}
+        self._stats_lock = threading.Lock()
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path, idempotent=False, **kwargs):
+        return self.request('POST', path, idempotent=idempotent, **kwargs)
+
+    def request(self, method, path, idempotent=None, **kwargs):
+        """Send a request and return the response, raising for error statuses
+
+        path is relative to base_url or a full URL (webhook resource URLs).
+        """
+        url = path if path.startswith(('http://', 'https://')) else f"{self.base_url}{path}"
+        endpoint = f"{method} {urlparse(url).path}"
+        if idempotent is None:
+            idempotent = method == 'GET'
+
+        for attempt in range(self.max_retries + 1):
+            waited = self.limiter.acquire()
+            began = time.perf_counter()
+            try:
+                response = self.session.request(method, url, timeout=self.timeout, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                self._record(endpoint, began, waited, None)
+                if idempotent and attempt < self.max_retries:
+                    self._backoff(attempt)
+                    continue
+                raise
+            self._record(endpoint, began, waited, response.status_code)
+            self._read_rate_limit(response)
+
+            # A throttled call was never processed, so it is safe to repeat; the
+            # limiter already holds the next call until the quota resets
+            if response.status_code == 429 and attempt < self.max_retries:
+                continue
+            if response.status_code >= 500 and idempotent and attempt < self.max_retries:
+                self._backoff(attempt)
+                continue
+            response.raise_for_status()
+            return response
+
+    def _backoff(self, attempt):
+        # Full jitter so retrying workers don't fire together
+        time.sleep(random.uniform(0, SHIPSTATION_RETRY_BACKOFF_SECONDS * 2 ** attempt))
+
+    def _read_rate_limit(self, response):
+        def header(name):
+            value = response.headers.get(name)
+            try:
+                return int(value) if value is not None else None
+            except ValueError:
+                return None
+        reset = header('X-Rate-Limit-Reset')
+        remaining = header('X-Rate-Limit-Remaining')
+        if response.status_code == 429:
+            remaining = 0
+            if reset is None:
+                # No reset given: wait out a whole window
+                reset = header('Retry-After') or self.limiter.window
+        self.limiter.update(header('X-Rate-Limit-Limit'), remaining, reset)
+
+    def _record(self, endpoint, began, waited, status_code):
+        elapsed_ms = (time.perf_counter() - began) * 1000
+        with self._stats_lock:
+            stats = self._stats.get(endpoint)
+            if stats is None:
+                stats = self._stats[endpoint] = {'calls': 0, 'errors': 0, 'throttled': 0,
+                                                 'total_ms': 0.0, 'max_ms': 0.0, 'wait_ms': 0.0,
+                                                 'recent_ms': deque(maxlen=200)}
+            stats['calls'] += 1
+            if status_code is None or status_code >= 400:
+                stats['errors'] += 1
+            if status_code == 429:
+                stats['throttled'] += 1
+            stats['total_ms'] += elapsed_ms
+            stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+            stats['wait_ms'] += waited * 1000
+            stats['recent_ms'].append(elapsed_ms)
+
+    def stats(self):
+        """Per-endpoint call counts and latency for this process, plus the limiter state"""
+        endpoints = {}
+        with self._stats_lock:
+            for endpoint, stats in self._stats.items():
+                recent = sorted(stats['recent_ms'])
+                endpoints[endpoint] = {
+                    'calls': stats['calls'],
+                    'errors': stats['errors'],
+                    'throttled': stats['throttled'],
+                    'avg_ms': round(stats['total_ms'] / stats['calls'], 1),
+                    'p50_ms': round(recent[len(recent) // 2], 1),
+                    'p95_ms': round(recent[min(int(len(recent) * 0.95), len(recent) - 1)], 1),
+                    'max_ms': round(stats['max_ms'], 1),
+                    'rate_limit_wait_ms': round(stats['wait_ms'], 1)
+                }
+        return {'endpoints': endpoints, 'rate_limit': self.limiter.state()}
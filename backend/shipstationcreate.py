@@ -1,9 +1,15 @@
 import requests
-import base64
 from datetime import datetime
 import json
 import math
 from config import SS_CLIENT_ID, SS_CLIENT_SECRET, SS_BASE_URL, SS_STORE_ID
+from shipstation_client import ShipStationClient
+
+# All ShipStation traffic from the app goes through this client
+shipstation = ShipStationClient(SS_BASE_URL, SS_CLIENT_ID, SS_CLIENT_SECRET)
+
+# createorders accepts at most 100 orders per call
+SHIPSTATION_CREATE_BATCH_SIZE = 100
 
 # Editable constant for customer note
 CUSTOMER_NOTE = "Questions? Please call Greg Booth from Gym Molly at (323) 538-2195"
@@ -28,17 +34,17 @@ SHIPPING_METHOD_MAPPING = {
     "FedEx Standard Overnight": {"code": "fedex_standard_overnight", "name": "FedEx Standard Overnight®"}
 }
 
-def get_auth_header():
-    """Generate the Authorization header for ShipStation API"""
-    credentials = f"{SS_CLIENT_ID}:{SS_CLIENT_SECRET}"
-    encoded_credentials = base64.b64encode(credentials.encode('utf-8')).decode('utf-8')
-    return f"Basic {encoded_credentials}"
+def shipstation_order_key(order_id):
+    """The orderKey ShipStation stores for a local order"""
+    return f"gymmolly-order-{order_id}"
 
-def create_shipstation_order(order, shipping_address, order_items, item_details, db):
-    """Create an order in ShipStation"""
-    
-    url = f"{SS_BASE_URL}/orders/createorder"
-    
+def build_shipstation_order(order, shipping_address, order_items, item_details):
+    """Build the createorder payload for an order
+
+    The payload carries an orderKey derived from the order ID, which makes
+    createorder idempotent: posting it again updates the same ShipStation
+    order instead of creating a duplicate.
+    """
     # Get FedEx shipping info
     fedex_shipping_info = SHIPPING_METHOD_MAPPING.get(order.shipping_method, SHIPPING_METHOD_MAPPING["FedEx Ground"])
     
@@ -67,39 +73,34 @@ def create_shipstation_order(order, shipping_address, order_items, item_details,
     dimensions = None
     item_count = 1
 
-    session = db.session()
     for order_item in order_items:
+        # item_details maps SKU to catalog items carrying product and shipping details
         item = item_details.get(order_item.product_sku)
-        shipping_detail = session.query(db.Model.metadata.tables['shipping_detail']).filter_by(sku=order_item.product_sku).first()
         
-        if item and shipping_detail:
-            # Fetch the unitsCs from the item_detail table
-            item_detail = session.query(db.Model.metadata.tables['item_detail']).filter_by(sku=order_item.product_sku).first()
-            units_cs = item_detail.unitsCs if item_detail else "N/A"
-
+        if item and item.has_shipping:
             items.append({
                 "sku": order_item.product_sku,
-                "name": f"{item.product} - {item.size} - {item.flavor} - {units_cs}",
+                "name": f"{item.product} - {item.size} - {item.flavor} - {item.unitsCs}",
                 "quantity": order_item.quantity,
                 "unitPrice": 0,  # Set appropriate price if available
                 "adjustment": False
             })
             
             # Round up dimensions
-            length = math.ceil(shipping_detail.length)
-            width = math.ceil(shipping_detail.width)
-            height = math.ceil(shipping_detail.height)
+            length = math.ceil(item.length)
+            width = math.ceil(item.width)
+            height = math.ceil(item.height)
             
             # Convert weight to pounds and ounces
-            weight_lbs = int(shipping_detail.weight)
-            weight_oz = round((shipping_detail.weight - weight_lbs) * 16)
+            weight_lbs = int(item.weight)
+            weight_oz = round((item.weight - weight_lbs) * 16)
             
             weight_str = f"{weight_lbs}lbs"
             if weight_oz > 0:
                 weight_str += f" {weight_oz}oz"
             
             # Calculate total weight
-            item_weight = shipping_detail.weight * order_item.quantity
+            item_weight = item.weight * order_item.quantity
             total_weight += item_weight
             
             # Enumerate through each item based on quantity
@@ -116,8 +117,6 @@ def create_shipstation_order(order, shipping_address, order_items, item_details,
                     "width": width,
                     "height": height
                 }
-
-    session.close()
     
     # Add the shipping method to the picking notes
     picking_notes.append(f"Shipping Method: {order.shipping_method}")
@@ -125,6 +124,7 @@ def create_shipstation_order(order, shipping_address, order_items, item_details,
     # Prepare order payload
     order_data = {
         "orderNumber": str(order.purchase_order_number),
+        "orderKey": shipstation_order_key(order.order_id),
         "orderDate": order.created_at.isoformat(),
         "orderStatus": "awaiting_shipment",
         "customerUsername": shipping_address.companyName,
@@ -166,23 +166,83 @@ def create_shipstation_order(order, shipping_address, order_items, item_details,
     print("Debug: ShipStation Order Payload:")
     print(json.dumps(order_data, indent=2))
     
-    # Set headers
-    headers = {
-        "Authorization": get_auth_header(),
-        "Content-Type": "application/json"
+    return order_data
+
+def build_shipstation_orders(orders, shipping_addresses, order_items, item_details):
+    """Build createorder payloads for many orders, keyed by order ID
+
+    shipping_addresses maps address ID to address and order_items maps
+    order ID to that order's items.
+    """
+    return {
+        order.order_id: build_shipstation_order(order, shipping_addresses[order.shipping_address_id],
+                                                order_items.get(order.order_id, []), item_details)
+        for order in orders
     }
-    
-    try:
-        response = requests.post(url, json=order_data, headers=headers)
-        response.raise_for_status()
-        
-        # Debug: Print the response from ShipStation
-        print("Debug: ShipStation API Response:")
-        print(json.dumps(response.json(), indent=2))
+
+def post_shipstation_orders(payloads, batch_size=SHIPSTATION_CREATE_BATCH_SIZE):
+    """POST createorder payloads to ShipStation's createorders in batches
+
+    payloads maps local order ID to payload. Yields (order_ids, results,
+    error) per batch: results maps each order ID to its ShipStation result
+    (orderId, success, errorMessage), matched back by orderKey; error is the
+    RequestException when the whole call failed.
+    """
+    order_ids = list(payloads)
+    for start in range(0, len(order_ids), batch_size):
+        batch = order_ids[start:start + batch_size]
+        by_key = {payloads[order_id]['orderKey']: order_id for order_id in batch}
+        try:
+            # The orderKey makes a repeated createorders update the same orders, so it's safe to retry
+            response = shipstation.post('/orders/createorders', json=[payloads[order_id] for order_id in batch],
+                                        idempotent=True)
+            data = response.json()
+        except requests.exceptions.RequestException as e:
+            print(f"Error creating ShipStation orders: {str(e)}")
+            if hasattr(e.response, 'text'):
+                print(f"Response: {e.response.text}")
+            yield batch, {}, e
+            continue
         
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        print(f"Error creating ShipStation order: {str(e)}")
-        if hasattr(e.response, 'text'):
-            print(f"Response: {e.response.text}")
-        raise
+        results = {}
+        for result in data.get('results') or []:
+            order_id = by_key.get(result.get('orderKey'))
+            if order_id is not None:
+                results[order_id] = result
+        print(f"Debug: ShipStation createorders accepted "
+              f"{sum(1 for result in results.values() if result.get('success'))} of {len(batch)} orders")
+        if data.get('hasErrors'):
+            print(json.dumps([result for result in results.values() if not result.get('success')], indent=2))
+        yield batch, results, None
+
+def fetch_shipstation_fulfillments(resource_url):
+    """Every fulfillment behind a webhook resource_url, following its pages"""
+    fulfillments = []
+    page = 1
+    while True:
+        response = shipstation.get(resource_url, params={'page': page} if page > 1 else None)
+        data = response.json()
+        fulfillments.extend(data.get('fulfillments') or [])
+        if page >= (data.get('pages') or 1):
+            return fulfillments
+        page += 1
+
+def iter_shipped_orders(modified_since, page_size=500):
+    """Yield pages of ShipStation orders marked shipped since modified_since, oldest change first"""
+    params = {
+        'orderStatus': 'shipped',
+        'modifyDateStart': modified_since.strftime('%Y-%m-%d %H:%M:%S'),
+        'sortBy': 'ModifyDate',
+        'sortDir': 'ASC',
+        'pageSize': page_size
+    }
+    if SS_STORE_ID:
+        params['storeId'] = SS_STORE_ID
+    page = 1
+    while True:
+        response = shipstation.get('/orders', params=dict(params, page=page))
+        data = response.json()
+        yield data.get('orders') or []
+        if page >= (data.get('pages') or 1):
+            return
+        page += 1
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Stress test concurrent inventory reservation
+
+Starts several processes that place orders for the same SKU against a
+throwaway SQLite database through the Flask test client, the way several
+gunicorn workers would. Afterwards it checks that no more units were
+ordered than were in stock and that the stock taken matches the units on
+orders. The legacy mode swaps in the old per-line read-modify-write,
+which oversells under this load. This is a correctness check, not a
+benchmark; neither mode is reliably faster.
+
+Usage: python stress_inventory.py [--processes 8] [--orders 40] [--stock 150] [--mode both|set|legacy]
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+
+SKU = 'GYMBCAABR30-cs'
+
+def legacy_reserve_inventory(requested):
+    """The pre-reservation create_order logic: get, check and decrement each line"""
+    import main
+    for sku, quantity in requested.items():
+        inventory = main.db.session.get(main.InventoryQuantity, sku)
+        if not inventory:
+            raise Exception(f"SKU {sku} not found in inventory")
+        if inventory.quantity < quantity:
+            raise Exception(f"Insufficient inventory for SKU {sku}")
+        inventory.quantity -= quantity
+
+def place_orders(worker, args, start, results):
+    import main
+    if args.mode_run == 'legacy':
+        main.reserve_inventory = legacy_reserve_inventory
+    client = main.app.test_client()
+
+    counts = {'created': 0, 'short': 0, 'errors': 0}
+    start.wait()
+    for n in range(args.orders):
+        payload = {
+            'purchase_order_number': f"STRESS-{worker}-{n}",
+            'shipping_address_id': 1,
+            'shipping_method': 'FedEx Ground',
+            'items': [{'product_sku': SKU, 'quantity': args.quantity}]
+        }
+        response = client.post('/api/orders', data={'data': json.dumps(payload)},
+                               content_type='multipart/form-data')
+        if response.status_code == 201:
+            counts['created'] += 1
+        elif 'nsufficient' in (response.get_json() or {}).get('error', ''):
+            counts['short'] += 1
+        else:
+            counts['errors'] += 1
+    results.put(counts)
+
+def run(args, mode):
+    temp_dir = tempfile.mkdtemp(prefix='stress_inventory_')
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(temp_dir, 'stress.db')}"
+    os.environ['UPLOAD_DIR'] = os.path.join(temp_dir, 'uploads')
+    # Orders queue ShipStation calls and confirmation emails; leave them unsent
+    os.environ['SHIPSTATION_OUTBOX_WORKER'] = 'off'
+    os.environ['EMAIL_OUTBOX_WORKER'] = 'off'
+    args.mode_run = mode
+
+    context = multiprocessing.get_context('spawn')
+    setup = context.Process(target=prepare_database, args=(args.stock,))
+    setup.start()
+    setup.join()
+
+    start = context.Event()
+    results = context.Queue()
+    workers = [context.Process(target=place_orders, args=(i, args, start, results))
+               for i in range(args.processes)]
+    for process in workers:
+        process.start()
+    # Give every worker time to import the app so they all order at once
+    time.sleep(5)
+    start.set()
+    counts = [results.get() for _ in workers]
+    for process in workers:
+        process.join()
+
+    final_stock, units_ordered = read_outcome(temp_dir)
+    shutil.rmtree(temp_dir, ignore_errors=True)
+
+    created = sum(c['created'] for c in counts)
+    return {
+        'mode': mode,
+        'created': created,
+        'short': sum(c['short'] for c in counts),
+        'errors': sum(c['errors'] for c in counts),
+        'final_stock': final_stock,
+        'units_ordered': units_ordered,
+        'oversold': max(units_ordered - args.stock, 0),
+        'miscounted': args.stock - final_stock != units_ordered
+    }
+
+def prepare_database(stock):
+    import main
+    import init_db
+    with main.app.app_context():
+        main.db.drop_all()
+        main.init_database()
+        init_db.add_sample_data()
+        main.db.session.get(main.InventoryQuantity, SKU).quantity = stock
+        main.db.session.commit()
+
+def read_outcome(temp_dir):
+    import sqlite3
+    conn = sqlite3.connect(os.path.join(temp_dir, 'stress.db'))
+    final_stock = conn.execute("SELECT quantity FROM inventory_quantity WHERE sku = ?", (SKU,)).fetchone()[0]
+    units_ordered = conn.execute("""
+        SELECT COALESCE(SUM(oi.quantity), 0) FROM order_items oi
+        JOIN orders o ON o.order_id = oi.order_id
+        WHERE o.purchase_order_number LIKE 'STRESS-%' AND oi.product_sku = ?
+    """, (SKU,)).fetchone()[0]
+    conn.close()
+    return final_stock, units_ordered
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--processes', type=int, default=8)
+    parser.add_argument('--orders', type=int, default=40, help='orders per process')
+    parser.add_argument('--quantity', type=int, default=1, help='cases per order')
+    parser.add_argument('--stock', type=int, default=150)
+    parser.add_argument('--mode', choices=['both', 'set', 'legacy'], default='both')
+    args = parser.parse_args()
+
+    modes = ['legacy', 'set'] if args.mode == 'both' else [args.mode]
+    outcomes = [run(args, mode) for mode in modes]
+
+    print(f"\nInventory stress: {args.processes} processes x {args.orders} orders of "
+          f"{args.quantity} against {args.stock} in stock")
+    print(f"{'mode':>8} {'created':>8} {'short':>6} {'errors':>7} {'stock':>6} {'ordered':>8}  result")
+    for o in outcomes:
+        problems = []
+        if o['oversold']:
+            problems.append(f"OVERSOLD by {o['oversold']} units")
+        if o['miscounted']:
+            problems.append(f"stock fell by {args.stock - o['final_stock']} for {o['units_ordered']} units ordered")
+        print(f"{o['mode']:>8} {o['created']:>8} {o['short']:>6} {o['errors']:>7} {o['final_stock']:>6} "
+              f"{o['units_ordered']:>8}  {', '.join(problems) or 'ok'}")
+
+    if any(o['oversold'] or o['miscounted'] for o in outcomes if o['mode'] == 'set'):
+        raise SystemExit("Set-based reservation oversold stock")
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,7 @@ import React, { useState, useEffect } from 'react';
 import { useNavigate } from 'react-router-dom';
 import { FaArrowLeft, FaTrash } from 'react-icons/fa';
 import './DeleteOrders.css';
+import { fetchOrders as fetchAllOrders } from '../fetchOrders';
 
 const API_URL = process.env.REACT_APP_API_URL || 'http://localhost:5001';
 
@@ -19,19 +20,7 @@ function DeleteOrders({ onOrderDeleted }) {
 
   const fetchOrders = async () => {
     try {
-      const response = await fetch(`${API_URL}/api/orders`, {
-        credentials: 'include',
-        headers: {
-          'Accept': 'application/json',
-          'Content-Type': 'application/json'
-        }
-      });
-
-      if (!response.ok) {
-        throw new Error('Failed to fetch orders');
-      }
-
-      const data = await response.json();
+      const data = await fetchAllOrders();
       // Sort by date, newest first
       const sortedOrders = data.sort((a, b) => new Date(b.created_at) - new Date(a.created_at));
       setOrders(sortedOrders);
@@ -46,7 +35,7 @@ function DeleteOrders({ onOrderDeleted }) {
   const handleDeleteOrder = async (orderId, poNumber) => {
     // First, find the order to check its status
     const order = orders.find(o => o.order_id === orderId);
-    const isShipped = order && (order.order_status === 'Shipped' || order.order_status.startsWith('SHIPPED'));
+    const isShipped = order && order.status === 'Shipped';
     
     // First password prompt
     const password = prompt("Please enter the admin password to DELETE this order:");
@@ -112,7 +101,7 @@ function DeleteOrders({ onOrderDeleted }) {
   const filteredOrders = orders.filter(order => {
     const matchesSearch = order.purchase_order_number.toLowerCase().includes(searchTerm.toLowerCase()) ||
                          order.shipping_address.companyName.toLowerCase().includes(searchTerm.toLowerCase());
-    const matchesStatus = filterStatus === 'all' || order.order_status === filterStatus;
+    const matchesStatus = filterStatus === 'all' || order.status === filterStatus;
     return matchesSearch && matchesStatus;
   });
 
@@ -173,7 +162,7 @@ function DeleteOrders({ onOrderDeleted }) {
           </div>
         ) : (
           filteredOrders.map(order => {
-            const canDelete = order.order_status === 'Voided' || order.order_status === 'Shipped' || order.order_status.startsWith('SHIPPED');
+            const canDelete = order.status === 'Voided' || order.status === 'Shipped';
             const totalItems = order.items.reduce((sum, item) => sum + item.quantity, 0);
             
             return (
@@ -208,7 +197,7 @@ function DeleteOrders({ onOrderDeleted }) {
                     </button>
                   ) : (
                     <span className="cannot-delete-message">
-                      {order.order_status === 'Processing' ? 'Must void first' : 'Locked'}
+                      {order.status === 'Processing' ? 'Must void first' : 'Locked'}
                     </span>
                   )}
                 </div>
@@ -5,6 +5,7 @@ import { Modal, Button, Form, Alert, Spinner } from 'react-bootstrap';
 import { FaArrowLeft, FaTruck, FaBan } from 'react-icons/fa';
 import 'react-datasheet/lib/react-datasheet.css';
 import './ManageOrderStatus.css';
+import { fetchOrders as fetchAllOrders } from '../fetchOrders';
 
 const API_URL = process.env.REACT_APP_API_URL || 'http://localhost:5001';
 
@@ -36,18 +37,7 @@ function ManageOrderStatus({ onInventoryUpdate }) {
 
   const fetchOrders = async () => {
     try {
-      const response = await fetch(`${API_URL}/api/orders`, {
-        credentials: 'include',
-        headers: {
-          'Content-Type': 'application/json',
-        }
-      });
-
-      if (!response.ok) {
-        throw new Error('Failed to fetch orders');
-      }
-
-      const orders = await response.json();
+      const orders = await fetchAllOrders({ status: 'Processing' });
       
       // Filter only Processing orders and convert to datasheet format
       const sheetData = [headers];
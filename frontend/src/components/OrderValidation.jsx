@@ -1,15 +1,26 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { useNavigate } from 'react-router-dom';
 import './OrderValidation.css';
+import { fetchOrders } from '../fetchOrders';
 
 const API_URL = process.env.REACT_APP_API_URL || 'http://localhost:5001';
 
+// Same comparison as the backend: trimmed, single-spaced, case-insensitive
+const normalizePO = (po) => po.trim().split(/\s+/).join(' ').toLowerCase();
+
 function OrderValidation({ orderData, isSubmitting, onOrderSuccess }) {
   const navigate = useNavigate();
   const [existingPOs, setExistingPOs] = useState([]);
   const [isLoading, setIsLoading] = useState(true);
   const [error, setError] = useState(null);
   const [orderSubmitted, setOrderSubmitted] = useState(false);
+  // One key per order: a double click or a retry after a dropped response
+  // gets the original order back instead of creating a second one
+  const idempotencyKey = useRef(
+    window.crypto && window.crypto.randomUUID
+      ? window.crypto.randomUUID()
+      : `${Date.now()}-${Math.random().toString(36).slice(2)}`
+  );
 
   // Fetch existing POs when component mounts
   useEffect(() => {
@@ -18,26 +29,16 @@ function OrderValidation({ orderData, isSubmitting, onOrderSuccess }) {
 
   const fetchExistingPOs = async () => {
     try {
-      const response = await fetch(`${API_URL}/api/orders`, {
-        credentials: 'include',
-        headers: {
-          'Accept': 'application/json',
-          'Content-Type': 'application/json'
-        }
-      });
-      if (!response.ok) {
-        const errorText = await response.text();
-        console.error('Failed to fetch orders:', response.status, errorText);
-        throw new Error(`Failed to fetch existing orders: ${response.status}`);
-      }
-      const orders = await response.json();
+      // Only orders whose PO starts with this one can collide
+      const orders = await fetchOrders({ po: orderData.po });
       console.log('Fetched orders:', orders);
       
       // Handle empty orders or different response structure
       if (Array.isArray(orders)) {
+        // A voided order's PO can be used again
         const pos = orders
-          .filter(order => order.purchase_order_number)
-          .map(order => order.purchase_order_number.toLowerCase());
+          .filter(order => order.purchase_order_number && order.status !== 'Voided')
+          .map(order => normalizePO(order.purchase_order_number));
         setExistingPOs(pos);
       } else {
         console.warn('Unexpected orders response format:', orders);
@@ -59,7 +60,7 @@ function OrderValidation({ orderData, isSubmitting, onOrderSuccess }) {
     document.body.classList.add('loading-cursor');
     
     // Check if PO already exists (case-insensitive)
-    if (existingPOs.includes(orderData.po.toLowerCase())) {
+    if (existingPOs.includes(normalizePO(orderData.po))) {
       alert('This PO number has already been used. Please use a unique PO number.');
       document.body.classList.remove('loading-cursor');
       return;
@@ -87,7 +88,7 @@ function OrderValidation({ orderData, isSubmitting, onOrderSuccess }) {
         labelFormData.append('files', file);
       });
 
-      const labelResponse = await fetch(`${API_URL}/api/process-labels`, {
+      const labelResponse = await fetch(`${API_URL}/api/process-labels?format=pdf`, {
         method: 'POST',
         body: labelFormData,
         credentials: 'include'
@@ -98,7 +99,9 @@ function OrderValidation({ orderData, isSubmitting, onOrderSuccess }) {
         throw new Error(errorData.error || 'Failed to process shipping labels');
       }
 
-      await labelResponse.json();
+      // The processed PDF comes back as the body; the backend also keeps it under
+      // this token so the order doesn't have to process the labels again
+      const labelToken = labelResponse.headers.get('X-Label-Token');
 
       // Create the order data object with processed labels
       const productsToOrder = orderData.products
@@ -118,8 +121,11 @@ function OrderValidation({ orderData, isSubmitting, onOrderSuccess }) {
       // Submit the order with processed labels
       const formData = new FormData();
       formData.append('data', JSON.stringify(orderPayload));
+      if (labelToken) {
+        formData.append('label_token', labelToken);
+      }
       
-      // Append the original files directly instead of the processed ones
+      // Append the original files too; they are reprocessed if the token has expired
       orderData.attachment.forEach((file, index) => {
         formData.append('attachment', file);
       });
@@ -127,6 +133,7 @@ function OrderValidation({ orderData, isSubmitting, onOrderSuccess }) {
       const response = await fetch(`${API_URL}/api/orders`, {
         method: 'POST',
         credentials: 'include',
+        headers: { 'Idempotency-Key': idempotencyKey.current },
         body: formData
       });
 
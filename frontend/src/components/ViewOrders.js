@@ -1,5 +1,6 @@
 import React, { useState, useEffect } from 'react';
 import './ViewOrders.css';
+import { fetchOrders as fetchAllOrders } from '../fetchOrders';
 import { useNavigate } from 'react-router-dom';
 import { FaArrowLeft, FaFileExport, FaCalculator, FaCog } from 'react-icons/fa';
 
@@ -20,18 +21,7 @@ function ViewOrders({ onInventoryUpdate }) {
 
   const fetchOrders = async () => {
     try {
-      const response = await fetch(`${API_URL}/api/orders`, {
-        credentials: 'include',
-        headers: {
-          'Accept': 'application/json',
-          'Content-Type': 'application/json'
-        }
-      });
-      if (!response.ok) {
-        const errorData = await response.text();
-        throw new Error(`Failed to fetch orders: ${response.status} ${response.statusText}. ${errorData}`);
-      }
-      const data = await response.json();
+      const data = await fetchAllOrders();
       const sortedOrders = data.sort((a, b) => new Date(b.created_at) - new Date(a.created_at));
       setOrders(sortedOrders);
     } catch (error) {
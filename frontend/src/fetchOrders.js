@@ -0,0 +1,31 @@
+const API_URL = process.env.REACT_APP_API_URL || 'http://localhost:5001';
+
+// GET /api/orders is paginated; follow X-Next-Cursor until every matching order is loaded.
+// filters are passed through as query parameters (status, created_from, created_to, po, shipping_address_id).
+export async function fetchOrders(filters = {}) {
+  const orders = [];
+  let cursor = null;
+
+  do {
+    const params = new URLSearchParams({ limit: '500', ...filters });
+    if (cursor) {
+      params.set('cursor', cursor);
+    }
+
+    const response = await fetch(`${API_URL}/api/orders?${params}`, {
+      credentials: 'include',
+      headers: {
+        'Accept': 'application/json'
+      }
+    });
+    if (!response.ok) {
+      const errorText = await response.text();
+      throw new Error(`Failed to fetch orders: ${response.status} ${response.statusText}. ${errorText}`);
+    }
+
+    orders.push(...(await response.json()));
+    cursor = response.headers.get('X-Next-Cursor');
+  } while (cursor);
+
+  return orders;
+}